@@ -0,0 +1,168 @@
+"""
+Token and API-call Accounting for Grovio
+
+Every LLM call is reported here by `metrics.record_llm_call` (which
+`utils.embed` and the pipeline already call). Calls are attributed to:
+
+- the `Usage` accumulator of the current request, set with `track()` and
+  carried by a context variable, so concurrent requests in different threads
+  or tasks are kept apart; and
+- process-wide hourly totals, which `budget_exceeded` compares with the
+  `budget_calls_per_hour` / `budget_tokens_per_hour` config keys.
+
+Hourly totals live in memory, so a restart starts the current hour from zero.
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("grovio_usage", default=None)
+
+
+class Usage:
+    """Calls per stage and token counts for one request."""
+
+    def __init__(self):
+        self.calls = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.embedding_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, kind, stage, usage):
+        with self._lock:
+            key = stage or kind
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if usage is None:
+                return
+            if kind == "embedding":
+                self.embedding_tokens += getattr(usage, "total_tokens", 0) or 0
+            else:
+                self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens + self.embedding_tokens
+
+    def to_dict(self):
+        return {
+            "calls": dict(self.calls),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "embedding_tokens": self.embedding_tokens,
+        }
+
+
+class HourlyTotals:
+    """Calls and tokens in the current clock hour, across all requests in this process."""
+
+    def __init__(self):
+        self.hour = None
+        self.calls = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        hour = int(time.time() // 3600)
+        if hour != self.hour:
+            self.hour, self.calls, self.tokens = hour, 0, 0
+
+    def add(self, calls, tokens):
+        with self._lock:
+            self._roll()
+            self.calls += calls
+            self.tokens += tokens
+
+    def totals(self):
+        with self._lock:
+            self._roll()
+            return self.calls, self.tokens
+
+
+hourly = HourlyTotals()
+
+
+@contextmanager
+def track():
+    """
+    Collect the usage of every LLM call made inside the block.
+
+    Worker threads started inside the block only see the accumulator if they
+    run in a copy of the current context (`contextvars.copy_context().run`).
+
+    Yields:
+        Usage: The accumulator for this request
+    """
+    usage = Usage()
+    token = _current.set(usage)
+    try:
+        yield usage
+    finally:
+        _current.reset(token)
+
+
+def map_in_context(pool, fn, items):
+    """
+    `pool.map` that runs each task in a copy of the caller's context, so calls
+    made by worker threads are attributed to the caller's `track()` block.
+
+    Returns:
+        list: Results in input order
+    """
+    futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def current():
+    """The accumulator of the enclosing `track()` block, or None."""
+    return _current.get()
+
+
+def note_call(kind, stage, usage):
+    """
+    Attribute one LLM call to the current request and the hourly totals.
+
+    Args:
+        kind (str): "chat", "embedding" or "moderation"
+        stage (str): Pipeline stage the call was made in ("" if none)
+        usage: The response's `usage` object, if any
+    """
+    accumulator = _current.get()
+    if accumulator is not None:
+        accumulator.add(kind, stage, usage)
+    tokens = 0
+    if usage is not None:
+        if kind == "embedding":
+            tokens = getattr(usage, "total_tokens", 0) or 0
+        else:
+            tokens = (getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0)
+    hourly.add(1, tokens)
+
+
+def budget_exceeded(cfg):
+    """
+    Check the hourly budgets.
+
+    Args:
+        cfg (dict): Configuration with optional `budget_calls_per_hour` and
+            `budget_tokens_per_hour` (0 or missing means unlimited)
+
+    Returns:
+        str: "calls" or "tokens" naming the exhausted budget, or None
+    """
+    calls, tokens = hourly.totals()
+    call_budget = cfg.get("budget_calls_per_hour", 0) or 0
+    token_budget = cfg.get("budget_tokens_per_hour", 0) or 0
+    if call_budget and calls >= call_budget:
+        return "calls"
+    if token_budget and tokens >= token_budget:
+        return "tokens"
+    return None
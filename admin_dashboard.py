@@ -1,10 +1,22 @@
 import streamlit as st
 import yaml
+import bisect
+import heapq
 import json
+import threading
 import time
+import urllib.request
+import pandas as pd
 from pathlib import Path
 from datetime import datetime, timezone
 
+import analytics
+import jobs
+import log_archive
+import metrics
+import outbox
+import storage
+
 # Import policy generator module
 try:
     import policy_generator
@@ -13,6 +25,12 @@ except ImportError:
 
 CONFIG_PATH = "config.yaml"
 LOG_PATH = "store.jsonl"
+DISCORD_MESSAGES_PATH = "discord_messages.jsonl"
+DEFAULT_METRICS_PORT = 9108
+TREND_WINDOWS = {"Last 48 hours": ("hour", 48), "Last 14 days": ("day", 14), "Last 90 days": ("day", 90)}
+POLICY_JOB_KIND = "policy_generation"
+JOB_POLL_SECONDS = 2
+RECENT_ACTIVITY_LIMIT = 100   # Messages shown in the activity panel
 
 # ---------- Helpers ---------------------------------------------------------
 
@@ -80,46 +98,196 @@ def reset_data() -> None:
     discord_path = "discord_messages.jsonl"
     if Path(discord_path).exists():
         Path(discord_path).write_text("")
+    
+    # Drop rotated segments of both logs
+    for path in (LOG_PATH, discord_path):
+        log_archive.clear_archive(path)
         
     return True
 
 
+class PendingDraftIndex:
+    """Pending Discord drafts sorted by ts, updated from lines appended to the message log.
+    
+    Drafts in rotated archive segments are loaded only from segments whose
+    index reports pending drafts, and only again when the archive index changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader = storage.IncrementalJsonlReader(path)
+        self._entries = {}   # key -> dashboard entry
+        self._order = []     # sorted (ts, key) pairs
+        self._seen = set()   # keys present in the active log (they shadow archived records)
+        self._archived = []  # sorted (ts, key, entry) for pending drafts in archive segments
+        self._archive_version = None
+        self._lock = threading.Lock()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            pos = bisect.bisect_left(self._order, (entry["ts"], key))
+            if pos < len(self._order) and self._order[pos] == (entry["ts"], key):
+                del self._order[pos]
+
+    @staticmethod
+    def _entry(msg: dict) -> dict:
+        # Convert Discord message to format compatible with regular logs
+        return {
+            "ts": msg.get("ts", 0),
+            "user": f"[Discord] {msg.get('author', 'Unknown')}",
+            "author": msg.get("author", "Unknown"),
+            "content": msg.get("content", ""),
+            "reply": msg.get("reply", ""),
+            "risk": msg.get("risk", 0.0),
+            "conf": msg.get("conf", 0.0),
+            "is_discord": True,
+            "message_id": msg.get("message_id", ""),
+            "responded": msg.get("responded", False),
+            "flagged_input": msg.get("flagged_input"),
+            "delivery_error": msg.get("delivery_error"),
+        }
+
+    def _apply(self, offset: int, msg: dict) -> None:
+        key = msg.get("message_id") or f"@{offset}"
+        self._remove(key)
+        self._seen.add(key)
+        # Skip messages that have already been responded to, approved (queued in the outbox) or dismissed
+        if msg.get("responded", False) or msg.get("approved", False) or msg.get("dismissed", False):
+            return
+        entry = self._entry(msg)
+        self._entries[key] = entry
+        bisect.insort(self._order, (entry["ts"], key))
+
+    def _load_archived(self) -> None:
+        latest = {}
+        for msg in log_archive.iter_pending_archived(self.path):
+            if msg.get("message_id"):
+                latest[msg["message_id"]] = msg
+        self._archived = sorted(
+            (msg.get("ts", 0), key, self._entry(msg))
+            for key, msg in latest.items() if log_archive.is_pending(msg)
+        )
+
+    def refresh(self) -> list[dict]:
+        """Fold newly appended lines into the index and return pending drafts newest-first."""
+        with self._lock:
+            records, reset = self.reader.read_new()
+            if reset:
+                self._entries.clear()
+                self._order.clear()
+                self._seen.clear()
+            for offset, msg in records:
+                self._apply(offset, msg)
+            # Checked after reading: rotation writes the archive index before replacing the active log
+            version = log_archive.index_version(self.path)
+            if version != self._archive_version:
+                self._archive_version = version
+                self._load_archived()
+            active = ((ts, key, self._entries[key]) for ts, key in reversed(self._order))
+            archived = ((ts, key, entry) for ts, key, entry in reversed(self._archived) if key not in self._seen)
+            return [entry for _, _, entry in heapq.merge(active, archived, key=lambda t: t[0], reverse=True)]
+
+
+@st.cache_resource
+def get_draft_index() -> PendingDraftIndex:
+    """One index per server process, shared across reruns and sessions."""
+    return PendingDraftIndex(DISCORD_MESSAGES_PATH)
+
+
+@st.cache_resource
+def get_job_runner() -> jobs.JobRunner:
+    """One background job runner per server process."""
+    return jobs.JobRunner()
+
+
+def poll_fragment(func):
+    """Rerun `func` on its own every JOB_POLL_SECONDS when this Streamlit has fragments."""
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    return fragment(run_every=JOB_POLL_SECONDS)(func) if fragment else func
+
+
+@poll_fragment
+def show_policy_job() -> None:
+    """Status of this session's policy generation job, or of one started elsewhere that is still running."""
+    runner = get_job_runner()
+    job_id = st.session_state.get("policy_job_id")
+    job = runner.get(job_id) if job_id else None
+    if job is None:
+        job = runner.latest(POLICY_JOB_KIND)
+        if job is None or job["status"] not in jobs.ACTIVE_STATUSES:
+            return
+        st.session_state["policy_job_id"] = job["id"]
+    
+    if job["status"] in jobs.ACTIVE_STATUSES:
+        st.progress(job["progress"])
+        st.caption(f"⏳ {job['message']} (started {format_ts(job['created'])})")
+        if not hasattr(st, "fragment") and st.button("🔄 Refresh status"):
+            st.rerun()
+    elif job["status"] == "failed":
+        st.error(f"❌ Policy generation failed: {job.get('error')}")
+    else:
+        count = len((job.get("result") or {}).get("suggestions", []))
+        if not count:
+            st.info("No significant policy suggestions found from recent conversations.")
+        elif st.session_state.get("policy_job_shown") != job["id"]:
+            # Rerun the whole page once so the new suggestions are listed
+            st.session_state["policy_job_shown"] = job["id"]
+            st.rerun()
+        else:
+            st.success(f"✅ Generated {count} policy suggestions!")
+
+
 def load_logs() -> list[dict]:
     """Return list of logged exchanges sorted newest‒first.
-    Shows only Discord messages for editing, filtering out duplicates."""
-    
-    combined_entries = []
+    Shows only Discord messages for editing, filtering out duplicates.
     
-    # Load Discord messages if they exist
-    discord_path = "discord_messages.jsonl"
-    if Path(discord_path).exists():
-        with open(discord_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    msg = json.loads(line)
-                    # Skip messages that have already been responded to
-                    if msg.get("responded", False):
-                        continue
-                        
-                    # Convert Discord message to format compatible with regular logs
-                    combined_entries.append({
-                        "ts": msg.get("ts", 0),
-                        "user": f"[Discord] {msg.get('author', 'Unknown')}",
-                        "content": msg.get("content", ""),
-                        "reply": msg.get("reply", ""),
-                        "risk": msg.get("risk", 0.0),
-                        "conf": msg.get("conf", 0.0),
-                        "is_discord": True,
-                        "message_id": msg.get("message_id", ""),
-                        "responded": msg.get("responded", False)
-                    })
-                except Exception as e:
-                    print(f"Error parsing Discord message: {e}")
+    Only lines appended since the previous rerun are parsed; the index is
+    rebuilt when the file is truncated or rewritten."""
     
     # Only display Discord messages in the admin dashboard
     # This avoids the duplicate display issue entirely
-    
-    return sorted(combined_entries, key=lambda x: x.get("ts", 0), reverse=True)
+    return get_draft_index().refresh()
+
+
+def load_recent_activity(limit: int = RECENT_ACTIVITY_LIMIT) -> list[dict]:
+    """Return the newest `limit` Discord messages, whatever their status.
+
+    The message log is read backwards and reading stops once `limit` messages
+    are found, so the cost does not grow with the size of the log or archive."""
+    seen = set()
+    recent = []
+    for msg in log_archive.iter_log_reverse(DISCORD_MESSAGES_PATH):
+        key = msg.get("message_id")
+        if key in seen:
+            continue
+        if key:
+            seen.add(key)
+        recent.append(msg)
+        if len(recent) >= limit:
+            break
+    return recent
+
+
+def activity_status(msg: dict) -> str:
+    """Short status of a logged Discord message for the activity panel."""
+    if msg.get("responded"):
+        return "sent"
+    if msg.get("dismissed"):
+        return "dismissed"
+    if msg.get("delivery_error"):
+        return "failed"
+    if msg.get("approved"):
+        return "queued"
+    return "draft"
+
+
+def load_metrics(port: int) -> list[tuple] | None:
+    """Scrape the bot's local metrics endpoint; None if the bot isn't serving it."""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1) as resp:
+            return metrics.parse_exposition(resp.read().decode("utf-8"))
+    except Exception:
+        return None
 
 
 def format_ts(ts: float) -> str:
@@ -162,142 +330,215 @@ if st.sidebar.button("💾 Save settings"):
     st.sidebar.success("Settings saved!  ✓")
 
 # Create tabs for different sections
-tab1, tab2, tab3 = st.tabs(["📨 Messages", "⚙️ Settings", "📋 Policy Suggestions"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["📨 Messages", "⚙️ Settings", "📋 Policy Suggestions", "📈 Metrics", "📤 Outbox"])
 
 # Messages Tab
 with tab1:
     st.title("📨 Draft Queue & Activity Log")
 
-# Load & split logs
-actions = load_logs()
-drafts = [a for a in actions if not a.get("active", False)]
-sent   = [a for a in actions if a.get("active", False)]
+# Load pending drafts
+drafts = load_logs()
 
 col1, col2 = st.columns(2)
 
 # Draft review panel ---------------------------------------------------------
+DRAFT_PAGE_SIZES = [10, 25, 50]
+
+
+def filter_drafts(items: list[dict], risk_range, conf_range, authors, max_age_hours) -> list[dict]:
+    """Apply the draft queue filters (risk/conf range, author, age)."""
+    now = time.time()
+    return [
+        item for item in items
+        if risk_range[0] <= item.get("risk", 0.0) <= risk_range[1]
+        and conf_range[0] <= item.get("conf", 0.0) <= conf_range[1]
+        and (not authors or item.get("author") in authors)
+        and (not max_age_hours or now - item.get("ts", 0) <= max_age_hours * 3600)
+    ]
+
+
+def import_discord_bot():
+    import discord_bot
+    return discord_bot
+
+
 with col1:
     st.subheader(f"Pending Drafts ({len(drafts)})") 
     if not drafts:
         st.info("No drafts waiting for review.")
-    for idx, item in enumerate(drafts):
-        # Handle different types of drafts (regular AI responses vs Discord messages)
-        is_discord = item.get('is_discord', False)
+    else:
+        # Thresholds are the same for every draft on the page
+        min_confidence = cfg.get("min_confidence", 0.85)
+        max_risk = cfg.get("max_risk", 0.20)
+        active_mode = cfg.get("mode", "passive") == "active"
         
-        if is_discord:
+        with st.expander("Filters"):
+            risk_range = st.slider("Risk range", 0.0, 1.0, (0.0, 1.0), 0.01, key="filter_risk")
+            conf_range = st.slider("Confidence range", 0.0, 1.0, (0.0, 1.0), 0.01, key="filter_conf")
+            author_options = sorted({d.get("author", "Unknown") for d in drafts})
+            authors = st.multiselect("Authors", author_options, key="filter_authors")
+            max_age_hours = st.number_input("Max age (hours, 0 = any)", min_value=0, value=0, step=1, key="filter_age")
+        filtered = filter_drafts(drafts, risk_range, conf_range, authors, max_age_hours)
+        
+        col_size, col_page = st.columns(2)
+        with col_size:
+            page_size = st.selectbox("Per page", DRAFT_PAGE_SIZES, key="draft_page_size")
+        page_count = max(1, (len(filtered) + page_size - 1) // page_size)
+        with col_page:
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1, key="draft_page")
+        page_items = filtered[(page - 1) * page_size:page * page_size]
+        st.caption(f"Showing {len(page_items)} of {len(filtered)} matching drafts")
+        
+        # Bulk actions -------------------------------------------------------
+        select_all = st.checkbox("Select all on this page", key=f"select_all_{page}")
+        selected = []
+        
+        for idx, item in enumerate(page_items, start=(page - 1) * page_size):
+            message_id = item.get('message_id', '')
+            key_id = message_id or f"{idx}"
+            
+            if not item.get('is_discord', False):
+                # Regular AI-generated draft
+                with st.expander(f"Draft #{idx+1} · {format_ts(item['ts'])}"):
+                    st.markdown(f"**User:** {item['user']}")
+                    st.markdown(f"**Proposed reply:** {item['reply']}")
+                    st.caption(f"Confidence: {item['conf']:.2f} | Risk: {item['risk']:.2f}")
+                    if st.button("✅ Send", key=f"send_{key_id}"):
+                        # Placeholder – integrate with your send‑to‑channel fn
+                        st.success("Sent (simulated).")
+                continue
+            
+            checked = st.checkbox(f"Select #{idx+1} · {item.get('author', 'Unknown')} · {item.get('content', '')[:40]}",
+                                  key=f"select_{key_id}", disabled=select_all)
+            if select_all or checked:
+                selected.append(item)
+            
             # Discord message that needs a response
             with st.expander(f"Discord Message #{idx+1} · {format_ts(item['ts'])}"):
-                # Extract message content from user field if needed
-                user_text = item['user']
-                content = item.get('content', '')
-                
-                # If content is empty but user field has Discord format, extract content from there
-                if not content and '[Discord]' in user_text:
-                    try:
-                        # Format is typically "[Discord] Username: Content"
-                        content = user_text.split(':', 1)[1].strip()
-                        author = user_text.split(':', 1)[0].strip()
-                        st.markdown(f"**From Discord:** {author}")
-                        st.markdown(f"**Message:** {content}")
-                    except:
-                        # If splitting fails, just show the user field
-                        st.markdown(f"**From Discord:** {user_text}")
-                else:
-                    # Normal case with separate content field
-                    st.markdown(f"**From Discord:** {user_text}")
-                    if content:
-                        st.markdown(f"**Message:** {content}")
+                st.markdown(f"**From Discord:** {item['user']}")
+                if item.get('content'):
+                    st.markdown(f"**Message:** {item['content']}")
                 
-                # Display LLM-generated reply (if available) and allow editing
-                ai_reply = item.get('reply', '')
-                
-                # Determine if this message didn't meet thresholds despite active mode
-                cfg = load_config()
-                min_confidence = cfg.get("min_confidence", 0.85)
-                max_risk = cfg.get("max_risk", 0.20)
+                # Highlight messages that didn't meet thresholds in active mode
                 confidence = item.get("conf", 0.0)
                 risk = item.get("risk", 0.0)
-                
-                # Highlight messages that didn't meet thresholds in active mode
-                active_mode = cfg.get("mode", "passive") == "active"
                 thresholds_met = (confidence >= min_confidence and risk <= max_risk)
-                
-                if active_mode and not thresholds_met:
+                if item.get("flagged_input"):
+                    categories = ", ".join(item["flagged_input"].get("categories", [])) or "unspecified"
+                    st.error(f"🚩 The message was flagged by input moderation ({categories}); no reply was generated.")
+                elif item.get("delivery_error"):
+                    st.error(f"📤 The approved reply could not be delivered ({item['delivery_error']}). "
+                             "Approve it again to retry.")
+                elif active_mode and not thresholds_met:
                     st.warning(f"⚠️ This message requires review despite active mode because it didn't meet thresholds:\n" +
                                f"Confidence: {confidence:.2f} (minimum: {min_confidence})\n" +
                                f"Risk: {risk:.2f} (maximum: {max_risk})")
-                    
-                discord_reply = st.text_area("AI Response (Edit if needed):", value=ai_reply, key=f"discord_reply_{idx}")
-        
-                # Display risk and confidence scores if available
-                if 'risk' in item and 'conf' in item:
-                    risk_color = "red" if item['risk'] > 0.2 else "orange" if item['risk'] > 0.1 else "green"
-                    conf_color = "red" if item['conf'] < 0.7 else "orange" if item['conf'] < 0.85 else "green"
-                    st.markdown(f"**Risk:** <span style='color:{risk_color}'>{item['risk']:.2f}</span> | **Confidence:** <span style='color:{conf_color}'>{item['conf']:.2f}</span>", unsafe_allow_html=True)
+                
+                # Display LLM-generated reply (if available) and allow editing
+                discord_reply = st.text_area("AI Response (Edit if needed):", value=item.get('reply', ''), key=f"discord_reply_{key_id}")
+                
+                risk_color = "red" if risk > 0.2 else "orange" if risk > 0.1 else "green"
+                conf_color = "red" if confidence < 0.7 else "orange" if confidence < 0.85 else "green"
+                st.markdown(f"**Risk:** <span style='color:{risk_color}'>{risk:.2f}</span> | **Confidence:** <span style='color:{conf_color}'>{confidence:.2f}</span>", unsafe_allow_html=True)
                 
                 col_a, col_b = st.columns(2)
                 with col_a:
-                    if st.button("✅ Send to Discord", key=f"send_discord_{idx}"):
-                        if discord_reply.strip():
-                            # Get the message ID for this Discord message
-                            message_id = item.get('message_id', '')
-                            if message_id:
-                                # Call the discord_bot's respond_to_message function directly
-                                try:
-                                    import discord_bot
-                                    success = discord_bot.respond_to_message(message_id, discord_reply)
-                                    if success:
-                                        st.success(f"Reply saved and will be sent to Discord when bot is running!")
-                                        # Mark as responded
-                                        drafts.remove(item)
-                                        st.rerun()
-                                    else:
-                                        st.warning("Reply saved to database, but Discord bot is not running to send it immediately.")
-                                        # Still mark as responded in the drafts so it disappears from queue
-                                        drafts.remove(item)
-                                        st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error sending to Discord: {e}")
-                            else:
-                                st.error("No message ID found for this Discord message")
-                        else:
+                    if st.button("✅ Send to Discord", key=f"send_discord_{key_id}"):
+                        if not discord_reply.strip():
                             st.error("Please enter a reply first")
+                        elif not message_id:
+                            st.error("No message ID found for this Discord message")
+                        else:
+                            try:
+                                if import_discord_bot().respond_to_message(message_id, discord_reply):
+                                    st.success(f"Reply saved and will be sent to Discord when bot is running!")
+                                    st.rerun()
+                                else:
+                                    st.error("Failed to save the reply.")
+                            except Exception as e:
+                                st.error(f"Error sending to Discord: {e}")
                 with col_b:
-                    if st.button("🗑️ Delete", key=f"del_discord_{idx}"):
-                        drafts.remove(item)
-                        st.rerun()
-        else:
-            # Regular AI-generated draft
-            with st.expander(f"Draft #{idx+1} · {format_ts(item['ts'])}"):
-                st.markdown(f"**User:** {item['user']}")
-                st.markdown(f"**Proposed reply:** {item['reply']}")
-                st.caption(f"Confidence: {item['conf']:.2f} | Risk: {item['risk']:.2f}")
-                col_a, col_b = st.columns(2)
-                with col_a:
-                    if st.button("✅ Send", key=f"send_{idx}"):
-                        # Placeholder – integrate with your send‑to‑channel fn
-                        st.success("Sent (simulated).")
-                with col_b:
-                    if st.button("🗑️ Delete", key=f"del_{idx}"):
-                        drafts.remove(item)
+                    if st.button("🗑️ Delete", key=f"del_discord_{key_id}"):
+                        if message_id and import_discord_bot().dismiss_messages([message_id]):
+                            st.rerun()
+                        else:
+                            st.error("Failed to delete this draft.")
+        
+        col_approve, col_delete = st.columns(2)
+        with col_approve:
+            if st.button(f"✅ Approve selected ({len(selected)})", disabled=not selected):
+                responses = {}
+                for item in selected:
+                    message_id = item.get('message_id', '')
+                    reply = st.session_state.get(f"discord_reply_{message_id}", item.get('reply', ''))
+                    if message_id and reply.strip():
+                        responses[message_id] = reply
+                skipped = len(selected) - len(responses)
+                try:
+                    if import_discord_bot().respond_to_messages(responses):
+                        st.success(f"Queued {len(responses)} repl{'y' if len(responses) == 1 else 'ies'} for Discord"
+                                   + (f" ({skipped} skipped without a reply)" if skipped else ""))
                         st.rerun()
+                    else:
+                        st.error("Failed to approve the selected drafts.")
+                except Exception as e:
+                    st.error(f"Error sending to Discord: {e}")
+        with col_delete:
+            if st.button(f"🗑️ Delete selected ({len(selected)})", disabled=not selected):
+                ids = [item.get('message_id') for item in selected if item.get('message_id')]
+                if import_discord_bot().dismiss_messages(ids):
+                    st.rerun()
+                else:
+                    st.error("Failed to delete the selected drafts.")
 
 # Activity log panel ---------------------------------------------------------
 with col2:
-    st.subheader("Recent Activity (last 100)")
-    if actions:
+    st.subheader(f"Recent Activity (last {RECENT_ACTIVITY_LIMIT})")
+    recent = load_recent_activity()
+    if recent:
         log_view = [{
-            "Time": format_ts(a["ts"]),
-            "User": a["user"][:60],
-            "Reply": a["reply"][:60] + ("…" if len(a["reply"])>60 else ""),
-            "Mode": "sent" if a.get("active") else "draft",
-            "Conf": round(a["conf"],2),
-            "Risk": round(a["risk"],2),
-        } for a in actions[:100]]
+            "Time": format_ts(a.get("ts", 0)),
+            "User": a.get("author", "Unknown")[:60],
+            "Reply": (a.get("reply") or "")[:60] + ("…" if len(a.get("reply") or "")>60 else ""),
+            "Mode": activity_status(a),
+            "Conf": round(a.get("conf", 0.0),2),
+            "Risk": round(a.get("risk", 0.0),2),
+        } for a in recent]
         st.dataframe(log_view, use_container_width=True, hide_index=True)
     else:
         st.info("No logs yet – send a message to generate data.")
 
+# Activity trends ------------------------------------------------------------
+# Charts read the bot's rolling hourly/daily aggregates (analytics.npz), so
+# their cost does not grow with the size of the logs.
+st.subheader("Activity Trends")
+if Path(analytics.ANALYTICS_PATH).exists():
+    window_label = st.radio("Window", list(TREND_WINDOWS), horizontal=True, label_visibility="collapsed")
+    resolution, count = TREND_WINDOWS[window_label]
+    trend = analytics.summarize_window(analytics.Aggregates().window(resolution, count))
+    time_format = "%m-%d %H:00" if resolution == "hour" else "%Y-%m-%d"
+    index = [datetime.fromtimestamp(ts, tz=timezone.utc).strftime(time_format) for ts in trend["start"]]
+    
+    if trend["messages"].sum():
+        trend_col1, trend_col2 = st.columns(2)
+        with trend_col1:
+            st.caption("Messages (auto-sent vs drafted)")
+            st.bar_chart(pd.DataFrame({"Sent": trend["sent"], "Drafted": trend["drafted"],
+                                       "Errors": trend["errors"]}, index=index))
+            st.caption("Latency per reply (ms)")
+            st.line_chart(pd.DataFrame({"Mean": trend["mean_latency_ms"], "p95": trend["p95_latency_ms"]}, index=index))
+        with trend_col2:
+            st.caption("LLM calls and tokens per reply")
+            st.line_chart(pd.DataFrame({"LLM calls": trend["llm_calls_per_reply"]}, index=index))
+            st.line_chart(pd.DataFrame({"Tokens": trend["tokens_per_reply"]}, index=index))
+            st.caption("Confidence / risk distribution")
+            bins = [f"{i / analytics.HIST_BINS:.1f}" for i in range(analytics.HIST_BINS)]
+            st.bar_chart(pd.DataFrame({"Confidence": trend["conf_hist"], "Risk": trend["risk_hist"]}, index=bins))
+    else:
+        st.caption("No messages processed in this window.")
+else:
+    st.caption("No analytics yet – they are recorded as the Discord bot processes messages.")
+
 st.markdown("---")
 st.caption("Streamlit admin MVP – adjust thresholds, review drafts, monitor activity. Integrate real send actions by wiring the ✅ button to your channel adapter.")
 
@@ -394,6 +635,13 @@ with tab3:
                                 st.markdown(f"**Suggestion:** {item.get('suggestion', 'No suggestion text')}")
                                 st.markdown(f"**Reasoning:** {item.get('reasoning', 'No reasoning provided')}")
                                 st.markdown(f"**Confidence:** {item.get('confidence', 0.0):.2f}")
+                                if "redundancy" in item:
+                                    redundancy = item["redundancy"]
+                                    red_color = "red" if redundancy >= 0.8 else "orange" if redundancy >= 0.6 else "green"
+                                    st.markdown(f"**Redundancy:** <span style='color:{red_color}'>{redundancy:.2f}</span>", unsafe_allow_html=True,
+                                                help="Highest similarity to an existing policy bullet or pending suggestion")
+                                    if item.get("closest_policy"):
+                                        st.caption(f"Closest existing text: {item['closest_policy']}")
                                 
                                 # Checkbox to approve each individual suggestion
                                 approve = st.checkbox(f"Approve this suggestion", key=f"approve_{idx}_{i}")
@@ -415,7 +663,7 @@ with tab3:
                                 if policy_generator.apply_approved_suggestions(approved_suggestions):
                                     # Update suggestion status
                                     policy_generator.update_suggestion_status(
-                                        suggestion_record.get("ts", 0),
+                                        suggestion_record["id"],
                                         "approved",
                                         approved_suggestions
                                     )
@@ -428,7 +676,7 @@ with tab3:
                             elif reject_btn:
                                 # Update suggestion status to rejected
                                 if policy_generator.update_suggestion_status(
-                                    suggestion_record.get("ts", 0),
+                                    suggestion_record["id"],
                                     "rejected"
                                 ):
                                     st.success("Suggestions rejected.")
@@ -439,15 +687,11 @@ with tab3:
             else:
                 st.info("No pending policy suggestions available. Generate new suggestions using the button below.")
                 
-                # Show a button to generate suggestions
+                # Generation runs as a background job; clicking again while it runs reuses that job
                 if st.button("Generate New Policy Suggestions"):
-                    with st.spinner("Analyzing conversations and generating suggestions..."):
-                        suggestions = policy_generator.generate_policy_suggestions()
-                        if suggestions and suggestions.get("suggestions"):
-                            st.success(f"✅ Generated {len(suggestions.get('suggestions', []))} policy suggestions!")
-                            st.rerun()  # Refresh to show the new suggestions
-                        else:
-                            st.info("No significant policy suggestions found from recent conversations.")
+                    job = get_job_runner().submit(POLICY_JOB_KIND, policy_generator.generate_policy_suggestions)
+                    st.session_state["policy_job_id"] = job["id"]
+                show_policy_job()
         except Exception as e:
             st.error(f"Error loading policy suggestions: {e}")
             import traceback
@@ -456,6 +700,98 @@ with tab3:
         st.error("Policy generator module not available.")
         st.info("Make sure the policy_generator.py file is in the same directory as this script.")
 
+# Metrics Tab
+with tab4:
+    st.title("📈 Bot Metrics")
+    metrics_port = int(load_config().get("metrics_port", DEFAULT_METRICS_PORT) or 0)
+    samples = load_metrics(metrics_port) if metrics_port else None
+    
+    if samples is None:
+        st.info(f"No metrics available. Start discord_bot.py with metrics_port set (currently {metrics_port or 'disabled'}).")
+    else:
+        def latency_table(rows, label):
+            return [{
+                label.capitalize(): row[label],
+                "Count": row["count"],
+                "Mean (ms)": round(row["mean"] * 1000, 1),
+                "p50 (ms)": round(row["p50"] * 1000, 1),
+                "p95 (ms)": round(row["p95"] * 1000, 1),
+                "p99 (ms)": round(row["p99"] * 1000, 1),
+            } for row in rows]
+        
+        st.subheader("Pipeline stages")
+        stage_rows = metrics.summarize_histograms(samples, "grovio_stage_seconds", "stage")
+        if stage_rows:
+            st.dataframe(latency_table(stage_rows, "stage"), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No messages processed yet.")
+        
+        st.subheader("Storage operations")
+        storage_rows = metrics.summarize_histograms(samples, "grovio_storage_seconds", "op")
+        if storage_rows:
+            st.dataframe(latency_table(storage_rows, "op"), use_container_width=True, hide_index=True)
+        else:
+            st.caption("No storage operations recorded yet.")
+        
+        st.subheader("Counters")
+        counter_rows = [{
+            "Metric": name,
+            "Labels": ", ".join(f"{k}={v}" for k, v in labels.items()),
+            "Value": int(value),
+        } for name, labels, value in samples if name.endswith("_total")]
+        if counter_rows:
+            st.dataframe(counter_rows, use_container_width=True, hide_index=True)
+        
+        if st.button("🔄 Refresh metrics"):
+            st.rerun()
+
+# Outbox Tab
+with tab5:
+    st.header("Outbound Replies")
+    st.caption("Approved replies wait here until Discord confirms the send. Replies that keep failing "
+               "(or whose message was deleted) become dead letters and can be requeued.")
+    
+    box = outbox.from_config(cfg)
+    counts = box.counts()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Pending", counts["pending"])
+    col2.metric("Sent", counts["sent"])
+    col3.metric("Dead letters", counts["dead"])
+    
+    def outbox_rows(entries):
+        return [{
+            "Message": entry["message_id"],
+            "Reply": entry["response"][:120],
+            "Source": entry["source"],
+            "Attempts": entry["attempts"],
+            "Last error": entry["last_error"],
+            "Queued": format_ts(entry["created"]),
+        } for entry in entries]
+    
+    st.subheader("Dead letters")
+    dead = box.entries("dead")
+    if dead:
+        st.dataframe(outbox_rows(dead), use_container_width=True, hide_index=True)
+        labels = {f"{entry['message_id']} – {entry['last_error'][:60]}": entry["id"] for entry in dead}
+        selected = st.multiselect("Replies to requeue", list(labels), key="outbox_requeue")
+        if st.button("🔁 Requeue selected", disabled=not selected):
+            import_discord_bot().requeue_replies([labels[label] for label in selected])
+            st.success(f"Requeued {len(selected)} repl{'y' if len(selected) == 1 else 'ies'}; "
+                       "the bot sends them on its next outbox check")
+            st.rerun()
+    else:
+        st.caption("No dead letters.")
+    
+    st.subheader("Pending")
+    pending = box.entries("pending")
+    if pending:
+        st.dataframe(outbox_rows(pending), use_container_width=True, hide_index=True)
+    else:
+        st.caption("Nothing waiting to be sent.")
+    
+    if st.button("🔄 Refresh outbox"):
+        st.rerun()
+
 if __name__ == "__main__":
     # Run the Streamlit app
     # This is only necessary for debugging, as streamlit run handles this normally
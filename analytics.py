@@ -0,0 +1,241 @@
+"""
+Analytics Aggregates for Grovio
+
+Rolling per-hour and per-day counters for processed messages, kept as
+fixed-size NumPy ring buffers and saved to analytics.npz. The Discord bot
+folds each processed message in as it is stored (`record`), and the admin
+dashboard reads the arrays back to chart the last N hours/days without
+rescanning the logs.
+
+Each bucket holds:
+- counters: messages, auto-sent, drafted, errors, canned replies, LLM calls, tokens
+- sums: total latency (ms), confidence and risk, for means
+- histograms: confidence and risk in 10 bins over [0, 1], latency over LATENCY_BOUNDS_MS
+"""
+
+import atexit
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+ANALYTICS_PATH = "analytics.npz"
+HOURS_KEPT = 24 * 14
+DAYS_KEPT = 90
+FLUSH_SECONDS = 5
+HIST_BINS = 10
+LATENCY_BOUNDS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+COUNTERS = ("messages", "sent", "drafted", "errors", "canned", "llm_calls", "tokens")
+SUMS = ("latency_ms", "conf", "risk")
+RESOLUTIONS = {"hour": (3600, HOURS_KEPT), "day": (86400, DAYS_KEPT)}
+
+
+class RingSeries:
+    """
+    Fixed number of time buckets addressed by absolute bucket id (ts // width).
+
+    A slot is reused once its bucket falls out of the window, so memory and
+    save size stay constant however long the bot runs.
+    """
+
+    def __init__(self, width, size):
+        self.width = width
+        self.size = size
+        self.ids = np.full(size, -1, dtype=np.int64)
+        self.counters = np.zeros((size, len(COUNTERS)), dtype=np.int64)
+        self.sums = np.zeros((size, len(SUMS)), dtype=np.float64)
+        self.conf_hist = np.zeros((size, HIST_BINS), dtype=np.int64)
+        self.risk_hist = np.zeros((size, HIST_BINS), dtype=np.int64)
+        self.latency_hist = np.zeros((size, len(LATENCY_BOUNDS_MS) + 1), dtype=np.int64)
+
+    ARRAYS = ("ids", "counters", "sums", "conf_hist", "risk_hist", "latency_hist")
+
+    def _slot(self, bucket):
+        slot = bucket % self.size
+        if self.ids[slot] != bucket:
+            for name in self.ARRAYS[1:]:
+                getattr(self, name)[slot] = 0
+            self.ids[slot] = bucket
+        return slot
+
+    def add(self, ts, counts, sums, conf, risk, latency_ms):
+        slot = self._slot(int(ts // self.width))
+        for field, value in counts.items():
+            self.counters[slot, COUNTERS.index(field)] += value
+        for field, value in sums.items():
+            self.sums[slot, SUMS.index(field)] += value
+        if conf is not None:
+            self.conf_hist[slot, min(int(conf * HIST_BINS), HIST_BINS - 1)] += 1
+        if risk is not None:
+            self.risk_hist[slot, min(int(risk * HIST_BINS), HIST_BINS - 1)] += 1
+        if latency_ms is not None:
+            self.latency_hist[slot, np.searchsorted(LATENCY_BOUNDS_MS, latency_ms)] += 1
+
+    def window(self, count, now=None):
+        """
+        The last `count` buckets ending at `now`, oldest first (empty buckets are zeros).
+
+        Returns:
+            dict: "start" (bucket start timestamps) plus one array per field
+        """
+        count = min(count, self.size)
+        current = int((now if now is not None else time.time()) // self.width)
+        wanted = np.arange(current - count + 1, current + 1, dtype=np.int64)
+        slots = wanted % self.size
+        valid = self.ids[slots] == wanted
+        out = {"start": wanted * self.width}
+        for name in self.ARRAYS[1:]:
+            rows = getattr(self, name)[slots].copy()
+            rows[~valid] = 0
+            out[name] = rows
+        return out
+
+    def to_arrays(self, prefix):
+        return {f"{prefix}_{name}": getattr(self, name) for name in self.ARRAYS}
+
+    def load_arrays(self, data, prefix):
+        arrays = {name: data.get(f"{prefix}_{name}") for name in self.ARRAYS}
+        if any(a is None for a in arrays.values()) or len(arrays["ids"]) != self.size:
+            return False
+        if arrays["latency_hist"].shape[1] != len(LATENCY_BOUNDS_MS) + 1 or arrays["counters"].shape[1] != len(COUNTERS):
+            return False
+        for name, value in arrays.items():
+            setattr(self, name, np.array(value))
+        return True
+
+
+class Aggregates:
+    """
+    Hourly and daily ring series persisted to an .npz file.
+
+    Args:
+        path (str): File the arrays are saved to
+    """
+
+    def __init__(self, path=ANALYTICS_PATH):
+        self.path = path
+        self.series = {name: RingSeries(width, size) for name, (width, size) in RESOLUTIONS.items()}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_flush = 0.0
+        self.load()
+
+    def load(self):
+        """Load saved arrays; missing or incompatible files start empty."""
+        try:
+            with np.load(self.path) as npz:
+                data = dict(npz)
+        except (FileNotFoundError, OSError, ValueError):
+            return
+        for name, series in self.series.items():
+            if not series.load_arrays(data, name):
+                print(f"Ignoring incompatible {name} series in {self.path}")
+
+    def record(self, ts, sent=False, error=False, canned=False, conf=None, risk=None,
+               latency_ms=None, llm_calls=0, tokens=0):
+        """
+        Fold one processed message into every series and save at most every FLUSH_SECONDS.
+
+        Args:
+            ts (float): When the message was processed
+            sent (bool): The reply was auto-sent rather than drafted
+            error (bool): The pipeline failed for this message
+            canned (bool): The reply came from the canned-reply fast path
+            conf (float): Confidence score
+            risk (float): Risk score
+            latency_ms (float): End-to-end processing time
+            llm_calls (int): LLM API calls made for the reply
+            tokens (int): Prompt, completion and embedding tokens used for the reply
+        """
+        counts = {"messages": 1, "sent": int(sent), "drafted": int(not sent and not error),
+                  "errors": int(error), "canned": int(canned), "llm_calls": llm_calls, "tokens": tokens}
+        sums = {"latency_ms": latency_ms or 0.0, "conf": conf or 0.0, "risk": risk or 0.0}
+        with self._lock:
+            for series in self.series.values():
+                series.add(ts, counts, sums, conf, risk, latency_ms)
+            self._dirty = True
+            if time.time() - self._last_flush >= FLUSH_SECONDS:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        arrays = {}
+        for name, series in self.series.items():
+            arrays.update(series.to_arrays(name))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._dirty = False
+        self._last_flush = time.time()
+
+    def flush(self):
+        """Save pending changes now."""
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def window(self, resolution, count, now=None):
+        """Return `RingSeries.window` for "hour" or "day"."""
+        with self._lock:
+            return self.series[resolution].window(count, now)
+
+
+_aggregates = None
+_aggregates_lock = threading.Lock()
+
+
+def get_aggregates(path=ANALYTICS_PATH):
+    """Process-wide aggregates, flushed at exit."""
+    global _aggregates
+    with _aggregates_lock:
+        if _aggregates is None:
+            _aggregates = Aggregates(path)
+            atexit.register(_aggregates.flush)
+        return _aggregates
+
+
+def record(ts, **fields):
+    """Record a processed message in the process-wide aggregates (see `Aggregates.record`)."""
+    try:
+        get_aggregates().record(ts, **fields)
+    except Exception as e:
+        print(f"Error recording analytics: {e}")
+
+
+def summarize_window(window):
+    """
+    Derive chart-ready series from a window.
+
+    Returns:
+        dict: per-bucket "messages", "sent", "drafted", "errors", "canned",
+        "mean_latency_ms", "p95_latency_ms", "llm_calls_per_reply", "tokens_per_reply", "mean_conf",
+        "mean_risk", plus window totals "conf_hist" and "risk_hist"
+    """
+    from metrics import histogram_quantile
+    counters = {field: window["counters"][:, i] for i, field in enumerate(COUNTERS)}
+    messages = counters["messages"]
+    scored = np.maximum(counters["messages"] - counters["errors"], 1)
+    denom = np.maximum(messages, 1)
+    bounds = [b / 1000.0 for b in LATENCY_BOUNDS_MS] + [float("inf")]
+    cumulative = np.cumsum(window["latency_hist"], axis=1)
+    p95 = [histogram_quantile(0.95, list(zip(bounds, row))) * 1000 if row[-1] else 0.0 for row in cumulative]
+    return {
+        "start": window["start"],
+        **{field: counters[field] for field in ("messages", "sent", "drafted", "errors", "canned")},
+        "mean_latency_ms": window["sums"][:, SUMS.index("latency_ms")] / denom,
+        "p95_latency_ms": np.array(p95),
+        "llm_calls_per_reply": counters["llm_calls"] / denom,
+        "tokens_per_reply": counters["tokens"] / denom,
+        "mean_conf": window["sums"][:, SUMS.index("conf")] / scored,
+        "mean_risk": window["sums"][:, SUMS.index("risk")] / scored,
+        "conf_hist": window["conf_hist"].sum(axis=0),
+        "risk_hist": window["risk_hist"].sum(axis=0),
+    }
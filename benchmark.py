@@ -0,0 +1,320 @@
+"""
+Replay Benchmark for the Grovio reply pipeline
+
+Replays recorded traffic from store.jsonl and discord_messages.jsonl through
+`main.handle` at a configurable concurrency and arrival rate, then reports
+throughput and p50/p95/p99 latency for every pipeline stage. Results are saved
+as JSON so runs from different commits can be compared.
+
+The replay runs inside a scratch working directory (a copy of config.yaml and
+context/) so recorded logs are never modified. Use `--backend stub` to run
+against the offline stand-in LLM backend from stub_llm.py.
+
+Usage:
+    python benchmark.py --backend stub --concurrency 8 --rate 20 --repeat 5
+    python benchmark.py --backend stub --compare bench_results/previous.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent
+STORE_PATH = REPO_DIR / "store.jsonl"
+DISCORD_MESSAGES_PATH = REPO_DIR / "discord_messages.jsonl"
+RESULTS_DIR = REPO_DIR / "bench_results"
+STAGES = ["canned", "embed", "retrieve", "generate", "moderate", "confidence", "persist", "input_moderation"]
+PERCENTILES = [50, 95, 99]
+
+
+def load_replay_messages(limit=None):
+    """
+    Load recorded user messages in the order they originally arrived.
+
+    Args:
+        limit (int): Maximum number of messages to return
+
+    Returns:
+        list: Message texts
+    """
+    records = []
+    for path, field in ((STORE_PATH, "user"), (DISCORD_MESSAGES_PATH, "content")):
+        if not path.exists():
+            continue
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                text = entry.get(field, "")
+                if text:
+                    records.append((entry.get("ts", 0), text))
+    records.sort(key=lambda r: r[0])
+    messages = [text for _, text in records]
+    return messages[:limit] if limit else messages
+
+
+def arrival_offsets(count, rate, arrival, seed=0):
+    """
+    Compute when each message should be submitted, relative to the start.
+
+    Args:
+        count (int): Number of messages
+        rate (float): Mean arrivals per second; 0 submits everything at once
+        arrival (str): "poisson" for exponential gaps, "uniform" for fixed gaps
+        seed (int): Random seed for reproducible Poisson schedules
+
+    Returns:
+        list: Offsets in seconds
+    """
+    if rate <= 0:
+        return [0.0] * count
+    rng = random.Random(seed)
+    offsets, t = [], 0.0
+    for _ in range(count):
+        offsets.append(t)
+        t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+    return offsets
+
+
+def summarize(samples):
+    """Summarize latency samples (seconds) as milliseconds."""
+    if not samples:
+        return {"count": 0}
+    arr = np.array(samples) * 1000.0
+    summary = {"count": len(samples), "mean_ms": float(arr.mean())}
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = float(np.percentile(arr, p))
+    return summary
+
+
+def prepare_workdir():
+    """Create a scratch directory with config and context so replay never touches real logs."""
+    workdir = Path(tempfile.mkdtemp(prefix="grovio-bench-"))
+    config = REPO_DIR / "config.yaml"
+    if not config.exists():
+        config = REPO_DIR / "config.sample.yaml"
+    shutil.copy(config, workdir / "config.yaml")
+    shutil.copytree(REPO_DIR / "context", workdir / "context")
+    return workdir
+
+
+@contextlib.contextmanager
+def workdir_env(workdir, backend):
+    """
+    Point the pipeline at `backend` and at an embedding index inside `workdir`
+    for the duration of the block, then restore the previous environment.
+
+    The index override keeps stub vectors out of a shared index configured
+    with `embedding_index_path`.
+    """
+    values = {"GROVIO_EMBEDDING_INDEX_PATH": str(Path(workdir) / "context_index")}
+    if backend:
+        values["GROVIO_LLM_BACKEND"] = backend
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def run_benchmark(messages, concurrency=4, rate=0.0, arrival="poisson", llm_latency=None,
+                  embed_latency=None, moderation_latency=None, backend="stub"):
+    """
+    Replay messages through `main.handle` and collect per-stage timings.
+
+    Args:
+        messages (list): Message texts to replay
+        concurrency (int): Number of worker threads
+        rate (float): Mean arrival rate in messages/second (0 = closed loop)
+        arrival (str): Arrival process, "poisson" or "uniform"
+        llm_latency (float): Stand-in completion latency in seconds (stub backend only)
+        embed_latency (float): Stand-in embedding latency in seconds (stub backend only)
+        moderation_latency (float): Stand-in moderation latency in seconds (stub backend only)
+        backend (str): "stub" or "openai"
+
+    Returns:
+        dict: Benchmark results
+    """
+    workdir = prepare_workdir()
+    old_cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_DIR))
+    try:
+        with workdir_env(workdir, backend):
+            with contextlib.redirect_stdout(io.StringIO()):
+                import main
+            if llm_latency is not None:
+                main.client.latency = llm_latency
+            if embed_latency is not None:
+                main.client.embed_latency = embed_latency
+            if moderation_latency is not None:
+                main.client.moderation_latency = moderation_latency
+
+            offsets = arrival_offsets(len(messages), rate, arrival)
+            stage_samples = {name: [] for name in STAGES}
+            service_times, end_to_end, errors = [], [], []
+            lock = threading.Lock()
+
+            def replay(text, scheduled_at):
+                started = time.perf_counter()
+                try:
+                    result = main.handle(text)
+                except Exception as e:
+                    with lock:
+                        errors.append(str(e))
+                    return
+                finished = time.perf_counter()
+                with lock:
+                    for name, seconds in result.get("timings", {}).items():
+                        stage_samples.setdefault(name, []).append(seconds)
+                    service_times.append(finished - started)
+                    end_to_end.append(finished - scheduled_at)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    for text, offset in zip(messages, offsets):
+                        scheduled_at = start + offset
+                        delay = scheduled_at - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                        pool.submit(replay, text, scheduled_at)
+                elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    completed = len(service_times)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "backend": backend,
+            "concurrency": concurrency,
+            "rate": rate,
+            "arrival": arrival,
+            "llm_latency": llm_latency,
+            "embed_latency": embed_latency,
+            "moderation_latency": moderation_latency,
+        },
+        "messages": len(messages),
+        "completed": completed,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": elapsed,
+        "throughput_rps": completed / elapsed if elapsed > 0 else 0.0,
+        "stages": {name: summarize(samples) for name, samples in stage_samples.items()},
+        "service": summarize(service_times),
+        "end_to_end": summarize(end_to_end),
+    }
+
+
+def print_report(results, baseline=None):
+    """Print a per-stage latency table, with deltas against a baseline run if given."""
+    print(f"Replayed {results['completed']}/{results['messages']} messages "
+          f"in {results['elapsed_s']:.2f}s ({results['throughput_rps']:.2f} msg/s), "
+          f"{results['errors']} error(s)")
+    rows = list(results["stages"].items()) + [("service", results["service"]), ("end_to_end", results["end_to_end"])]
+    header = f"{'stage':<17}" + "".join(f"{'p' + str(p) + ' ms':>12}" for p in PERCENTILES)
+    if baseline:
+        header += f"{'Δp50':>10}{'Δp95':>10}"
+    print(header)
+    for name, summary in rows:
+        if not summary.get("count"):
+            continue
+        line = f"{name:<17}" + "".join(f"{summary[f'p{p}_ms']:>12.1f}" for p in PERCENTILES)
+        if baseline:
+            base = baseline.get("stages", {}).get(name) or baseline.get(name) or {}
+            for p in (50, 95):
+                if base.get(f"p{p}_ms"):
+                    delta = (summary[f"p{p}_ms"] - base[f"p{p}_ms"]) / base[f"p{p}_ms"] * 100
+                    line += f"{delta:>+9.1f}%"
+                else:
+                    line += f"{'n/a':>10}"
+        print(line)
+    if baseline:
+        base_rps = baseline.get("throughput_rps") or 0
+        if base_rps:
+            delta = (results["throughput_rps"] - base_rps) / base_rps * 100
+            print(f"Throughput vs {baseline['meta'].get('commit', 'baseline')}: {delta:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded traffic through the reply pipeline.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker threads (default: 4)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrival rate in msg/s; 0 = closed loop (default)")
+    parser.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the recorded traffic N times")
+    parser.add_argument("--limit", type=int, default=None, help="Only replay the first N recorded messages")
+    parser.add_argument("--backend", choices=["stub", "openai"], default="stub")
+    parser.add_argument("--llm-latency", type=float, default=None, help="Stub completion latency in seconds")
+    parser.add_argument("--embed-latency", type=float, default=None, help="Stub embedding latency in seconds")
+    parser.add_argument("--moderation-latency", type=float, default=None, help="Stub moderation latency in seconds")
+    parser.add_argument("--output", default=None, help="Results JSON path (default: bench_results/<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    messages = load_replay_messages(args.limit) * args.repeat
+    if not messages:
+        print("No recorded messages found in store.jsonl or discord_messages.jsonl")
+        return 1
+
+    results = run_benchmark(
+        messages,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        arrival=args.arrival,
+        llm_latency=args.llm_latency,
+        embed_latency=args.embed_latency,
+        moderation_latency=args.moderation_latency,
+        backend=args.backend,
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{results['meta']['commit']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
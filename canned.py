@@ -0,0 +1,193 @@
+"""
+Canned Replies for Grovio
+
+Parses the approved reply table in context/canned_replies.md into an intent
+index. Each trigger is represented by a few example phrasings (plus the
+trigger label itself), embedded once at startup, and a small keyword list.
+`main.handle` checks a message against the index before retrieval and
+answers with the approved reply when an intent matches closely enough,
+skipping the completion, moderation and confidence calls.
+"""
+
+import re
+import string
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+from utils import embed_batch
+
+CANNED_REPLIES_PATH = "context/canned_replies.md"
+DEFAULT_THRESHOLD = 0.9
+KEYWORD_BONUS = 0.05
+CANNED_RISK = 0.0
+CANNED_CONF = 0.95
+
+# Example phrasings and keywords per trigger. Triggers without an entry here
+# (such as "Off-topic / violation", which needs judgment) are not auto-matched.
+INTENT_EXAMPLES = {
+    "General inquiry": {
+        "examples": ["hi", "hello", "hey there", "what is grovio", "what does grovio do",
+                     "tell me about grovio", "can you explain what grovio is"],
+        "keywords": ["hello", "hi", "hey"],
+    },
+    "Pricing question": {
+        "examples": ["how much does grovio cost", "what is the pricing", "is grovio free",
+                     "what are your pricing plans", "how do i join the waitlist"],
+        "keywords": ["price", "pricing", "cost", "plans", "waitlist"],
+    },
+    "Integration help": {
+        "examples": ["how do i integrate grovio with discord", "does grovio work with telegram",
+                     "which platforms do you support", "how do i connect my server"],
+        "keywords": ["integrate", "integration", "integrations", "connect", "setup"],
+    },
+    "Security / data concern": {
+        "examples": ["is my data safe", "do you sell my data", "how do you protect my data",
+                     "is grovio secure"],
+        "keywords": ["security", "secure", "privacy", "data"],
+    },
+    "Bug report": {
+        "examples": ["i found a bug", "something is broken", "the dashboard is not working",
+                     "i am getting an error"],
+        "keywords": ["bug", "broken", "error", "crash"],
+    },
+    "Feature request": {
+        "examples": ["can you add a feature", "i have a feature request", "it would be great if grovio could",
+                     "please add support for"],
+        "keywords": ["feature", "suggestion", "request"],
+    },
+    "Token questions": {
+        "examples": ["what is the grov token", "how do i earn grov", "how do tokens work",
+                     "what is $grov used for"],
+        "keywords": ["token", "tokens", "grov", "$grov", "rewards"],
+    },
+    "Analytics questions": {
+        "examples": ["what analytics does grovio provide", "can i see retention metrics",
+                     "do you track on-chain data", "how do i see community insights"],
+        "keywords": ["analytics", "metrics", "retention", "insights"],
+    },
+    "AI capabilities": {
+        "examples": ["what can your ai do", "how does the ai work", "what is the ai growth copilot"],
+        "keywords": ["ai", "copilot", "agent", "agents"],
+    },
+    "Closing conversation": {
+        "examples": ["thanks", "thank you", "thanks that helps", "bye", "that's all, thanks"],
+        "keywords": ["thanks", "thank", "bye"],
+    },
+}
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = text.lower().translate(str.maketrans("", "", string.punctuation.replace("$", "")))
+    return " ".join(text.split())
+
+
+def parse_canned_replies(path=CANNED_REPLIES_PATH):
+    """
+    Parse the trigger/reply markdown table.
+
+    Args:
+        path (str): Path to canned_replies.md
+
+    Returns:
+        dict: Trigger label -> approved reply text
+    """
+    replies = {}
+    for line in Path(path).read_text().splitlines():
+        cells = [c.strip() for c in line.strip().strip("|").split("|")]
+        if len(cells) < 2 or not cells[0].startswith("**"):
+            continue
+        trigger = cells[0].strip("*").strip()
+        reply = "|".join(cells[1:]).strip()
+        reply = re.sub(r'^"(.*)"$', r"\1", reply, flags=re.DOTALL)
+        replies[trigger] = reply
+    return replies
+
+
+class CannedReplyIndex:
+    """
+    Embedding + keyword index over the canned reply intents.
+
+    Args:
+        replies (dict): Trigger label -> reply, from `parse_canned_replies`
+        client (OpenAI): Client used to embed the trigger examples
+    """
+
+    def __init__(self, replies, client):
+        self.replies = {}
+        self.keywords = {}
+        self.exact = {}
+        texts, owners = [], []
+        for trigger, reply in replies.items():
+            spec = INTENT_EXAMPLES.get(trigger)
+            if spec is None:
+                continue
+            self.replies[trigger] = reply
+            self.keywords[trigger] = set(spec.get("keywords", []))
+            for example in [trigger] + spec.get("examples", []):
+                texts.append(example)
+                owners.append(trigger)
+                self.exact[normalize(example)] = trigger
+        self.intents = list(self.replies)
+        self.owners = np.array([self.intents.index(o) for o in owners], dtype=int)
+        matrix = embed_batch(texts, client) if texts else np.zeros((0, 1))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1.0, norms)
+        self.hits = 0
+        self.lookups = 0
+
+    @classmethod
+    def load(cls, client, path=CANNED_REPLIES_PATH):
+        """Build the index from the canned replies file, or return None if it cannot be read."""
+        try:
+            return cls(parse_canned_replies(path), client)
+        except Exception as e:
+            print(f"Error loading canned replies: {e}")
+            return None
+
+    def match_exact(self, text):
+        """Return the intent whose example equals `text` after normalization, or None (no embedding needed)."""
+        return self.exact.get(normalize(text))
+
+    def match(self, text, q_emb, threshold=DEFAULT_THRESHOLD):
+        """
+        Find the best intent for a message.
+
+        An intent's score is the highest cosine similarity between the message
+        and its examples, plus KEYWORD_BONUS if the message contains one of its
+        keywords.
+
+        Args:
+            text (str): The user message
+            q_emb (np.array): Embedding of the message
+            threshold (float): Minimum score for a match
+
+        Returns:
+            tuple: (intent, score), or (None, best score) below the threshold
+        """
+        if not self.intents or q_emb is None:
+            return None, 0.0
+        q_norm = np.linalg.norm(q_emb) or 1.0
+        sims = self.matrix @ (q_emb / q_norm)
+        scores = np.full(len(self.intents), -1.0)
+        np.maximum.at(scores, self.owners, sims)
+        tokens = set(normalize(text).split())
+        for i, intent in enumerate(self.intents):
+            if tokens & self.keywords[intent]:
+                scores[i] += KEYWORD_BONUS
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            return self.intents[best], float(scores[best])
+        return None, float(scores[best])
+
+    def record(self, intent):
+        """Count a lookup (hit if `intent` is set) and return the running hit rate."""
+        self.lookups += 1
+        if intent:
+            self.hits += 1
+            metrics.CANNED_REPLIES.inc(result="hit", intent=intent)
+        else:
+            metrics.CANNED_REPLIES.inc(result="miss", intent="")
+        return self.hits / self.lookups
@@ -5,14 +5,18 @@ import json
 import time
 from pathlib import Path
 from discord.ext import commands
-import json
-import time
 import threading
 import asyncio
-from pathlib import Path
-import yaml
+import importlib
 import sys
 import io
+import analytics
+import log_archive
+import outbox
+import metrics
+import prefilter
+import profiling
+import storage
 
 # Track last config file modification time
 last_config_mtime = 0
@@ -27,16 +31,19 @@ def reload_config():
         # Check if the file has been modified
         current_mtime = config_file.stat().st_mtime
         if current_mtime > last_config_mtime:
+            metrics.CACHE_MISSES.inc(cache="config")
             with open(config_file, "r") as f:
                 new_cfg = yaml.safe_load(f)
                 if new_cfg:
                     old_mode = cfg.get('mode', 'passive')
                     new_mode = new_cfg.get('mode', 'passive')
                     cfg = new_cfg
+                    profiling.configure(cfg)
                     last_config_mtime = current_mtime
                     if old_mode != new_mode:
                         print(f"Mode changed from {old_mode} to {new_mode}")
                     return True  # Config was reloaded
+        metrics.CACHE_HITS.inc(cache="config")
         return False  # No change in config
     else:
         # Default configuration
@@ -64,19 +71,33 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 # Dictionary to keep track of message IDs and their channels
 message_map = {}
 
-# Path to persist message map and message queue
+# Path to persist message map; replies go through the outbox (outbox.jsonl)
 MESSAGE_MAP_FILE = "discord_message_map.json"
-MESSAGE_QUEUE_FILE = "discord_message_queue.jsonl"
+MESSAGE_QUEUE_FILE = "discord_message_queue.jsonl"  # Legacy queue, migrated into the outbox
+DISCORD_MESSAGES_FILE = "discord_messages.jsonl"
+SKIPPED_MESSAGES_FILE = "skipped_messages.jsonl"
+
+# Check the outbox for due replies every 2 seconds
+QUEUE_CHECK_INTERVAL = 2
+
+# Replies sent to Discord at the same time when draining the outbox
+DEFAULT_OUTBOX_CONCURRENCY = 5
 
-# Check queue every 5 seconds
-QUEUE_CHECK_INTERVAL = 5
+# Messages processed by the LLM pipeline at the same time
+DEFAULT_MAX_CONCURRENT_MESSAGES = 8
+
+# Seconds new message map entries may wait before the map is written; a burst shares one rewrite
+MESSAGE_MAP_SAVE_DELAY = 1.0
+
+# Local port for the Prometheus-style metrics endpoint (0 disables it)
+DEFAULT_METRICS_PORT = 9108
 
 # Load message map from disk if it exists
 def load_message_map():
     global message_map
     try:
         if Path(MESSAGE_MAP_FILE).exists():
-            with open(MESSAGE_MAP_FILE, 'r') as f:
+            with metrics.storage("load_message_map"), open(MESSAGE_MAP_FILE, 'r') as f:
                 message_map = json.load(f)
                 print(f"Loaded message map with {len(message_map)} entries")
     except Exception as e:
@@ -84,19 +105,171 @@ def load_message_map():
         message_map = {}
 
 # Save message map to disk
-def save_message_map():
+@profiling.sampled("storage.save_message_map")
+def save_message_map(snapshot=None):
     try:
-        with open(MESSAGE_MAP_FILE, 'w') as f:
-            json.dump(message_map, f)
+        with metrics.storage("save_message_map"):
+            storage.atomic_write_text(MESSAGE_MAP_FILE, json.dumps(message_map if snapshot is None else snapshot))
     except Exception as e:
         print(f"Error saving message map: {e}")
+        metrics.ERRORS.inc(where="save_message_map")
+
+_map_save_task = None
+_map_save_lock = None
+
+def schedule_message_map_save():
+    """
+    Write the message map from a worker thread shortly after it changes.
+    
+    Changes within MESSAGE_MAP_SAVE_DELAY share one rewrite, and the event
+    loop never blocks on the JSON dump. Writes are serialized so an older
+    snapshot never replaces a newer one.
+    """
+    global _map_save_task, _map_save_lock
+    if _map_save_task is not None and not _map_save_task.done():
+        return
+    if _map_save_lock is None:
+        _map_save_lock = asyncio.Lock()
+    
+    async def save_later():
+        global _map_save_task
+        try:
+            await asyncio.sleep(MESSAGE_MAP_SAVE_DELAY)
+        except asyncio.CancelledError:
+            # The loop is shutting down; write now rather than lose the newest entries
+            save_message_map(dict(message_map))
+            raise
+        async with _map_save_lock:
+            # Later changes schedule their own save from here on
+            _map_save_task = None
+            await asyncio.to_thread(save_message_map, dict(message_map))
+    
+    _map_save_task = asyncio.get_running_loop().create_task(save_later())
 
 # Load the message map at startup
 load_message_map()
 
+_outbox = None
+_in_flight = set()
+
+def get_outbox():
+    """The process-wide outbox (retry settings come from the config at first use)."""
+    global _outbox
+    if _outbox is None:
+        _outbox = outbox.from_config(cfg)
+    return _outbox
+
+def migrate_legacy_queue():
+    """Move replies left in the old discord_message_queue.jsonl into the outbox."""
+    queue_file = Path(MESSAGE_QUEUE_FILE)
+    if not queue_file.exists() or queue_file.stat().st_size == 0:
+        return 0
+    with metrics.storage("queue_migrate"), storage.file_lock(MESSAGE_QUEUE_FILE):
+        replies = {}
+        with open(queue_file, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("message_id") and entry.get("response"):
+                    replies[entry["message_id"]] = entry["response"]
+        # Enqueue before truncating, so a crash here cannot lose the replies
+        added = get_outbox().enqueue(replies, source="legacy_queue")
+        storage.atomic_write_text(MESSAGE_QUEUE_FILE, "")
+    print(f"Migrated {len(added)} queued repl{'y' if len(added) == 1 else 'ies'} into the outbox")
+    return len(added)
+
+_outbox_semaphore = None
+
+def get_outbox_semaphore():
+    """Semaphore limiting replies being sent to Discord at once (`outbox_concurrency`), shared by all senders."""
+    global _outbox_semaphore
+    if _outbox_semaphore is None:
+        _outbox_semaphore = asyncio.Semaphore(cfg.get("outbox_concurrency", DEFAULT_OUTBOX_CONCURRENCY))
+    return _outbox_semaphore
+
+async def deliver(entries, original_message=None, record=True):
+    """
+    Send outbox entries and record the outcome of each.
+    
+    Sends are acknowledged in the outbox with one append; failures are
+    scheduled for retry or dead-lettered. With `record`, the messages are
+    updated in discord_messages.jsonl with one rewrite: sent replies are
+    marked responded, and dead letters lose their approval and get a
+    `delivery_error`, which puts them back in the dashboard's draft queue.
+    
+    Args:
+        entries (list): Outbox entries to send
+        original_message (discord.Message): The message being answered, if
+            delivering a single auto-reply (skips the fetch)
+        record (bool): Update the stored messages (the auto-send path stores
+            its message afterwards instead)
+        
+    Returns:
+        tuple: (ids of the entries that were sent, dict of dead-lettered entry
+        id -> delivery error)
+    """
+    box = get_outbox()
+    entries = [e for e in entries if e["id"] not in _in_flight]
+    _in_flight.update(e["id"] for e in entries)
+    semaphore = get_outbox_semaphore()
+    
+    async def send_one(entry):
+        async with semaphore:
+            try:
+                with metrics.stage("discord_send"):
+                    await _send(entry["message_id"], entry["response"], original_message)
+                return entry, None, False
+            except Exception as e:
+                return entry, e, is_permanent_send_error(e)
+    
+    sent, dead = set(), {}
+    updates = {}
+    try:
+        results = await asyncio.gather(*(send_one(e) for e in entries))
+        acked = [entry for entry, error, _ in results if error is None]
+        if acked:
+            await asyncio.to_thread(box.ack, [e["id"] for e in acked])
+            sent = {e["id"] for e in acked}
+            metrics.QUEUE_MESSAGES.inc(len(acked), result="sent")
+            now = time.time()
+            for entry in acked:
+                updates[entry["message_id"]] = {"responded": True, "responded_at": now, "delivery_error": None}
+        for entry, error, permanent in results:
+            if error is None:
+                continue
+            state = await asyncio.to_thread(box.fail, entry["id"], error, permanent)
+            metrics.ERRORS.inc(where="discord_send")
+            if state["status"] == "dead":
+                dead[entry["id"]] = state["last_error"]
+                updates[entry["message_id"]] = {"approved": False, "delivery_error": state["last_error"]}
+                metrics.QUEUE_MESSAGES.inc(result="dead")
+                print(f"Reply to {entry['message_id']} moved to dead letters after {state['attempts']} attempt(s): {error}")
+            else:
+                metrics.QUEUE_MESSAGES.inc(result="retry")
+                print(f"Reply to {entry['message_id']} failed (attempt {state['attempts']}), retrying in "
+                      f"{max(0, state['next_at'] - time.time()):.0f}s: {error}")
+        if record and updates:
+            await asyncio.to_thread(update_messages, updates)
+    finally:
+        _in_flight.difference_update(e["id"] for e in entries)
+    return sent, dead
+
+async def drain_outbox():
+    """Send every due outbox entry; returns the number sent."""
+    due = await asyncio.to_thread(get_outbox().due, None, set(_in_flight))
+    if not due:
+        return 0
+    print(f"Sending {len(due)} repl{'y' if len(due) == 1 else 'ies'} from the outbox")
+    with metrics.storage("queue_drain"):
+        sent, _ = await deliver(due)
+    await asyncio.to_thread(get_outbox().compact)
+    return len(sent)
+
 async def check_message_queue():
     await bot.wait_until_ready()
-    print("Started message queue monitoring task")
+    print("Started outbox monitoring task")
     while not bot.is_closed():
         try:
             # Reload config to check for mode changes
@@ -105,41 +278,13 @@ async def check_message_queue():
         except Exception as e:
             print(f"Error reloading config: {e}")
         
-        # Check the message queue file for messages to respond to
-        queue_file = Path(MESSAGE_QUEUE_FILE)
-        messages_to_process = []
-        
-        if queue_file.exists() and queue_file.stat().st_size > 0:
-            try:
-                with open(queue_file, 'r') as f:
-                    lines = f.readlines()
-                    if lines:
-                        print(f"Found {len(lines)} message(s) in queue to process")
-                        messages_to_process = [json.loads(line) for line in lines]
-                
-                # Clear the queue file immediately to avoid reprocessing
-                with open(queue_file, 'w') as f:
-                    f.write("")
-                    
-                # Process each queued response
-                for entry in messages_to_process:
-                    message_id = entry.get('message_id')
-                    response = entry.get('response')
-                    
-                    if message_id and response:
-                        print(f"Processing queued response for message {message_id}")
-                        try:
-                            # Use the async response function directly since we're already in an async context
-                            await _respond_to_message(message_id, response)
-                            print(f"Successfully sent queued response to {message_id}")
-                        except Exception as e:
-                            print(f"Error sending queued response: {e}")
-                            import traceback
-                            traceback.print_exc()
-            except Exception as e:
-                print(f"Error processing message queue: {e}")
-                import traceback
-                traceback.print_exc()
+        try:
+            await drain_outbox()
+        except Exception as e:
+            print(f"Error processing outbox: {e}")
+            metrics.ERRORS.inc(where="queue_drain")
+            import traceback
+            traceback.print_exc()
         
         # Wait before checking again
         await asyncio.sleep(QUEUE_CHECK_INTERVAL)
@@ -148,6 +293,16 @@ async def check_message_queue():
 async def on_ready():
     print(f'Logged in as {bot.user.name}#{bot.user.discriminator} (ID: {bot.user.id})')
     print('------')
+    # Replies queued while disconnected are due now; the task below drains them first
+    try:
+        await asyncio.to_thread(migrate_legacy_queue)
+    except Exception as e:
+        print(f"Error migrating legacy queue: {e}")
+    # Load the pipeline (it embeds the context files) before the first message arrives
+    try:
+        await load_main()
+    except Exception as e:
+        print(f"Error loading the LLM pipeline: {e}")
     # Start the background task to check for queued messages
     bot.loop.create_task(check_message_queue())
 
@@ -167,19 +322,99 @@ async def on_message(message):
     # Log the received message for debugging
     print(f"Received Discord message from {message.author}: {message.content}")
     
+    # Skip chatter that needs no reply before it reaches the LLM pipeline
+    if cfg.get("prefilter", True):
+        try:
+            process, reason = await prefilter_message(message)
+        except Exception as e:
+            print(f"Error in pre-filter: {e}")
+            metrics.ERRORS.inc(where="prefilter")
+            process, reason = True, "error"
+        metrics.PREFILTER.inc(decision="process" if process else "skip", reason=reason)
+        if not process:
+            record_skipped_message(message, reason)
+            return
+    
+    # Run the async pipeline on the event loop, bounded so a burst cannot open unlimited LLM calls
+    async with get_pipeline_semaphore():
+        await store_discord_message(message)
+
+_main = None
+
+async def load_main():
+    """The `main` pipeline module, imported once in a worker thread (the first import embeds the context files)."""
+    global _main
+    if _main is None:
+        _main = await asyncio.to_thread(importlib.import_module, "main")
+    return _main
+
+_pipeline_semaphore = None
+
+def get_pipeline_semaphore():
+    """Semaphore limiting messages in the pipeline at once (`max_concurrent_messages`)."""
+    global _pipeline_semaphore
+    if _pipeline_semaphore is None:
+        _pipeline_semaphore = asyncio.Semaphore(cfg.get("max_concurrent_messages", DEFAULT_MAX_CONCURRENT_MESSAGES))
+    return _pipeline_semaphore
+
+_prefilter_classifier = None
+_prefilter_lock = threading.Lock()
+
+def get_prefilter_classifier():
+    """Build the embedding pre-filter classifier on first use (it embeds its examples once)."""
+    global _prefilter_classifier
+    with _prefilter_lock:
+        if _prefilter_classifier is None:
+            from utils import make_client
+            _prefilter_classifier = prefilter.EmbeddingClassifier(make_client(cfg))
+        return _prefilter_classifier
+
+def addresses_bot(message):
+    """True if the message mentions the bot or replies to one of its messages."""
+    if bot.user is None:
+        return False
+    if bot.user in getattr(message, "mentions", []):
+        return True
+    reference = getattr(message, "reference", None)
+    resolved = getattr(reference, "resolved", None) if reference else None
+    return getattr(resolved, "author", None) == bot.user
+
+async def prefilter_message(message):
+    """
+    Run the pre-filter for a message.
+    
+    Rules run inline; the optional embedding classifier (`prefilter_classifier`)
+    makes network calls, so it runs in a worker thread.
+    
+    Returns:
+        tuple: (process, reason)
+    """
+    mentioned = addresses_bot(message)
+    if not cfg.get("prefilter_classifier", False):
+        return prefilter.should_process(message.content, cfg, mentioned)
+    def classify():
+        return prefilter.should_process(message.content, cfg, mentioned, get_prefilter_classifier())
+    return await asyncio.to_thread(classify)
+
+@profiling.sampled("storage.record_skipped_message")
+def record_skipped_message(message, reason):
+    """Append a skipped message to skipped_messages.jsonl for auditing."""
     try:
-        # Create a thread to handle the message processing
-        # This prevents blocking the Discord event loop
-        thread = threading.Thread(target=store_discord_message, args=(message,))
-        thread.daemon = True
-        thread.start()
+        with metrics.storage("append_skipped"):
+            storage.append_jsonl(SKIPPED_MESSAGES_FILE, [{
+                "ts": time.time(),
+                "message_id": f"discord_{message.id}",
+                "channel_id": message.channel.id,
+                "author": str(message.author),
+                "content": message.content,
+                "reason": reason,
+            }])
     except Exception as e:
-        print(f"Error starting processing thread: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Error recording skipped message: {e}")
+        metrics.ERRORS.inc(where="record_skipped")
 
 # Process and store Discord messages for review
-def store_discord_message(message):
+async def store_discord_message(message):
     # Reload config to check for mode changes
     reload_config()
     # Create a unique ID for this message
@@ -190,60 +425,31 @@ def store_discord_message(message):
         "channel_id": message.channel.id,
         "message_id": message.id
     }
-    # Save the message map to disk for persistence
-    save_message_map()
+    # Save the message map to disk for persistence (batched, off the event loop)
+    schedule_message_map_save()
     
     # First process the message through the LLM pipeline
+    timings = {}
     try:
-        import main
-        import sys
-        import io
-        import yaml
+        main = _main or await load_main()
         user_input = message.content
         
-        # Capture the print output from main.handle (it prints the response)
-        old_stdout = sys.stdout
-        new_stdout = io.StringIO()
-        sys.stdout = new_stdout
+        # Process the message through main.py's async pipeline; it returns the stored record
+        with metrics.stage("total", timings):
+            result = await main.handle_async(user_input)
         
-        # Process the message through main.py handle function
-        main.handle(user_input)
-        
-        # Get the printed output and restore stdout
-        output = new_stdout.getvalue()
-        sys.stdout = old_stdout
-        
-        # Extract AI response from printed output (format is usually "AI: response")
-        reply_text = ""
-        if "AI:" in output:
-            reply_text = output.split("AI:", 1)[1].strip()
-        
-        # Get additional metadata from store.jsonl
-        store_file = Path("store.jsonl")
-        risk = 0.0
-        conf = 0.0
-        active_mode = False
-        
-        if store_file.exists():
-            with open(store_file, "r") as f:
-                lines = f.readlines()
-                if lines:
-                    latest_entry = json.loads(lines[-1])
-                    # Only use the reply from store.jsonl if we couldn't extract it from stdout
-                    if not reply_text:
-                        reply_text = latest_entry.get("reply", "")
-                    risk = latest_entry.get("risk", 0.0)
-                    conf = latest_entry.get("conf", 0.0)
-                    active_mode = latest_entry.get("active", False)
+        reply_text = result.get("reply", "")
+        risk = result.get("risk", 0.0)
+        conf = result.get("conf", 0.0)
+        active_mode = result.get("active", False)
         
         print(f"Generated response: {reply_text[:50]}...")
         print(f"Active mode: {active_mode}")
         
-        # Store the message information in discord_messages.jsonl
-        discord_msg_file = Path("discord_messages.jsonl")
-        
         # Check if we're in active mode and should auto-respond
         responded = False
+        approved = False
+        delivery_error = None
         
         # Get the confidence and risk thresholds from config
         min_confidence = cfg.get("min_confidence", 0.7)
@@ -255,19 +461,17 @@ def store_discord_message(message):
         if active_mode and reply_text:
             if thresholds_met:
                 try:
-                    # Create a queue entry to be processed by the background task
-                    queue_entry = {
-                        "message_id": message_id,
-                        "response": reply_text,
-                        "timestamp": time.time()
-                    }
-                    
-                    # Write to the message queue file for the bot to pick up
-                    with open(MESSAGE_QUEUE_FILE, "a") as f:
-                        f.write(json.dumps(queue_entry) + "\n")
-                    
+                    # Record the reply in the outbox, then send it right away from the event loop;
+                    # a failed send is retried by the outbox task
                     print(f"Auto-responding to message {message_id} (active mode, thresholds met: conf={conf:.2f}, risk={risk:.2f})")
-                    responded = True
+                    entries = await asyncio.to_thread(get_outbox().enqueue, {message_id: reply_text}, "auto")
+                    if entries:
+                        sent, dead = await deliver(entries, message, record=False)
+                        responded = bool(sent)
+                        # A reply waiting for a retry is approved; the outbox marks it responded once sent
+                        approved = not sent and not dead
+                        # A dead letter goes to the draft queue with its error, like a failed dashboard approval
+                        delivery_error = next(iter(dead.values()), None)
                 except Exception as e:
                     print(f"Error auto-responding to message: {e}")
                     import traceback
@@ -288,19 +492,32 @@ def store_discord_message(message):
             "processed": True,
             "responded": responded
         }
+        if responded:
+            # When the conversation became final; the policy checkpoint is keyed on it
+            entry["responded_at"] = entry["ts"]
+        elif approved:
+            entry["approved"] = True
+        elif delivery_error:
+            entry["delivery_error"] = delivery_error
+        if result.get("flagged_input"):
+            entry["flagged_input"] = result["flagged_input"]
         
-        with open(discord_msg_file, "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        await asyncio.to_thread(store_entry, entry)
+        # Every few seconds this flushes the aggregates with np.savez, so keep it off the loop
+        await asyncio.to_thread(analytics.record, entry["ts"], sent=responded, canned=bool(result.get("canned")),
+                                conf=conf, risk=risk, latency_ms=timings["total"] * 1000,
+                                llm_calls=result.get("llm_calls", 0),
+                                tokens=sum(v for k, v in result.get("usage", {}).items() if k.endswith("_tokens")))
         
         print(f"Processed Discord message with LLM and stored for review: {message_id}")
         
     except Exception as e:
         print(f"Error processing message through LLM: {e}")
+        metrics.ERRORS.inc(where="pipeline")
         import traceback
         traceback.print_exc()
         
         # Even if there's an error, store a minimal entry
-        discord_msg_file = Path("discord_messages.jsonl")
         entry = {
             "ts": time.time(),
             "message_id": message_id,
@@ -313,72 +530,107 @@ def store_discord_message(message):
             "responded": False
         }
         
-        with open(discord_msg_file, "a") as f:
-            f.write(json.dumps(entry) + "\n")
+        await asyncio.to_thread(store_entry, entry)
+        await asyncio.to_thread(analytics.record, entry["ts"], error=True, latency_ms=timings.get("total", 0.0) * 1000)
 
 # Command to respond to a specific message by ID
 @bot.command(name="respond")
 async def respond_to_message(ctx, message_id, *, response):
-    if message_id in message_map:
-        info = message_map[message_id]
-        channel = bot.get_channel(info["channel_id"])
-        if channel:
-            original_message = await channel.fetch_message(info["message_id"])
-            await original_message.reply(response)
-            await ctx.send(f"Response sent to message {message_id}")
-        else:
-            await ctx.send(f"Channel not found for message {message_id}")
-    else:
+    if message_id not in message_map:
         await ctx.send(f"Message ID {message_id} not found in tracking map")
+        return
+    # Same path as dashboard approvals: outbox first, so a failed send is retried and never doubled
+    entries = await asyncio.to_thread(get_outbox().enqueue, {message_id: response}, "command")
+    if not entries:
+        await ctx.send(f"A reply to message {message_id} is already queued or sent")
+        return
+    await asyncio.to_thread(update_messages, {message_id: {"approved": True, "reply": response, "delivery_error": None}})
+    sent, dead = await deliver(entries)
+    if sent:
+        await ctx.send(f"Response sent to message {message_id}")
+    elif dead:
+        await ctx.send(f"Could not send a response to message {message_id}: {next(iter(dead.values()))}")
+    else:
+        await ctx.send(f"Sending to message {message_id} failed; the outbox will retry it")
 
-# Function to respond to a message from external code (like admin dashboard)
-async def _respond_to_message(message_id, response):
-    if message_id in message_map:
+@profiling.sampled("storage.store_entry")
+def store_entry(entry):
+    """Append a processed message to discord_messages.jsonl."""
+    with metrics.storage("messages_append"):
+        log_archive.append_records(DISCORD_MESSAGES_FILE, [entry], cfg)
+
+async def _send(message_id, response, original_message=None):
+    """Reply to a tracked Discord message, raising on failure."""
+    if original_message is None:
+        if message_id not in message_map:
+            raise LookupError(f"Message ID {message_id} not found in tracking map")
         info = message_map[message_id]
         channel = bot.get_channel(info["channel_id"])
-        if channel:
-            try:
-                original_message = await channel.fetch_message(info["message_id"])
-                await original_message.reply(response)
-                print(f"Response sent to message {message_id}")
-                
-                # Update the message in discord_messages.jsonl to mark as responded
-                discord_msg_file = Path("discord_messages.jsonl")
-                if discord_msg_file.exists():
-                    # Read all messages
-                    with open(discord_msg_file, "r") as f:
-                        messages = [json.loads(line) for line in f]
-                    
-                    # Update the responded status
-                    updated = False
-                    for msg in messages:
-                        if msg.get("message_id") == message_id:
-                            msg["responded"] = True
-                            updated = True
-                    
-                    if updated:
-                        # Write back all messages
-                        with open(discord_msg_file, "w") as f:
-                            for msg in messages:
-                                f.write(json.dumps(msg) + "\n")
-                return True
-            except Exception as e:
-                print(f"Error responding to Discord message: {e}")
-                return False
-        else:
-            print(f"Channel not found for message {message_id}")
-            return False
-    else:
-        print(f"Message ID {message_id} not found in tracking map")
+        if not channel:
+            raise ConnectionError(f"Channel not found for message {message_id}")
+        original_message = await channel.fetch_message(info["message_id"])
+    await original_message.reply(response)
+    print(f"Response sent to message {message_id}")
+
+def is_permanent_send_error(error):
+    """Errors retrying cannot fix: unknown message id, deleted message, missing permissions."""
+    return isinstance(error, (LookupError, discord.NotFound, discord.Forbidden))
+
+async def send_reply(message_id, response, original_message=None):
+    """
+    Reply to a tracked Discord message.
+    
+    Args:
+        message_id (str): Tracked message id ("discord_<id>")
+        response (str): Reply text
+        original_message (discord.Message): The message itself, if at hand (skips the fetch)
+        
+    Returns:
+        bool: Whether the reply was sent
+    """
+    try:
+        await _send(message_id, response, original_message)
+        return True
+    except Exception as e:
+        print(f"Error responding to Discord message: {e}")
+        metrics.ERRORS.inc(where="discord_send")
         return False
 
+# Function to respond to a message from external code (like admin dashboard)
+async def _respond_to_message(message_id, response):
+    sent = await send_reply(message_id, response)
+    if sent:
+        # Update the message in discord_messages.jsonl to mark as responded
+        await asyncio.to_thread(update_messages, {message_id: {"responded": True, "responded_at": time.time()}})
+    return sent
+
+# Apply field updates to many messages in discord_messages.jsonl with one rewrite
+@profiling.sampled("storage.update_messages")
+def update_messages(updates):
+    """Set fields on stored Discord messages, in the active log or its archive.
+    
+    Args:
+        updates (dict): Maps message_id -> dict of fields to set
+        
+    Returns:
+        set: message_ids that were found and updated
+    """
+    with metrics.storage("messages_rewrite"):
+        matched = storage.update_jsonl(DISCORD_MESSAGES_FILE, "message_id", updates)
+    missing = {k: v for k, v in updates.items() if k not in matched}
+    if missing:
+        # Older drafts may have been rotated into archive/ segments
+        with metrics.storage("messages_rewrite_archived"):
+            matched |= log_archive.update_archived(DISCORD_MESSAGES_FILE, "message_id", missing)
+    return matched
+
 # Non-async wrapper function for the admin dashboard to call
 def respond_to_message(message_id, response):
     """Send a response to a Discord message.
     
     This function is called from the admin dashboard to respond to Discord messages.
-    It updates the message status in the database and adds the message to a queue
-    that will be processed by the Discord bot if it's running.
+    It updates the message status in the database and adds the reply to the
+    outbox, which the Discord bot drains while it is connected.
     
     Args:
         message_id (str): The Discord message ID to respond to
@@ -387,52 +639,114 @@ def respond_to_message(message_id, response):
     Returns:
         bool: True if successful, False otherwise
     """
-    try:
-        # Update the message in discord_messages.jsonl to mark as responded
-        discord_msg_file = Path("discord_messages.jsonl")
-        if discord_msg_file.exists():
-            # Read all messages
-            with open(discord_msg_file, "r") as f:
-                messages = [json.loads(line) for line in f]
-            
-            # Update the responded status
-            updated = False
-            for msg in messages:
-                if msg.get("message_id") == message_id:
-                    msg["responded"] = True
-                    msg["reply"] = response  # Update the reply
-                    updated = True
-            
-            if updated:
-                # Write back all messages
-                with open(discord_msg_file, "w") as f:
-                    for msg in messages:
-                        f.write(json.dumps(msg) + "\n")
-                print(f"Marked message {message_id} as responded in database")
-            else:
-                print(f"Message {message_id} not found in database")
+    return respond_to_messages({message_id: response})
+
+@profiling.sampled("storage.respond_to_messages")
+def respond_to_messages(responses):
+    """Approve many drafts at once.
+    
+    The drafts are marked approved in discord_messages.jsonl with a single
+    rewrite and every reply is added to the outbox in a single write. The bot
+    sends them (with retries) and marks them responded once Discord confirms.
+    Replies that keep failing are dead-lettered and return to the draft queue.
+    
+    Args:
+        responses (dict): Maps message_id -> response text
         
-        # Add the response to the message queue for the Discord bot to process
-        queue_entry = {
-            "message_id": message_id,
-            "response": response,
-            "timestamp": time.time()
-        }
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not responses:
+        return True
+    try:
+        # Mark every message as approved with its (possibly edited) reply; "responded" waits for the send
+        updated = update_messages({
+            message_id: {"approved": True, "reply": response, "delivery_error": None}
+            for message_id, response in responses.items()
+        })
+        print(f"Marked {len(updated)} message(s) as approved in database")
+        missing = set(responses) - updated
+        if missing:
+            print(f"Messages not found in database: {', '.join(sorted(missing))}")
         
-        # Write to the message queue file for the bot to pick up
-        with open(MESSAGE_QUEUE_FILE, "a") as f:
-            f.write(json.dumps(queue_entry) + "\n")
+        # Add the responses to the outbox for the Discord bot to send
+        with metrics.storage("queue_append"):
+            added = get_outbox().enqueue(responses, source="dashboard")
         
-        print(f"Added response to message queue for {message_id}")
+        print(f"Added {len(added)} response(s) to the outbox")
         return True
     except Exception as e:
-        print(f"Error in respond_to_message: {e}")
+        print(f"Error in respond_to_messages: {e}")
+        metrics.ERRORS.inc(where="respond_to_message")
         import traceback
         traceback.print_exc()
         return False
 
+def requeue_replies(entry_ids):
+    """Move dead-lettered replies back to pending and take their messages out of the draft queue again.
+    
+    Args:
+        entry_ids (list): Outbox entry ids
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        box = get_outbox()
+        entries = {e["id"]: e for e in box.entries("dead")}
+        box.requeue(entry_ids)
+        update_messages({entries[i]["message_id"]: {"approved": True, "delivery_error": None}
+                         for i in entry_ids if i in entries})
+        return True
+    except Exception as e:
+        print(f"Error requeueing replies: {e}")
+        metrics.ERRORS.inc(where="requeue_replies")
+        return False
+
+@profiling.sampled("storage.dismiss_messages")
+def dismiss_messages(message_ids):
+    """Remove drafts from the review queue without replying.
+    
+    Args:
+        message_ids (list): message_ids to dismiss
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        update_messages({message_id: {"dismissed": True} for message_id in message_ids})
+        return True
+    except Exception as e:
+        print(f"Error dismissing messages: {e}")
+        metrics.ERRORS.inc(where="dismiss_messages")
+        return False
+
+# Serve local metrics for the admin dashboard / Prometheus scrapes
+def start_metrics_server():
+    port = int(cfg.get("metrics_port", DEFAULT_METRICS_PORT) or 0)
+    if not port:
+        return None
+    try:
+        server = metrics.start_http_server(port)
+        print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        return server
+    except OSError as e:
+        print(f"Could not start metrics server on port {port}: {e}")
+        return None
+
+# Start the incremental policy analysis scheduler if configured
+def start_policy_scheduler():
+    try:
+        import policy_generator
+        return policy_generator.start_policy_scheduler(cfg)
+    except Exception as e:
+        print(f"Could not start policy scheduler: {e}")
+        return None
+
 # Run the bot
 def run_discord_bot():
+    start_metrics_server()
+    start_policy_scheduler()
     while True:
         try:
             print("Starting Discord bot...")
@@ -454,49 +768,26 @@ def run_discord_bot():
             # Wait before attempting to reconnect
             time.sleep(30)
 
-# Process message queue when offline
+# Report the outbox backlog while disconnected
 def process_offline_queue():
-    # Check the message queue file for messages to respond to
-    queue_file = Path(MESSAGE_QUEUE_FILE)
-    if queue_file.exists() and queue_file.stat().st_size > 0:
-        print("Processing message queue while offline...")
-        try:
-            # Read the queue
-            with open(queue_file, 'r') as f:
-                lines = f.readlines()
-                if lines:
-                    print(f"Found {len(lines)} message(s) in queue")
-
-            # Clear the queue immediately
-            with open(queue_file, 'w') as f:
-                f.write("")
-
-            # Mark all messages in discord_messages.jsonl as responded
-            discord_msg_file = Path("discord_messages.jsonl")
-            if discord_msg_file.exists():
-                # Read all messages
-                with open(discord_msg_file, "r") as f:
-                    messages = [json.loads(line) for line in f]
-
-                # Update messages that match the queue IDs
-                message_ids = [json.loads(line).get('message_id') for line in lines]
-                updated = False
-                for msg in messages:
-                    if msg.get("message_id") in message_ids and not msg.get("responded", False):
-                        msg["responded"] = True
-                        updated = True
-                        print(f"Marked message {msg['message_id']} as responded in database (offline mode)")
-
-                if updated:
-                    # Write back all messages
-                    with open(discord_msg_file, "w") as f:
-                        for msg in messages:
-                            f.write(json.dumps(msg) + "\n")
-        except Exception as e:
-            print(f"Error processing offline queue: {e}")
-            import traceback
-            traceback.print_exc()
-
+    """
+    Keep queued replies safe while the bot is disconnected.
+    
+    Nothing can be sent without a connection, so replies stay pending in the
+    outbox (legacy queue entries are moved there) and are sent after the
+    reconnect.
+    """
+    try:
+        migrate_legacy_queue()
+        counts = get_outbox().counts()
+        if counts["pending"] or counts["dead"]:
+            print(f"Outbox while offline: {counts['pending']} pending, {counts['dead']} dead letter(s); "
+                  "pending replies are sent after reconnecting")
+        get_outbox().compact()
+    except Exception as e:
+        print(f"Error processing offline queue: {e}")
+        import traceback
+        traceback.print_exc()
 
 if __name__ == "__main__":
     run_discord_bot()
@@ -0,0 +1,208 @@
+"""
+Memory-mapped Embedding Index for Grovio
+
+The context chunk embeddings used for retrieval, stored once on disk and
+memory-mapped read-only by every process that imports `main` (the Discord
+bot, retrieval_eval.py, benchmark runs). The OS page cache holds one copy of
+the matrix however many processes use it, and a restart embeds only chunks
+whose text changed.
+
+An index is a directory (default context_index/) holding:
+
+- meta.json: chunk content hashes, source files, LLM backend, embedding
+  model, vector dimension, dtype and the names of the array files below
+- vectors.<id>.npy: float32 matrix, or int8 with `embedding_index_int8: true`
+- scales.<id>.npy: per-row float32 scales (int8 only)
+- norms.<id>.npy: float32 L2 norm of every row
+
+Array files get a new id on every rebuild and meta.json is replaced last, so
+readers holding the previous files keep a consistent view. An index written
+by another backend (e.g. the 256-dim stub vectors) is never reused.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+import numpy as np
+
+from storage import atomic_write_text, file_lock
+from utils import embed_batch
+
+INDEX_PATH = "context_index"
+EMBEDDING_MODEL = "text-embedding-3-small"  # Model used by utils.embed / embed_batch
+META_FILE = "meta.json"
+DOT_BLOCK_ROWS = 65536  # Rows dequantized at a time when scoring the whole int8 matrix
+
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def quantize(vectors):
+    """Symmetric per-row int8 quantization; returns (int8 matrix, float32 scales)."""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    q = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales.astype(np.float32)
+
+
+class EmbeddingIndex:
+    """
+    Read-only view of an index directory.
+
+    Indexing (`index[rows]`) and `np.asarray(index)` return float32 rows
+    (dequantized for int8 indexes), so the index can stand in for the
+    embedding matrix.
+
+    Args:
+        path (str): Index directory
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.hashes = self.meta["hashes"]
+        self.dtype = self.meta["dtype"]
+        self.vectors = np.load(os.path.join(path, self.meta["vectors"]), mmap_mode="r")
+        self.norms = np.load(os.path.join(path, self.meta["norms"]), mmap_mode="r")
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = np.load(os.path.join(path, self.meta["scales"]), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def shape(self):
+        return self.vectors.shape
+
+    def __getitem__(self, rows):
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            scales = np.asarray(self.scales[rows], dtype=np.float32)
+            block = block * (scales[..., None] if block.ndim > 1 else scales)
+        return block
+
+    def __array__(self, dtype=None, copy=None):
+        matrix = self[:]
+        return matrix if dtype is None else matrix.astype(dtype)
+
+    def dot(self, q, rows=None):
+        """
+        Dot products of rows with a query vector.
+
+        Args:
+            q (np.array): Query vector
+            rows (array-like): Row indices (default: every row)
+
+        Returns:
+            np.array: float32 scores, one per row
+        """
+        q = np.asarray(q, dtype=np.float32)
+        if rows is not None:
+            return self[rows] @ q
+        if self.scales is None:
+            return self.vectors @ q
+        # Dequantize in blocks so scoring never materializes the whole float matrix
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), DOT_BLOCK_ROWS):
+            out[start:start + DOT_BLOCK_ROWS] = self[start:start + DOT_BLOCK_ROWS] @ q
+        return out
+
+
+def _same_embeddings(meta, backend):
+    """Whether vectors from an index with this metadata are comparable with `backend` query embeddings."""
+    return meta.get("backend") == backend and meta.get("model") == EMBEDDING_MODEL
+
+
+def _matches(meta, hashes, dtype, backend):
+    return meta.get("hashes") == hashes and meta.get("dtype") == dtype and _same_embeddings(meta, backend)
+
+
+def build(path, chunks, client, int8=False, sources=None, backend="openai"):
+    """
+    Write an index for `chunks`, reusing vectors of unchanged chunks from the current index.
+
+    Args:
+        path (str): Index directory
+        chunks (list): Chunk texts
+        client (OpenAI): Client used to embed new chunks
+        int8 (bool): Store int8-quantized vectors
+        sources (list): Source file of each chunk, kept in the metadata
+        backend (str): LLM backend `client` belongs to ("openai" or "stub")
+
+    Returns:
+        EmbeddingIndex: The new index
+    """
+    hashes = [chunk_hash(c) for c in chunks]
+    known = {}
+    try:
+        previous = EmbeddingIndex(path)
+        # Dequantized int8 rows are only good enough to seed another int8 index
+        if _same_embeddings(previous.meta, backend) and (int8 or previous.dtype == "float32"):
+            known = {h: i for i, h in enumerate(previous.hashes)}
+    except (FileNotFoundError, KeyError, ValueError):
+        previous = None
+
+    missing = [i for i, h in enumerate(hashes) if h not in known]
+    new_vectors = embed_batch([chunks[i] for i in missing], client).astype(np.float32) if missing else None
+    if known and new_vectors is not None and new_vectors.shape[1] != previous.shape[1]:
+        # The embedding dimension changed under the same model name; nothing old can be mixed in
+        missing, known = list(range(len(chunks))), {}
+        new_vectors = embed_batch(chunks, client).astype(np.float32)
+    dim = new_vectors.shape[1] if new_vectors is not None else (previous.shape[1] if previous is not None else 0)
+    vectors = np.empty((len(chunks), dim), dtype=np.float32)
+    for row, i in enumerate(missing):
+        vectors[i] = new_vectors[row]
+    for i, h in enumerate(hashes):
+        if h in known:
+            vectors[i] = previous[known[h]]
+    print(f"Embedding index: {len(missing)} chunk(s) embedded, {len(chunks) - len(missing)} reused")
+
+    os.makedirs(path, exist_ok=True)
+    file_id = uuid.uuid4().hex[:12]
+    files = {"vectors": f"vectors.{file_id}.npy", "norms": f"norms.{file_id}.npy"}
+    stored = vectors
+    if int8:
+        stored, scales = quantize(vectors)
+        files["scales"] = f"scales.{file_id}.npy"
+        np.save(os.path.join(path, files["scales"]), scales)
+        vectors = stored.astype(np.float32) * scales[:, None]
+    np.save(os.path.join(path, files["vectors"]), stored)
+    np.save(os.path.join(path, files["norms"]), np.linalg.norm(vectors, axis=1).astype(np.float32))
+    meta = {"backend": backend, "model": EMBEDDING_MODEL, "dtype": "int8" if int8 else "float32", "dim": dim,
+            "hashes": hashes, "sources": sources or [], **files}
+    atomic_write_text(os.path.join(path, META_FILE), json.dumps(meta))
+
+    # Unlink superseded arrays; processes that still map them keep their pages until they reopen
+    current = set(files.values())
+    for old in glob.glob(os.path.join(path, "*.npy")):
+        if os.path.basename(old) not in current:
+            os.remove(old)
+    return EmbeddingIndex(path)
+
+
+def load_or_build(path, chunks, client, int8=False, sources=None, backend="openai"):
+    """
+    Open the index for `chunks`, rebuilding it first if the chunks or format changed.
+
+    Concurrent starts are serialized with a file lock so only one process embeds.
+    An index built with another backend or embedding model is rebuilt.
+
+    Returns:
+        EmbeddingIndex: The index, rows in the order of `chunks`
+    """
+    hashes = [chunk_hash(c) for c in chunks]
+    dtype = "int8" if int8 else "float32"
+    with file_lock(path):
+        try:
+            index = EmbeddingIndex(path)
+            if _matches(index.meta, hashes, dtype, backend):
+                return index
+        except (FileNotFoundError, KeyError, ValueError):
+            pass
+        return build(path, chunks, client, int8, sources, backend)
@@ -0,0 +1,182 @@
+"""
+Background Jobs for Grovio
+
+A small job runner for slow work started from the admin dashboard, such as
+policy suggestion generation. Jobs run on a thread pool and their state is
+kept in a JSON job table (jobs.json) so any dashboard session, rerun or
+process can look up a job's status and progress.
+
+Submitting a job of a kind that is already queued or running returns the
+existing job instead of starting a second one. Jobs left "running" by a
+process that has since exited are marked failed the next time the table is
+read.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import atomic_write_text, file_lock
+
+JOBS_PATH = "jobs.json"
+MAX_FINISHED_JOBS = 50
+ACTIVE_STATUSES = ("queued", "running")
+
+# Job ids executing in this process, across runner instances
+_local_jobs = set()
+_local_lock = threading.Lock()
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class JobRunner:
+    """
+    Thread-pool job runner with a persisted job table.
+
+    Args:
+        path (str): Job table file
+        max_workers (int): Jobs that may run at the same time in this process
+    """
+
+    def __init__(self, path=JOBS_PATH, max_workers=2):
+        self.path = path
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grovio-job")
+
+    # ---------- job table ------------------------------------------------
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self, jobs):
+        finished = sorted((j for j in jobs.values() if j["status"] not in ACTIVE_STATUSES),
+                          key=lambda j: j.get("finished") or 0, reverse=True)
+        for job in finished[MAX_FINISHED_JOBS:]:
+            del jobs[job["id"]]
+        atomic_write_text(self.path, json.dumps(jobs, indent=2))
+
+    def _recover(self, jobs):
+        """Fail active jobs whose owning process (or, in this process, whose thread) is gone."""
+        changed = False
+        with _local_lock:
+            local = set(_local_jobs)
+        for job in jobs.values():
+            if job["status"] not in ACTIVE_STATUSES:
+                continue
+            owner = job.get("pid")
+            orphaned = job["id"] not in local if owner == os.getpid() else not _pid_alive(owner)
+            if orphaned:
+                job.update(status="failed", error="Interrupted: the process running this job exited",
+                           finished=time.time())
+                changed = True
+        return changed
+
+    def _update(self, job_id, **fields):
+        with file_lock(self.path):
+            jobs = self._load()
+            if job_id in jobs:
+                jobs[job_id].update(fields)
+                self._save(jobs)
+
+    # ---------- public API -----------------------------------------------
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, progress=..., **kwargs)` unless a job of `kind` is already active.
+
+        `fn` receives a `progress(fraction, message)` callback and its return
+        value is stored as the job result, so it should be JSON-serializable.
+
+        Args:
+            kind (str): Job type used for deduplication, e.g. "policy_generation"
+            fn (callable): Work to run
+
+        Returns:
+            dict: The new job, or the already active job of the same kind
+        """
+        with file_lock(self.path):
+            jobs = self._load()
+            changed = self._recover(jobs)
+            active = [j for j in jobs.values() if j["kind"] == kind and j["status"] in ACTIVE_STATUSES]
+            if active:
+                if changed:
+                    self._save(jobs)
+                return min(active, key=lambda j: j["created"])
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "kind": kind,
+                "status": "queued",
+                "progress": 0.0,
+                "message": "Queued",
+                "created": time.time(),
+                "started": None,
+                "finished": None,
+                "pid": os.getpid(),
+                "result": None,
+                "error": None,
+            }
+            jobs[job["id"]] = job
+            self._save(jobs)
+            with _local_lock:
+                _local_jobs.add(job["id"])
+
+        self._pool.submit(self._run, job["id"], fn, args, kwargs)
+        return job
+
+    def _run(self, job_id, fn, args, kwargs):
+        def progress(fraction, message=""):
+            self._update(job_id, progress=max(0.0, min(1.0, float(fraction))), message=message)
+
+        self._update(job_id, status="running", started=time.time(), message="Running")
+        try:
+            result = fn(*args, progress=progress, **kwargs)
+            try:
+                json.dumps(result)
+            except (TypeError, ValueError):
+                result = str(result)
+            self._update(job_id, status="succeeded", progress=1.0, message="Done",
+                         result=result, finished=time.time())
+        except Exception as e:
+            print(f"Error in background job {job_id}: {e}")
+            self._update(job_id, status="failed", error=str(e), finished=time.time())
+        finally:
+            with _local_lock:
+                _local_jobs.discard(job_id)
+
+    def get(self, job_id):
+        """Return a job by id, or None."""
+        return self.jobs().get(job_id)
+
+    def jobs(self):
+        """Return the job table, failing any orphaned active jobs first."""
+        with file_lock(self.path):
+            jobs = self._load()
+            if self._recover(jobs):
+                self._save(jobs)
+        return jobs
+
+    def latest(self, kind):
+        """Return the most recently created job of `kind`, or None."""
+        matching = [j for j in self.jobs().values() if j["kind"] == kind]
+        return max(matching, key=lambda j: j["created"]) if matching else None
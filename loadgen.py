@@ -0,0 +1,521 @@
+"""
+Synthetic Discord Load Generator for Grovio
+
+Drives `discord_bot.on_message` with fake Discord messages, channels and
+authors, so the whole path can be load-tested without a live guild. The path
+is: pre-filter, pipeline, message log, outbox, then reply. Outbound replies
+go to a local stub that can add latency and fail a fraction of sends. LLM
+calls use the stand-in backend from stub_llm.py.
+
+Arrival shapes:
+- poisson / uniform: exponential or fixed gaps at `--rate`
+- burst: `--burst-size` messages at once, with the same mean rate
+- ramp: the arrival rate rises linearly from 0 to `--rate`
+
+The report covers:
+- end-to-end latency: handler (arrival until `on_message` returns) and reply
+  (arrival until the reply stub receives the reply);
+- peak and mean thread and task counts;
+- bytes read and written by the process;
+- storage operation timings from the metrics registry;
+- replies that were lost (queued but never delivered nor dead-lettered) or
+  delivered more than once.
+
+Like benchmark.py, the run happens in a scratch working directory, so real
+logs are never touched.
+
+Usage:
+    python loadgen.py --messages 500 --rate 50 --shape burst --burst-size 25
+    python loadgen.py --mode passive --approve --send-failure-rate 0.1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from benchmark import (REPO_DIR, RESULTS_DIR, arrival_offsets, git_commit, load_replay_messages, prepare_workdir,
+                       summarize, workdir_env)
+
+SAMPLE_QUESTIONS = [
+    "How do I reset my Grovio password?",
+    "What plans does Grovio offer for small teams?",
+    "Can I export my data from Grovio to CSV?",
+    "Is there a mobile app for Grovio and where can I get it?",
+    "How do I invite a teammate to my workspace?",
+    "Why was my card charged twice this month?",
+    "Does Grovio integrate with Slack or Discord?",
+    "How can I cancel my subscription before renewal?",
+]
+CHATTER = ["gm", "lol", "nice job team", "🔥🔥", "lmao", "https://example.com"]
+SAMPLE_INTERVAL = 0.05      # Seconds between thread/task count samples
+DRAIN_INTERVAL = 0.05       # Seconds between outbox drains once ingestion is done
+MESSAGE_ID_BASE = 1_200_000_000_000_000_000
+
+
+class FakeUser:
+    """Author (or bot account) with the attributes the bot reads."""
+
+    def __init__(self, user_id, name, bot=False):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+    def __str__(self):
+        return self.name
+
+
+class FakeChannel:
+    """Channel resolving message ids for replies sent from the outbox."""
+
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+        self.messages = {}
+
+    async def fetch_message(self, message_id):
+        if message_id not in self.messages:
+            raise LookupError(f"Unknown message {message_id}")
+        return self.messages[message_id]
+
+
+class FakeMessage:
+    """Incoming message; `reply` goes to the reply stub."""
+
+    def __init__(self, message_id, content, author, channel, sink, mentions=()):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.mentions = list(mentions)
+        self.reference = None
+        self._sink = sink
+        channel.messages[message_id] = self
+
+    async def reply(self, content):
+        return await self._sink.send(self, content)
+
+
+class ReplySink:
+    """
+    Stand-in for Discord's send endpoint.
+
+    Args:
+        latency (float): Seconds per send
+        failure_rate (float): Fraction of sends that raise ConnectionError (retried by the outbox)
+        seed (int): Random seed for failures
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.delivered = {}     # message id -> perf_counter of every delivery
+        self.failures = 0
+
+    async def send(self, message, content):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise ConnectionError("Simulated Discord send failure")
+        self.delivered.setdefault(message.id, []).append(time.perf_counter())
+        return content
+
+
+class ResourceSampler:
+    """Samples the thread count and event-loop task count while the load runs."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.threads = []
+        self.tasks = []
+
+    async def run(self):
+        while True:
+            self.threads.append(threading.active_count())
+            self.tasks.append(len(asyncio.all_tasks()))
+            await asyncio.sleep(self.interval)
+
+    def summary(self):
+        def stats(values):
+            return {"peak": max(values), "mean": sum(values) / len(values)} if values else {}
+        return {"threads": stats(self.threads), "tasks": stats(self.tasks)}
+
+
+def io_counters():
+    """Process I/O counters from /proc/self/io (Linux); None elsewhere."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return None
+
+
+def load_offsets(count, rate, shape, burst_size=10, seed=0):
+    """
+    Compute when each message arrives, relative to the start.
+
+    Args:
+        count (int): Number of messages
+        rate (float): Mean arrivals per second (peak rate for "ramp"); 0 sends everything at once
+        shape (str): "poisson", "uniform", "burst" or "ramp"
+        burst_size (int): Messages per burst
+        seed (int): Random seed for Poisson schedules
+
+    Returns:
+        list: Offsets in seconds
+    """
+    if rate <= 0 or shape in ("poisson", "uniform"):
+        return arrival_offsets(count, rate, shape if shape in ("poisson", "uniform") else "poisson", seed)
+    if shape == "burst":
+        gap = burst_size / rate
+        return [(i // burst_size) * gap for i in range(count)]
+    # Ramp: rate(t) grows linearly to `rate`, so arrivals up to t are rate * t^2 / (2 * duration)
+    duration = 2.0 * count / rate
+    return [duration * (i / count) ** 0.5 for i in range(count)]
+
+
+def make_messages(texts, sink, authors=20, channels=3, chatter=0.0, mention_rate=0.1, bot_user=None, seed=0):
+    """
+    Build fake messages from message texts.
+
+    Args:
+        texts (list): Message contents
+        sink (ReplySink): Where replies go
+        authors (int): Distinct fake authors
+        channels (int): Distinct fake channels
+        chatter (float): Fraction of messages replaced by chatter the pre-filter should skip
+        mention_rate (float): Fraction of messages mentioning the bot
+        bot_user (FakeUser): The bot account, for mentions
+        seed (int): Random seed
+
+    Returns:
+        tuple: (messages, {channel id: FakeChannel})
+    """
+    rng = random.Random(seed)
+    users = [FakeUser(1000 + i, f"loadgen_user{i}") for i in range(authors)]
+    channel_map = {2000 + i: FakeChannel(2000 + i, f"loadgen-{i}") for i in range(channels)}
+    channel_list = list(channel_map.values())
+    ids = itertools.count(MESSAGE_ID_BASE)
+    messages = []
+    for text in texts:
+        if rng.random() < chatter:
+            text = rng.choice(CHATTER)
+        mentions = [bot_user] if bot_user is not None and rng.random() < mention_rate else []
+        messages.append(FakeMessage(next(ids), text, rng.choice(users), rng.choice(channel_list), sink, mentions))
+    return messages, channel_map
+
+
+def prepare_config(workdir, mode, max_concurrent=None, backoff=0.2):
+    """Adjust the scratch config for a load run (stub backend, no metrics server, fast retries)."""
+    path = Path(workdir) / "config.yaml"
+    with open(path, "r") as f:
+        cfg = yaml.safe_load(f) or {}
+    cfg.update({"mode": mode, "llm_backend": "stub", "metrics_port": 0, "outbox_backoff_seconds": backoff})
+    if max_concurrent:
+        cfg["max_concurrent_messages"] = max_concurrent
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+
+
+def read_jsonl(path):
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return rows
+
+
+async def _drive(bot_module, messages, offsets, sink, approve, drain_timeout):
+    """Send every message on schedule, optionally approve the drafts, then drain the outbox."""
+    sampler = ResourceSampler()
+    sampler_task = asyncio.create_task(sampler.run())
+    arrivals, handled, errors = {}, {}, []
+
+    async def deliver_message(message, scheduled_at):
+        arrivals[message.id] = scheduled_at
+        try:
+            await bot_module.on_message(message)
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+        handled[message.id] = time.perf_counter()
+
+    start = time.perf_counter()
+    tasks = []
+    for message, offset in zip(messages, offsets):
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(deliver_message(message, start + offset)))
+    await asyncio.gather(*tasks)
+    ingested = time.perf_counter()
+
+    if approve:
+        # Approve every pending draft the way the dashboard does (a worker thread, one batch)
+        drafts = {r["message_id"]: r["reply"] for r in read_jsonl(bot_module.DISCORD_MESSAGES_FILE)
+                  if r.get("processed") and not r.get("responded") and not r.get("approved") and r.get("reply")}
+        await asyncio.to_thread(bot_module.respond_to_messages, drafts)
+
+    # Retries wait for their backoff, so keep draining until nothing is pending or time runs out
+    deadline = time.perf_counter() + drain_timeout
+    box = bot_module.get_outbox()
+    while time.perf_counter() < deadline:
+        await bot_module.drain_outbox()
+        if not (await asyncio.to_thread(box.counts))["pending"]:
+            break
+        await asyncio.sleep(DRAIN_INTERVAL)
+    finished = time.perf_counter()
+
+    sampler_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await sampler_task
+    return {"start": start, "ingested": ingested, "finished": finished, "arrivals": arrivals,
+            "handled": handled, "errors": errors, "resources": sampler.summary()}
+
+
+def run_load(texts, rate=20.0, shape="poisson", burst_size=10, mode="active", approve=False, chatter=0.0,
+             authors=20, channels=3, max_concurrent=None, llm_latency=None, embed_latency=None,
+             moderation_latency=None, send_latency=0.0, send_failure_rate=0.0, drain_timeout=30.0, seed=0):
+    """
+    Push synthetic Discord traffic through the bot's handlers and collect the results.
+
+    Args:
+        texts (list): Message texts to send
+        rate (float): Mean arrival rate in messages/second (0 = all at once)
+        shape (str): Arrival shape, "poisson", "uniform", "burst" or "ramp"
+        burst_size (int): Messages per burst for the "burst" shape
+        mode (str): Bot mode for the run, "active" (auto-send) or "passive" (drafts only)
+        approve (bool): Approve every draft through the dashboard path after ingestion
+        chatter (float): Fraction of messages replaced by chatter
+        authors (int): Distinct fake authors
+        channels (int): Distinct fake channels
+        max_concurrent (int): Override `max_concurrent_messages`
+        llm_latency (float): Stub completion latency in seconds
+        embed_latency (float): Stub embedding latency in seconds
+        moderation_latency (float): Stub moderation latency in seconds
+        send_latency (float): Reply stub latency in seconds
+        send_failure_rate (float): Fraction of reply sends that fail
+        drain_timeout (float): Seconds to keep retrying queued replies after ingestion
+        seed (int): Random seed
+
+    Returns:
+        dict: Load test results
+    """
+    workdir = prepare_workdir()
+    prepare_config(workdir, mode, max_concurrent)
+    old_cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_DIR))
+    try:
+        with workdir_env(workdir, "stub"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                # Import (and embed the context) before the clock starts
+                import discord_bot
+                import main
+                import metrics
+            client = main.get_async_client()
+            for attr, value in (("latency", llm_latency), ("embed_latency", embed_latency),
+                                ("moderation_latency", moderation_latency)):
+                if value is not None:
+                    setattr(client, attr, value)
+
+            bot_user = FakeUser(999, "GrovioBot", bot=True)
+            sink = ReplySink(send_latency, send_failure_rate, seed)
+            messages, channel_map = make_messages(texts, sink, authors, channels, chatter, bot_user=bot_user, seed=seed)
+            offsets = load_offsets(len(messages), rate, shape, burst_size, seed)
+
+            async def no_commands(message):
+                return None
+
+            io_before = io_counters()
+            with contextlib.redirect_stdout(io.StringIO()), \
+                    mock.patch.object(type(discord_bot.bot), "user", new_callable=mock.PropertyMock, return_value=bot_user), \
+                    mock.patch.object(discord_bot.bot, "process_commands", no_commands), \
+                    mock.patch.object(discord_bot.bot, "get_channel", channel_map.get):
+                run = asyncio.run(_drive(discord_bot, messages, offsets, sink, approve, drain_timeout))
+            io_after = io_counters()
+
+            records = {r["message_id"]: r for r in read_jsonl(discord_bot.DISCORD_MESSAGES_FILE)}
+            skipped = {r["message_id"] for r in read_jsonl("skipped_messages.jsonl")}
+            entries = discord_bot.get_outbox().entries()
+            storage_ops = metrics.summarize_histograms(metrics.parse_exposition(metrics.render()),
+                                                       "grovio_storage_seconds", "op")
+            files = {str(p.relative_to(workdir)): p.stat().st_size for p in Path(workdir).rglob("*")
+                     if p.is_file() and p.parts[len(Path(workdir).parts)] != "context"}
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    by_id = {f"discord_{m.id}": m for m in messages}
+    queued = {e["message_id"] for e in entries}
+    dead = {e["message_id"] for e in entries if e["status"] == "dead"}
+    delivered = {f"discord_{mid}": times for mid, times in sink.delivered.items()}
+    lost = sorted(queued - dead - set(delivered))
+    duplicated = sorted(mid for mid, times in delivered.items() if len(times) > 1)
+    unrecorded = sorted(set(by_id) - skipped - set(records))
+
+    handler_latency = [run["handled"][m.id] - run["arrivals"][m.id] for m in messages if m.id in run["handled"]]
+    reply_latency = [times[0] - run["arrivals"][by_id[mid].id] for mid, times in delivered.items() if mid in by_id]
+    io_volume = None
+    if io_before and io_after:
+        io_volume = {key: io_after[key] - io_before[key] for key in io_after if key in io_before}
+
+    elapsed = run["finished"] - run["start"]
+    ingest_elapsed = run["ingested"] - run["start"]
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "rate": rate,
+            "shape": shape,
+            "burst_size": burst_size,
+            "mode": mode,
+            "approve": approve,
+            "chatter": chatter,
+            "max_concurrent": max_concurrent,
+            "llm_latency": llm_latency,
+            "embed_latency": embed_latency,
+            "moderation_latency": moderation_latency,
+            "send_latency": send_latency,
+            "send_failure_rate": send_failure_rate,
+        },
+        "messages": len(messages),
+        "skipped": len(skipped),
+        "recorded": len(records),
+        "errors": len(run["errors"]),
+        "error_samples": run["errors"][:5],
+        "elapsed_s": elapsed,
+        "ingest_s": ingest_elapsed,
+        "throughput_rps": len(run["handled"]) / ingest_elapsed if ingest_elapsed > 0 else 0.0,
+        "replies": {
+            "queued": len(queued),
+            "delivered": len(delivered),
+            "send_failures": sink.failures,
+            "dead": len(dead),
+            "lost": len(lost),
+            "duplicated": len(duplicated),
+            "lost_samples": lost[:5],
+            "duplicated_samples": duplicated[:5],
+        },
+        "unrecorded": len(unrecorded),
+        "handler": summarize(handler_latency),
+        "reply": summarize(reply_latency),
+        "resources": run["resources"],
+        "io": io_volume,
+        "files": files,
+        "storage_ops": storage_ops,
+    }
+
+
+def print_report(results):
+    """Print throughput, latency, resource and delivery figures for a load run."""
+    replies = results["replies"]
+    print(f"Handled {results['messages']} messages in {results['ingest_s']:.2f}s "
+          f"({results['throughput_rps']:.2f} msg/s), {results['skipped']} skipped by the pre-filter, "
+          f"{results['recorded']} recorded, {results['errors']} handler error(s)")
+    print(f"Replies: {replies['queued']} queued, {replies['delivered']} delivered, "
+          f"{replies['send_failures']} failed send(s), {replies['dead']} dead-lettered, "
+          f"{replies['lost']} lost, {replies['duplicated']} duplicated; "
+          f"{results['unrecorded']} message(s) never recorded")
+    print(f"{'latency':<17}" + "".join(f"{h:>12}" for h in ("count", "p50 ms", "p95 ms", "p99 ms")))
+    for name in ("handler", "reply"):
+        summary = results[name]
+        if summary.get("count"):
+            print(f"{name:<17}{summary['count']:>12}" + "".join(f"{summary[f'p{p}_ms']:>12.1f}" for p in (50, 95, 99)))
+    resources = results["resources"]
+    if resources.get("threads"):
+        print(f"Threads: peak {resources['threads']['peak']}, mean {resources['threads']['mean']:.1f}; "
+              f"tasks: peak {resources['tasks']['peak']}, mean {resources['tasks']['mean']:.1f}")
+    if results["io"]:
+        io_volume = results["io"]
+        print(f"File I/O: {io_volume.get('rchar', 0) / 1024:.1f} KiB read, {io_volume.get('wchar', 0) / 1024:.1f} KiB written "
+              f"({io_volume.get('syscr', 0)} read / {io_volume.get('syscw', 0)} write calls)")
+    if results["storage_ops"]:
+        print(f"{'storage op':<28}{'count':>8}{'mean ms':>10}{'p95 ms':>10}")
+        for row in results["storage_ops"]:
+            print(f"{row['op']:<28}{row['count']:>8}{row['mean'] * 1000:>10.2f}{row['p95'] * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the Discord bot's handlers with synthetic traffic.")
+    parser.add_argument("--messages", type=int, default=200, help="Messages to send (default: 200)")
+    parser.add_argument("--rate", type=float, default=20.0, help="Mean arrival rate in msg/s; 0 = all at once")
+    parser.add_argument("--shape", choices=["poisson", "uniform", "burst", "ramp"], default="poisson")
+    parser.add_argument("--burst-size", type=int, default=10, help="Messages per burst for --shape burst")
+    parser.add_argument("--mode", choices=["active", "passive"], default="active", help="Bot mode for the run")
+    parser.add_argument("--approve", action="store_true", help="Approve every draft via the dashboard path afterwards")
+    parser.add_argument("--recorded", action="store_true", help="Use recorded messages instead of sample questions")
+    parser.add_argument("--chatter", type=float, default=0.1, help="Fraction of chatter messages (default: 0.1)")
+    parser.add_argument("--authors", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--max-concurrent", type=int, default=None, help="Override max_concurrent_messages")
+    parser.add_argument("--llm-latency", type=float, default=None, help="Stub completion latency in seconds")
+    parser.add_argument("--embed-latency", type=float, default=None, help="Stub embedding latency in seconds")
+    parser.add_argument("--moderation-latency", type=float, default=None, help="Stub moderation latency in seconds")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="Reply stub latency in seconds")
+    parser.add_argument("--send-failure-rate", type=float, default=0.0, help="Fraction of reply sends that fail")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="Seconds to retry queued replies afterwards")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Results JSON path (default: bench_results/loadgen-<commit>-<time>.json)")
+    args = parser.parse_args()
+
+    pool = load_replay_messages() if args.recorded else SAMPLE_QUESTIONS
+    if not pool:
+        print("No recorded messages found in store.jsonl or discord_messages.jsonl")
+        return 1
+    texts = [pool[i % len(pool)] for i in range(args.messages)]
+
+    results = run_load(
+        texts,
+        rate=args.rate,
+        shape=args.shape,
+        burst_size=args.burst_size,
+        mode=args.mode,
+        approve=args.approve,
+        chatter=args.chatter,
+        authors=args.authors,
+        channels=args.channels,
+        max_concurrent=args.max_concurrent,
+        llm_latency=args.llm_latency,
+        embed_latency=args.embed_latency,
+        moderation_latency=args.moderation_latency,
+        send_latency=args.send_latency,
+        send_failure_rate=args.send_failure_rate,
+        drain_timeout=args.drain_timeout,
+        seed=args.seed,
+    )
+    print_report(results)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"loadgen-{results['meta']['commit']}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+    # Lost or duplicated replies fail the run, so it can gate a deploy
+    return 1 if results["replies"]["lost"] or results["replies"]["duplicated"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Log Archive for Grovio
+
+Size/age based rotation for the append-only JSONL logs (store.jsonl,
+discord_messages.jsonl). When the active file passes `log_rotate_mb`
+megabytes, or its oldest record is older than `log_rotate_hours`, it is sealed
+into a gzip segment under archive/ and a fresh active file is started, so
+hot-path reads and rewrites only ever touch a small file.
+
+Each log has an index (archive/<name>.index.json) describing its segments,
+oldest first:
+
+    {"file": "discord_messages.000003.jsonl.gz", "start_ts": ..., "end_ts": ...,
+     "end_eligible_ts": ..., "records": 1200, "pending": 4, "bloom": {...}}
+
+Readers use the timestamp range (and `end_eligible_ts`, the latest time a
+record became a finished conversation, see `eligible_ts`) to skip old
+segments, the pending count to skip
+segments with no drafts awaiting review, and the bloom filter of message_ids
+to find the one segment an update has to rewrite.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import math
+import os
+import time
+
+from storage import atomic_write_text, file_lock, iter_jsonl_reverse, append_jsonl
+
+ARCHIVE_DIR = "archive"
+DEFAULT_ROTATE_MB = 8
+DEFAULT_ROTATE_HOURS = 0  # 0 disables age-based rotation
+BLOOM_FP_RATE = 0.01
+KEY_FIELD = "message_id"
+
+
+class BloomFilter:
+    """
+    Bit-array bloom filter using double hashing over one blake2b digest.
+
+    Args:
+        n_bits (int): Size of the bit array
+        n_hashes (int): Bits set per key
+        bits (bytearray): Existing bit array, if restoring
+    """
+
+    def __init__(self, n_bits, n_hashes, bits=None):
+        self.n_bits = max(8, n_bits)
+        self.n_hashes = max(1, n_hashes)
+        self.bits = bits if bits is not None else bytearray((self.n_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, n, fp_rate=BLOOM_FP_RATE):
+        """Size a filter for `n` keys at the given false-positive rate."""
+        n = max(1, n)
+        n_bits = int(math.ceil(-n * math.log(fp_rate) / (math.log(2) ** 2)))
+        n_hashes = int(round(n_bits / n * math.log(2)))
+        return cls(n_bits, n_hashes)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, key):
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(key))
+
+    def to_dict(self):
+        return {"n_bits": self.n_bits, "n_hashes": self.n_hashes,
+                "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["n_bits"], data["n_hashes"], bytearray(base64.b64decode(data["bits"])))
+
+
+def is_pending(record):
+    """A Discord draft still awaiting review (not approved, sent or dismissed)."""
+    return (KEY_FIELD in record and not record.get("responded", False) and not record.get("approved", False)
+            and not record.get("dismissed", False))
+
+
+def eligible_ts(record):
+    """When a record became a finished conversation: `responded_at` for approved Discord drafts, else `ts`."""
+    return record.get("responded_at") or record.get("ts", 0)
+
+
+def archive_dir(path):
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ARCHIVE_DIR)
+
+
+def index_path(path):
+    return os.path.join(archive_dir(path), f"{os.path.basename(path)}.index.json")
+
+
+def load_segments(path):
+    """Return the archived segments of a log, oldest first."""
+    try:
+        with open(index_path(path), "r") as f:
+            return json.load(f).get("segments", [])
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def _save_segments(path, segments):
+    os.makedirs(archive_dir(path), exist_ok=True)
+    atomic_write_text(index_path(path), json.dumps({"segments": segments}))
+
+
+def index_version(path):
+    """Cheap change marker for the archive index (mtime, size), or None without archives."""
+    try:
+        st = os.stat(index_path(path))
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _segment_meta(records):
+    """Timestamp range, record count, pending count and key bloom filter for a segment."""
+    latest = {}
+    for record in records:
+        if KEY_FIELD in record:
+            latest[record[KEY_FIELD]] = record
+    bloom = BloomFilter.for_capacity(len(latest))
+    for key in latest:
+        bloom.add(key)
+    timestamps = [r.get("ts", 0) for r in records]
+    return {
+        "start_ts": min(timestamps) if timestamps else 0,
+        "end_ts": max(timestamps) if timestamps else 0,
+        "end_eligible_ts": max((eligible_ts(r) for r in records), default=0),
+        "records": len(records),
+        "pending": sum(1 for r in latest.values() if is_pending(r)),
+        "bloom": bloom.to_dict(),
+    }
+
+
+def _parse_lines(lines):
+    records = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def _write_segment(target, records):
+    """Write records to a gzip segment and atomically move it into place."""
+    tmp = f"{target}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    os.replace(tmp, target)
+
+
+def read_segment(path, segment):
+    """Load every record of an archived segment, in file order."""
+    with gzip.open(os.path.join(archive_dir(path), segment["file"]), "rt", encoding="utf-8") as f:
+        return _parse_lines(f)
+
+
+def _first_ts(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    return json.loads(line).get("ts")
+                except json.JSONDecodeError:
+                    return None
+    return None
+
+
+def rotate(path, max_bytes, max_age_seconds=0):
+    """
+    Seal the active log into a gzip segment if it passed a size or age threshold.
+
+    Args:
+        path (str): Active JSONL log
+        max_bytes (int): Size threshold (0 disables)
+        max_age_seconds (float): Age threshold for the oldest record (0 disables)
+
+    Returns:
+        dict: The new segment's index entry, or None if no rotation was needed
+    """
+    with file_lock(path):
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        if not size:
+            return None
+        due = bool(max_bytes) and size >= max_bytes
+        if not due and max_age_seconds:
+            first = _first_ts(path)
+            due = first is not None and time.time() - first >= max_age_seconds
+        if not due:
+            return None
+
+        with open(path, "r") as f:
+            records = _parse_lines(f)
+        segments = load_segments(path)
+        name = os.path.basename(path)
+        stem = name[:-len(".jsonl")] if name.endswith(".jsonl") else name
+        seq = len(segments) + 1
+        segment = {"file": f"{stem}.{seq:06d}.jsonl.gz", **_segment_meta(records)}
+        os.makedirs(archive_dir(path), exist_ok=True)
+        _write_segment(os.path.join(archive_dir(path), segment["file"]), records)
+        _save_segments(path, segments + [segment])
+        # Replace (rather than truncate) so tail readers see a new file and reset
+        atomic_write_text(path, "")
+    print(f"Rotated {path}: {segment['records']} records archived to {segment['file']}")
+    return segment
+
+
+def maybe_rotate(path, cfg=None):
+    """Rotate `path` according to `log_rotate_mb` / `log_rotate_hours` in the config."""
+    cfg = cfg or {}
+    max_bytes = int(float(cfg.get("log_rotate_mb", DEFAULT_ROTATE_MB) or 0) * 1024 * 1024)
+    max_age = float(cfg.get("log_rotate_hours", DEFAULT_ROTATE_HOURS) or 0) * 3600
+    if not max_bytes and not max_age:
+        return None
+    try:
+        return rotate(path, max_bytes, max_age)
+    except Exception as e:
+        print(f"Error rotating {path}: {e}")
+        return None
+
+
+def append_records(path, records, cfg=None):
+    """
+    Append records to a rotating log.
+
+    Rotation is checked before the append, so the records just written are
+    always in the active file for callers that read them back.
+    """
+    maybe_rotate(path, cfg)
+    append_jsonl(path, records)
+
+
+def iter_log_reverse(path, since_ts=None):
+    """
+    Yield records of a log newest first: the active file, then archived segments.
+
+    Args:
+        path (str): Active JSONL log
+        since_ts (float): Skip segments with no record written or responded to after this timestamp
+
+    Yields:
+        dict: Parsed records
+    """
+    yield from iter_jsonl_reverse(path)
+    for segment in reversed(load_segments(path)):
+        # A draft approved late makes an old segment relevant again, so skip rather than stop
+        last = max(segment.get("end_ts", 0), segment.get("end_eligible_ts", 0))
+        if since_ts is not None and last <= since_ts:
+            continue
+        try:
+            records = read_segment(path, segment)
+        except (OSError, EOFError) as e:
+            print(f"Error reading archive segment {segment.get('file')}: {e}")
+            continue
+        yield from reversed(records)
+
+
+def iter_pending_archived(path):
+    """Yield records from archived segments that still hold pending drafts, oldest segment first."""
+    for segment in load_segments(path):
+        if not segment.get("pending"):
+            continue
+        try:
+            yield from read_segment(path, segment)
+        except (OSError, EOFError) as e:
+            print(f"Error reading archive segment {segment.get('file')}: {e}")
+
+
+def update_archived(path, key, updates):
+    """
+    Apply field updates to records in archived segments.
+
+    Only segments whose bloom filter may contain one of the keys are
+    decompressed and rewritten; their pending counts are refreshed.
+
+    Args:
+        path (str): Active JSONL log the archive belongs to
+        key (str): Field identifying a record (must be KEY_FIELD for bloom lookups)
+        updates (dict): Maps key value -> dict of fields to set
+
+    Returns:
+        set: Key values that matched at least one archived record
+    """
+    matched = set()
+    if not updates:
+        return matched
+    with file_lock(path):
+        segments = load_segments(path)
+        changed = False
+        for segment in reversed(segments):
+            remaining = [k for k in updates if k not in matched]
+            if not remaining:
+                break
+            bloom = BloomFilter.from_dict(segment["bloom"])
+            if key == KEY_FIELD and not any(k in bloom for k in remaining):
+                continue
+            records = read_segment(path, segment)
+            hit = False
+            for record in records:
+                fields = updates.get(record.get(key))
+                if fields is not None and record.get(key) not in matched:
+                    record.update(fields)
+                    hit = True
+            if hit:
+                matched.update(r.get(key) for r in records if r.get(key) in updates)
+                _write_segment(os.path.join(archive_dir(path), segment["file"]), records)
+                segment.update(_segment_meta(records))
+                changed = True
+        if changed:
+            _save_segments(path, segments)
+    return matched
+
+
+def clear_archive(path):
+    """Delete every archived segment of a log and its index."""
+    with file_lock(path):
+        for segment in load_segments(path):
+            try:
+                os.remove(os.path.join(archive_dir(path), segment["file"]))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(index_path(path))
+        except FileNotFoundError:
+            pass
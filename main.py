@@ -1,24 +1,43 @@
 # main.py
-import json, yaml, time
+import asyncio, contextvars, json, os, re, yaml, time, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from pathlib import Path
-from openai import OpenAI
+from types import SimpleNamespace
 import numpy as np
 from rank_bm25 import BM25Okapi
-from utils import embed, cosine_sim      # 6–8 LOC helpers
+import accounting
+import embedding_index
+import log_archive
+import metrics
+import profiling
+from canned import CannedReplyIndex, CANNED_CONF, CANNED_RISK, DEFAULT_THRESHOLD as CANNED_THRESHOLD
+from metrics import stage
+from utils import embed, embed_async, llm_backend, make_async_client, make_client, mmr      # 6–8 LOC helpers
+
+STORE_PATH = "store.jsonl"
+MMR_LAMBDA = 0.7            # Retrieval relevance vs. diversity (1.0 = plain top-k)
+MMR_CANDIDATES_PER_K = 4    # MMR re-ranks the best top_k * this many chunks
+MMR_MAX_SIMILARITY = None   # Chunks this similar to an already picked chunk are dropped (None = keep all)
+_FROM_CONFIG = object()     # Sentinel: read the setting from the config
+INPUT_MODERATION_WORKERS = 8   # Background threads for input moderation calls
+INPUT_MODERATION_TIMEOUT = 10  # Seconds to wait for the input verdict once the reply is ready
+ROUTE_MAX_WORDS = 40        # Longer messages always go to the main model
+ROUTE_MIN_RETRIEVAL = 0.5   # Best-chunk cosine needed to try the fast model
 
 cfg = yaml.safe_load(open("config.yaml"))
-client = OpenAI(api_key=cfg["openai_api_key"])
+profiling.configure(cfg)
+client = make_client(cfg)
 
 # 1. load & embed context once
 chunks = []
-embeds = []
+chunk_sources = []
 chunk_tokens = []
 
 for p in Path("context").glob("*.md"):
     text = p.read_text()
     for chunk in text.split("\n\n"):
         chunks.append(chunk)
-        embeds.append(embed(chunk, client))
+        chunk_sources.append(p.name)
         # Tokenize for BM25
         tokens = chunk.lower().split()
         chunk_tokens.append(tokens)
@@ -26,9 +45,38 @@ for p in Path("context").glob("*.md"):
 # Create BM25 index
 bm25 = BM25Okapi(chunk_tokens)
 
+# Embeddings live in a memory-mapped float32 (or int8) index shared by every process;
+# only chunks whose text changed are embedded again
+# (GROVIO_EMBEDDING_INDEX_PATH lets offline tools keep stub vectors out of the shared index)
+embed_matrix = embedding_index.load_or_build(
+    os.environ.get("GROVIO_EMBEDDING_INDEX_PATH") or cfg.get("embedding_index_path", embedding_index.INDEX_PATH),
+    chunks, client, int8=cfg.get("embedding_index_int8", False), sources=chunk_sources,
+    backend=llm_backend(cfg),
+)
+embed_norms = embed_matrix.norms
+
+# 2. intent index for the canned-reply fast path
+canned_index = CannedReplyIndex.load(client)
+
 # Track last config file modification time
 last_config_mtime = 0
 
+# Running average answer latency per model, used to estimate time saved by routing
+_answer_latency = {}
+_answer_latency_lock = threading.Lock()
+
+# Async client for `handle_async`, created on first use (one pooled HTTP client per process)
+async_client = None
+
+_moderation_pool = ThreadPoolExecutor(max_workers=INPUT_MODERATION_WORKERS, thread_name_prefix="input-moderation")
+
+def get_async_client():
+    """The shared async client; its HTTP connection pool is reused by every request."""
+    global async_client
+    if async_client is None:
+        async_client = make_async_client(cfg)
+    return async_client
+
 # Reload configuration from yaml
 def reload_config():
     global cfg, last_config_mtime
@@ -38,44 +86,468 @@ def reload_config():
         # Check if the file has been modified
         current_mtime = config_file.stat().st_mtime
         if current_mtime > last_config_mtime:
+            metrics.CACHE_MISSES.inc(cache="config")
             with open(config_file, "r") as f:
                 new_cfg = yaml.safe_load(f)
                 if new_cfg:
                     old_mode = cfg.get('mode', 'passive')
                     new_mode = new_cfg.get('mode', 'passive')
                     cfg.update(new_cfg)
+                    profiling.configure(cfg)
                     last_config_mtime = current_mtime
                     if old_mode != new_mode:
                         print(f"[main.py] Mode changed from {old_mode} to {new_mode}")
                     return True  # Config was reloaded
+        metrics.CACHE_HITS.inc(cache="config")
         return False  # No change in config
     else:
         return False  # Config file doesn't exist
 
-def handle(text):
-    # Reload config to get the latest mode setting
-    reload_config()
+def retrieve(text, q_emb, semantic_weight=None, top_k=None, candidates=None, mmr_lambda=None,
+             max_similarity=_FROM_CONFIG):
+    """
+    Score context chunks against a query with hybrid semantic + BM25 search.
+    
+    Args:
+        text (str): The user message
+        q_emb (np.array): Embedding of the user message, or None for keyword-only search
+        semantic_weight (float): Weight of the semantic score (defaults to config)
+        top_k (int): Number of chunks to return (defaults to config)
+        candidates (array-like): Restrict scoring to these chunk indices (e.g. from an ANN probe)
+        mmr_lambda (float): MMR relevance/diversity trade-off (defaults to config;
+            1.0 keeps plain top-k order)
+        max_similarity (float): Drop chunks more similar than this to a picked
+            one (defaults to config; None keeps them). Diversification is
+            skipped entirely when mmr_lambda is 1.0 and this is None.
+        
+    Returns:
+        tuple: (top_indices, semantic_scores, bm25_scores, combined_scores); the
+        score arrays are indexed by chunk index
+    """
+    if semantic_weight is None:
+        semantic_weight = cfg.get("semantic_weight", 0.7)  # Default 70% semantic, 30% keyword
+    if top_k is None:
+        top_k = cfg["top_k_context"]
+    n = len(chunks)
+    idx = np.arange(n) if candidates is None else np.asarray(candidates, dtype=int)
+    
     # 1. Semantic search with embeddings
-    q_emb = embed(text, client)
-    semantic_scores = [cosine_sim(q_emb, e) for e in embeds]
+    semantic_scores = np.zeros(n)
+    if q_emb is not None and len(idx):
+        q_norm = np.linalg.norm(q_emb) or 1.0
+        semantic_scores[idx] = embed_matrix.dot(q_emb, None if candidates is None else idx) / (embed_norms[idx] * q_norm)
     
     # 2. Keyword search with BM25
     query_tokens = text.lower().split()
-    bm25_scores = bm25.get_scores(query_tokens)
+    bm25_scores = np.zeros(n)
+    if len(idx):
+        bm25_scores[idx] = bm25.get_batch_scores(query_tokens, idx.tolist())
     
     # 3. Normalize both score arrays
-    if max(semantic_scores) > 0:
-        semantic_scores = np.array(semantic_scores) / max(semantic_scores)
-    if max(bm25_scores) > 0:
-        bm25_scores = bm25_scores / max(bm25_scores)
+    if semantic_scores.max() > 0:
+        semantic_scores = semantic_scores / semantic_scores.max()
+    if bm25_scores.max() > 0:
+        bm25_scores = bm25_scores / bm25_scores.max()
     
     # 4. Combine scores (weighted average)
-    semantic_weight = cfg.get("semantic_weight", 0.7)  # Default 70% semantic, 30% keyword
-    combined_scores = semantic_weight * semantic_scores + (1 - semantic_weight) * bm25_scores
+    combined_scores = np.full(n, -np.inf)
+    combined_scores[idx] = semantic_weight * semantic_scores[idx] + (1 - semantic_weight) * bm25_scores[idx]
     
     # 5. Get top k context chunks
-    top_indices = np.argsort(combined_scores)[-cfg["top_k_context"]:]
-    top_indices = top_indices[::-1]  # Reverse to get descending order
+    top_indices = np.argsort(combined_scores)[::-1]  # Reverse to get descending order
+    if mmr_lambda is None:
+        mmr_lambda = cfg.get("mmr_lambda", MMR_LAMBDA)
+    if max_similarity is _FROM_CONFIG:
+        max_similarity = cfg.get("mmr_max_similarity", MMR_MAX_SIMILARITY)
+    if mmr_lambda < 1.0 or max_similarity is not None:
+        # 6. Diversify: re-rank the best candidates so near-duplicate chunks are not all sent
+        pool = top_indices[:min(cfg.get("mmr_candidates", MMR_CANDIDATES_PER_K) * top_k, len(idx))]
+        picked = mmr(embed_matrix[pool], combined_scores[pool], top_k, mmr_lambda, max_similarity)
+        return pool[picked], semantic_scores, bm25_scores, combined_scores
+    top_indices = top_indices[:min(top_k, len(idx))]
+    return top_indices, semantic_scores, bm25_scores, combined_scores
+
+def match_canned(text, timings, exact_only=False):
+    """
+    Look a message up in the canned-reply intent index.
+    
+    A message equal to one of an intent's examples matches without an
+    embedding call; otherwise the message is embedded and matched by similarity.
+    
+    Args:
+        text (str): The user message
+        timings (dict): Receives the "embed" and "canned" stage times
+        exact_only (bool): Skip the embedding lookup (no API calls)
+        
+    Returns:
+        tuple: (intent or None, message embedding or None if not computed)
+    """
+    if canned_index is None or not cfg.get("canned_replies", True):
+        return None, None
+    q_emb = None
+    with stage("canned", timings):
+        intent = canned_index.match_exact(text)
+        score = 1.0
+    if intent is None and not exact_only:
+        with stage("embed", timings):
+            q_emb = embed(text, client)
+        with stage("canned", timings):
+            intent, score = canned_index.match(text, q_emb, cfg.get("canned_threshold", CANNED_THRESHOLD))
+    _report_canned(intent, score)
+    return intent, q_emb
+
+async def match_canned_async(text, timings, exact_only=False):
+    """Async counterpart of `match_canned` using the async client."""
+    if canned_index is None or not cfg.get("canned_replies", True):
+        return None, None
+    q_emb = None
+    with stage("canned", timings):
+        intent = canned_index.match_exact(text)
+        score = 1.0
+    if intent is None and not exact_only:
+        with stage("embed", timings):
+            q_emb = await embed_async(text, get_async_client())
+        with stage("canned", timings):
+            intent, score = canned_index.match(text, q_emb, cfg.get("canned_threshold", CANNED_THRESHOLD))
+    _report_canned(intent, score)
+    return intent, q_emb
+
+def _report_canned(intent, score):
+    hit_rate = canned_index.record(intent)
+    if intent:
+        print(f"[CANNED] {intent} (score {score:.3f}, hit rate {hit_rate:.1%} of {canned_index.lookups})")
+
+class InputFlagged(Exception):
+    """Raised inside the pipeline once input moderation has flagged the message."""
+
+    def __init__(self, where):
+        super().__init__(f"input flagged during {where}")
+        self.where = where
+
+class InputModeration:
+    """
+    Moderation of the user's message, run in the background while the reply
+    is being prepared.
+    
+    The pipeline calls `check` between stages (and while streaming the
+    completion) so a flagged message stops before the next expensive call,
+    and `wait` for the final verdict before a reply is used.
+    
+    Args:
+        text (str): The user message
+    """
+    
+    def __init__(self, text):
+        self._init_state()
+        # Run in a copy of the caller's context so the call is attributed to this request
+        self.future = _moderation_pool.submit(contextvars.copy_context().run, self._run, text)
+    
+    def _init_state(self):
+        self.cancelled = threading.Event()
+        self.flagged = False
+        self.categories = []
+        self.risk = 0.0
+        self.timings = {}
+    
+    def _run(self, text):
+        try:
+            with stage("input_moderation", self.timings):
+                response = client.moderations.create(input=text)
+                metrics.record_llm_call("moderation", response)
+        except Exception as e:
+            self._failed(e)
+            return
+        self._apply(response)
+    
+    def _failed(self, error):
+        # Fail open: the reply is still moderated before it is stored
+        print(f"Error moderating input: {error}")
+        metrics.ERRORS.inc(where="input_moderation")
+        metrics.INPUT_MODERATION.inc(result="error")
+    
+    def _apply(self, response):
+        result = response.results[0] if response.results else None
+        if result is None or not result.flagged:
+            metrics.INPUT_MODERATION.inc(result="clean")
+            return
+        self.categories = sorted(name for name, hit in result.categories.__dict__.items() if hit)
+        scores = [v for v in result.category_scores.__dict__.values() if v is not None]
+        self.risk = max(scores) if scores else 1.0
+        self.flagged = True
+        self.cancelled.set()
+        metrics.INPUT_MODERATION.inc(result="flagged")
+    
+    def check(self, where):
+        """Raise InputFlagged if the verdict is already in and flagged."""
+        if self.cancelled.is_set():
+            raise InputFlagged(where)
+    
+    def wait(self, where):
+        """Block until the verdict is in (up to `input_moderation_timeout`), then `check`."""
+        try:
+            self.future.result(timeout=cfg.get("input_moderation_timeout", INPUT_MODERATION_TIMEOUT))
+        except FutureTimeout:
+            print("Input moderation timed out; continuing without it")
+            metrics.ERRORS.inc(where="input_moderation")
+        self.check(where)
+
+class AsyncInputModeration(InputModeration):
+    """`InputModeration` run as a task on the event loop with the async client."""
+    
+    def __init__(self, text):
+        self._init_state()
+        # Tasks run in a copy of the current context, so usage is attributed to this request
+        self.task = asyncio.get_running_loop().create_task(self._run_async(text))
+    
+    async def _run_async(self, text):
+        try:
+            with stage("input_moderation", self.timings):
+                response = await get_async_client().moderations.create(input=text)
+                metrics.record_llm_call("moderation", response)
+        except Exception as e:
+            self._failed(e)
+            return
+        self._apply(response)
+    
+    async def wait_async(self, where):
+        """Await the verdict (up to `input_moderation_timeout`), then `check`."""
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), cfg.get("input_moderation_timeout", INPUT_MODERATION_TIMEOUT))
+        except asyncio.TimeoutError:
+            print("Input moderation timed out; continuing without it")
+            metrics.ERRORS.inc(where="input_moderation")
+        self.check(where)
+
+def _collect_chunk(chunk, parts):
+    """Add a streamed chunk's text to `parts`; return its usage, if any."""
+    if chunk.choices and chunk.choices[0].delta.content:
+        parts.append(chunk.choices[0].delta.content)
+    return getattr(chunk, "usage", None)
+
+def stream_completion(model, messages, guard):
+    """
+    Stream a chat completion, stopping as soon as `guard` flags the input.
+    
+    Args:
+        model (str): Chat model
+        messages (list): Chat messages
+        guard (InputModeration): Running input moderation
+        
+    Returns:
+        str: The completion text
+        
+    Raises:
+        InputFlagged: If the input was flagged before or during the stream
+    """
+    guard.check("generate")
+    response = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts, usage = [], None
+    try:
+        for chunk in response:
+            if guard.cancelled.is_set():
+                break
+            usage = _collect_chunk(chunk, parts) or usage
+    finally:
+        close = getattr(response, "close", None)
+        if close:
+            close()  # Drop the connection so the server stops generating
+        metrics.record_llm_call("chat", SimpleNamespace(usage=usage), model)
+    guard.check("generate")
+    return "".join(parts).strip()
+
+async def stream_completion_async(model, messages, guard):
+    """Async counterpart of `stream_completion`."""
+    guard.check("generate")
+    response = await get_async_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts, usage = [], None
+    try:
+        async for chunk in response:
+            if guard.cancelled.is_set():
+                break
+            usage = _collect_chunk(chunk, parts) or usage
+    finally:
+        close = getattr(response, "close", None)
+        if close:
+            await close()
+        metrics.record_llm_call("chat", SimpleNamespace(usage=usage), model)
+    guard.check("generate")
+    return "".join(parts).strip()
+
+CONFIDENCE_SYSTEM = "You must respond with ONLY a number between 0 and 1. No text before or after the number."
+
+def confidence_messages(assistant_msg):
+    """Chat messages asking the model to rate its confidence in a reply."""
+    conf_prompt = f"""Rate your confidence in this answer on a scale of 0 to 1.
+    Answer with ONLY a number between 0 and 1, with no explanation or additional text.
+    
+    Answer: {assistant_msg}"""
+    return [
+        {"role": "system", "content": CONFIDENCE_SYSTEM},
+        {"role": "user", "content": conf_prompt}
+    ]
+
+def parse_confidence(conf_response):
+    """Extract the confidence number from a reply, defaulting to 0.5."""
+    # Extract just the first number found in the response
+    number_match = re.search(r'0\.\d+|1\.0|0|1', conf_response)
+    if number_match:
+        return float(number_match.group())
+    # Fallback if no number found
+    print(f"Warning: Could not extract confidence number from: {conf_response}")
+    return 0.5  # Default to medium confidence
+
+def moderation_risk(moderation_response):
+    """The highest category score of a moderation response (0.0 if none)."""
+    risk = 0.0
+    if moderation_response.results and len(moderation_response.results) > 0:
+        # Get the maximum category score as the overall risk
+        category_scores = moderation_response.results[0].category_scores
+        if category_scores:
+            # Filter out None values before calling max()
+            values = [v for v in category_scores.__dict__.values() if v is not None]
+            if values:  # Only call max if we have values
+                risk = max(values)
+    return risk
+
+def answer(prompt, model, timings, guard=None):
+    """
+    Generate a reply with `model` and score its risk and confidence.
+    
+    Args:
+        prompt (str): Reply prompt with the retrieved context
+        model (str): Chat model for the reply and the confidence call
+        timings (dict): Receives the generate/moderate/confidence stage times
+        guard (InputModeration): Running input moderation; when given, the
+            completion is streamed so a flag can cut it short
+        
+    Returns:
+        tuple: (reply text, risk, confidence)
+        
+    Raises:
+        InputFlagged: If `guard` flags the input before the reply is scored
+    """
+    messages = [{"role": "system", "content": prompt}]
+    with stage("generate", timings):
+        if guard is not None:
+            assistant_msg = stream_completion(model, messages, guard)
+        else:
+            completion = client.chat.completions.create(
+                model=model,
+                messages=messages,
+            )
+            metrics.record_llm_call("chat", completion, model)
+            assistant_msg = completion.choices[0].message.content.strip()
+
+    # risk / confidence
+    if guard is not None:
+        guard.check("moderate")
+    with stage("moderate", timings):
+        moderation_response = client.moderations.create(input=assistant_msg)
+        metrics.record_llm_call("moderation", moderation_response)
+    # Extract the risk score (using the highest category score for simplicity)
+    risk = moderation_risk(moderation_response)
+    
+    # Get confidence and handle potential parsing issues
+    if guard is not None:
+        guard.check("confidence")
+    with stage("confidence", timings):
+        try:
+            conf_completion = client.chat.completions.create(
+                model=model,
+                messages=confidence_messages(assistant_msg),
+            )
+            metrics.record_llm_call("chat", conf_completion, model)
+            conf = parse_confidence(conf_completion.choices[0].message.content.strip())
+        except Exception as e:
+            print(f"Error getting confidence: {e}")
+            metrics.ERRORS.inc(where="confidence")
+            conf = 0.5  # Default to medium confidence
+    return assistant_msg, risk, conf
+
+async def answer_async(prompt, model, timings, guard=None):
+    """Async counterpart of `answer` using the async client."""
+    aclient = get_async_client()
+    messages = [{"role": "system", "content": prompt}]
+    with stage("generate", timings):
+        if guard is not None:
+            assistant_msg = await stream_completion_async(model, messages, guard)
+        else:
+            completion = await aclient.chat.completions.create(model=model, messages=messages)
+            metrics.record_llm_call("chat", completion, model)
+            assistant_msg = completion.choices[0].message.content.strip()
+
+    if guard is not None:
+        guard.check("moderate")
+    with stage("moderate", timings):
+        moderation_response = await aclient.moderations.create(input=assistant_msg)
+        metrics.record_llm_call("moderation", moderation_response)
+    risk = moderation_risk(moderation_response)
+    
+    if guard is not None:
+        guard.check("confidence")
+    with stage("confidence", timings):
+        try:
+            conf_completion = await aclient.chat.completions.create(
+                model=model,
+                messages=confidence_messages(assistant_msg),
+            )
+            metrics.record_llm_call("chat", conf_completion, model)
+            conf = parse_confidence(conf_completion.choices[0].message.content.strip())
+        except Exception as e:
+            print(f"Error getting confidence: {e}")
+            metrics.ERRORS.inc(where="confidence")
+            conf = 0.5  # Default to medium confidence
+    return assistant_msg, risk, conf
+
+def choose_model(text, retrieval_score):
+    """
+    Pick the first model to try for a message.
+    
+    Short messages whose best context chunk is a close match (FAQ-like) go to
+    `fast_model`; everything else, or every message when `fast_model` is not
+    configured, goes straight to `model`.
+    
+    Args:
+        text (str): The user message
+        retrieval_score (float): Cosine similarity of the best retrieved chunk
+        
+    Returns:
+        tuple: (model, reason)
+    """
+    fast_model = cfg.get("fast_model")
+    if not fast_model or fast_model == cfg["model"]:
+        return cfg["model"], "default"
+    if len(text.split()) > cfg.get("route_max_words", ROUTE_MAX_WORDS):
+        return cfg["model"], "long_message"
+    if retrieval_score < cfg.get("route_min_retrieval", ROUTE_MIN_RETRIEVAL):
+        return cfg["model"], "low_retrieval"
+    return fast_model, "simple"
+
+def _observe_answer_latency(model, seconds):
+    """Keep an exponentially weighted average of full answer latency per model."""
+    with _answer_latency_lock:
+        previous = _answer_latency.get(model)
+        _answer_latency[model] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+def build_prompt(text, q_emb, timings):
+    """
+    Retrieve context for a message and build the reply prompt.
+    
+    Returns:
+        tuple: (prompt, raw cosine similarity of the best retrieved chunk)
+    """
+    with stage("retrieve", timings):
+        top_indices, semantic_scores, bm25_scores, combined_scores = retrieve(text, q_emb)
     ctx = [chunks[i] for i in top_indices]
     
     # Log scores for debugging/tuning
@@ -85,79 +557,267 @@ def handle(text):
             print(f"Chunk {i}: Semantic: {semantic_scores[i]:.4f}, BM25: {bm25_scores[i]:.4f}, Combined: {combined_scores[i]:.4f}")
             print(f"Content: {chunks[i][:100]}...\n")
     
+    ctx_text = '\n'.join(ctx)
     prompt = f"""
     You are the brand assistant...
     ### Context ###
-    {'\n'.join(ctx)}
+    {ctx_text}
     ### User ###
     {text}
     ### Reply ###
     """
 
-    assistant_msg = client.chat.completions.create(
-        model=cfg["model"],
-        messages=[{"role": "system", "content": prompt}],
-    ).choices[0].message.content.strip()
+    # Raw cosine of the best chunk (the scores above are normalized per query)
+    retrieval_score = 0.0
+    if len(top_indices) and q_emb is not None:
+        best = top_indices[0]
+        retrieval_score = float(embed_matrix[best] @ q_emb / (embed_norms[best] * (np.linalg.norm(q_emb) or 1.0)))
+    return prompt, retrieval_score
 
-    # risk / confidence
-    moderation_response = client.moderations.create(input=assistant_msg)
-    # Extract the risk score (using the highest category score for simplicity)
-    risk = 0.0
-    if moderation_response.results and len(moderation_response.results) > 0:
-        # Get the maximum category score as the overall risk
-        category_scores = moderation_response.results[0].category_scores
-        if category_scores:
-            # Filter out None values before calling max()
-            values = [v for v in category_scores.__dict__.values() if v is not None]
-            if values:  # Only call max if we have values
-                risk = max(values)
-    conf_prompt = f"""Rate your confidence in this answer on a scale of 0 to 1.
-    Answer with ONLY a number between 0 and 1, with no explanation or additional text.
+def _should_escalate(model, conf):
+    return model != cfg["model"] and conf < cfg.get("escalate_confidence", cfg.get("min_confidence", 0.7))
+
+def _merge_timings(timings, extra):
+    # The strong model's stage times are added to the fast attempt's
+    for name, seconds in extra.items():
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def _report_route(route, reason, retrieval_score, elapsed):
+    """Fill in the latency estimate and log/count a routing decision."""
+    if "escalated_from" in route:
+        route["saved_s"] = round(-elapsed, 3)
+    elif route["model"] != cfg["model"]:
+        strong_estimate = _answer_latency.get(cfg["model"])
+        if strong_estimate is not None:
+            route["saved_s"] = round(strong_estimate - elapsed, 3)
+    decision = "escalated" if "escalated_from" in route else ("fast" if route["model"] != cfg["model"] else "strong")
+    metrics.ROUTES.inc(route=decision, reason=reason)
+    if "saved_s" in route:
+        metrics.ROUTE_SAVED_SECONDS.inc(route["saved_s"])
+    print(f"[ROUTE] {decision}: {route['model']} ({reason}, retrieval {retrieval_score:.2f}"
+          + (f", ~{route['saved_s']:+.2f}s vs {cfg['model']})" if "saved_s" in route else ")"))
+
+def generate_reply(text, q_emb, timings, guard=None):
+    """
+    Retrieve context, generate a reply and score its risk and confidence.
     
-    Answer: {assistant_msg}"""
+    Simple messages are answered by `fast_model` first and escalated to
+    `model` when the fast answer's confidence is below `escalate_confidence`.
     
-    # Get confidence and handle potential parsing issues
-    try:
-        conf_response = client.chat.completions.create(
-            model=cfg["model"],
-            messages=[
-                {"role": "system", "content": "You must respond with ONLY a number between 0 and 1. No text before or after the number."},
-                {"role": "user", "content": conf_prompt}
-            ],
-        ).choices[0].message.content.strip()
+    Args:
+        text (str): The user message
+        q_emb (np.array): Embedding of the user message
+        timings (dict): Receives per-stage wall times
+        guard (InputModeration): Running input moderation, checked between stages
         
-        # Extract just the first number found in the response
-        import re
-        number_match = re.search(r'0\.\d+|1\.0|0|1', conf_response)
-        if number_match:
-            conf = float(number_match.group())
-        else:
-            # Fallback if no number found
-            print(f"Warning: Could not extract confidence number from: {conf_response}")
-            conf = 0.5  # Default to medium confidence
-    except Exception as e:
-        print(f"Error getting confidence: {e}")
-        conf = 0.5  # Default to medium confidence
+    Returns:
+        tuple: (reply text, risk, confidence, routing info dict)
+        
+    Raises:
+        InputFlagged: If `guard` flags the input before the reply is scored
+    """
+    prompt, retrieval_score = build_prompt(text, q_emb, timings)
+    if guard is not None:
+        guard.check("retrieve")
+    
+    model, reason = choose_model(text, retrieval_score)
+    start = time.perf_counter()
+    assistant_msg, risk, conf = answer(prompt, model, timings, guard)
+    elapsed = time.perf_counter() - start
+    _observe_answer_latency(model, elapsed)
+    route = {"model": model, "reason": reason, "retrieval_score": round(retrieval_score, 4)}
+    
+    if _should_escalate(model, conf):
+        strong_timings = {}
+        strong_start = time.perf_counter()
+        assistant_msg, risk, conf_strong = answer(prompt, cfg["model"], strong_timings, guard)
+        _observe_answer_latency(cfg["model"], time.perf_counter() - strong_start)
+        _merge_timings(timings, strong_timings)
+        route.update(model=cfg["model"], reason=f"escalated_conf_{conf:.2f}", escalated_from=model)
+        conf = conf_strong
+    _report_route(route, reason, retrieval_score, elapsed)
+    return assistant_msg, risk, conf, route
+
+async def generate_reply_async(text, q_emb, timings, guard=None):
+    """Async counterpart of `generate_reply`."""
+    prompt, retrieval_score = build_prompt(text, q_emb, timings)
+    if guard is not None:
+        guard.check("retrieve")
+    
+    model, reason = choose_model(text, retrieval_score)
+    start = time.perf_counter()
+    assistant_msg, risk, conf = await answer_async(prompt, model, timings, guard)
+    elapsed = time.perf_counter() - start
+    _observe_answer_latency(model, elapsed)
+    route = {"model": model, "reason": reason, "retrieval_score": round(retrieval_score, 4)}
+    
+    if _should_escalate(model, conf):
+        strong_timings = {}
+        strong_start = time.perf_counter()
+        assistant_msg, risk, conf_strong = await answer_async(prompt, cfg["model"], strong_timings, guard)
+        _observe_answer_latency(cfg["model"], time.perf_counter() - strong_start)
+        _merge_timings(timings, strong_timings)
+        route.update(model=cfg["model"], reason=f"escalated_conf_{conf:.2f}", escalated_from=model)
+        conf = conf_strong
+    _report_route(route, reason, retrieval_score, elapsed)
+    return assistant_msg, risk, conf, route
+
+def _build_record(text, assistant_msg, risk, conf, usage, intent=None, route=None,
+                  over_budget=None, flagged=None, guard=None):
+    """Report the outcome of a pipeline run and build the record to store."""
+    if over_budget:
+        metrics.BUDGET_DEGRADED.inc(budget=over_budget, result="canned" if intent else "draft")
+        print(f"[BUDGET] Hourly {over_budget} budget exhausted; {'canned reply' if intent else 'stored as draft without a reply'}")
 
     # decide
     # Only two modes: passive and active
     active = (cfg["mode"] == "active")
 
-    if active:
+    if flagged:
+        print(f"[FLAGGED] Input flagged ({', '.join(guard.categories) or 'unspecified'}) during {flagged}; stored for review")
+    elif active:
         print(f"[SENT] {assistant_msg}")
         # send_to_discord(assistant_msg)  # opt-in
     else:
         print(f"[DRAFT] {assistant_msg}")
 
-    with open("store.jsonl", "a") as f:
-        f.write(json.dumps({
-            "ts": time.time(),
-            "user": text,
-            "reply": assistant_msg,
-            "risk": float(risk),  # Ensure it's a float
-            "conf": float(conf),  # Ensure it's a float
-            "active": active,
-        }) + "\n")
+    record = {
+        "ts": time.time(),
+        "user": text,
+        "reply": assistant_msg,
+        "risk": float(risk),  # Ensure it's a float
+        "conf": float(conf),  # Ensure it's a float
+        "active": active,
+    }
+    record["usage"] = usage.to_dict()
+    record["llm_calls"] = usage.total_calls
+    if intent:
+        record["canned"] = intent
+    if route:
+        record["route"] = route
+    if over_budget:
+        record["degraded"] = f"budget_{over_budget}"
+    if flagged:
+        record["flagged_input"] = {"categories": guard.categories, "stopped_at": flagged}
+    return record
+
+@profiling.sampled("handle")
+def handle(text):
+    """
+    Run one message through the reply pipeline and persist the result.
+    
+    Messages matching a canned-reply intent get the approved reply with preset
+    risk/confidence and skip retrieval, generation, reply moderation and
+    scoring; the input moderation verdict is still awaited before replying.
+    
+    Unless `input_moderation` is false, the message itself is moderated in the
+    background from the start. If it is flagged, the pipeline stops at the
+    next stage boundary (cancelling a completion mid-stream) and the message
+    is stored as a reply-less draft for review with a `flagged_input` field.
+    
+    When an hourly budget (`budget_calls_per_hour`, `budget_tokens_per_hour`)
+    is exhausted, no API calls are made: exact canned matches are still
+    answered and everything else is stored as a reply-less draft for review.
+    
+    Args:
+        text (str): The user message
+        
+    Returns:
+        dict: The stored record (including per-stage LLM calls and tokens
+        under "usage"), plus per-stage wall times in seconds under "timings"
+    """
+    # Reload config to get the latest mode setting
+    reload_config()
+    timings = {}
+    route = None
+    guard = None
+    flagged = None
+    with accounting.track() as usage:
+        over_budget = accounting.budget_exceeded(cfg)
+        if not over_budget and cfg.get("input_moderation", True):
+            guard = InputModeration(text)
+        intent, q_emb = match_canned(text, timings, exact_only=bool(over_budget))
+        try:
+            if intent:
+                # A canned reply is only as safe as the message it answers
+                if guard is not None:
+                    guard.wait("canned")
+                assistant_msg = canned_index.replies[intent]
+                risk = cfg.get("canned_risk", CANNED_RISK)
+                conf = cfg.get("canned_conf", CANNED_CONF)
+            elif over_budget:
+                assistant_msg, risk, conf = "", 0.0, 0.0
+            else:
+                if q_emb is None:
+                    with stage("embed", timings):
+                        q_emb = embed(text, client)
+                assistant_msg, risk, conf, route = generate_reply(text, q_emb, timings, guard)
+                if guard is not None:
+                    guard.wait("verdict")
+        except InputFlagged as e:
+            flagged = e.where
+            intent = None
+            assistant_msg, risk, conf = "", guard.risk, 0.0
+    if guard is not None:
+        timings.update(guard.timings)
+    record = _build_record(text, assistant_msg, risk, conf, usage, intent, route, over_budget, flagged, guard)
+    with stage("persist", timings):
+        log_archive.append_records(STORE_PATH, [record], cfg)
+    return {**record, "timings": timings}
+
+@profiling.sampled("handle_async")
+async def handle_async(text):
+    """
+    Async counterpart of `handle` for callers on an event loop.
+    
+    Every API call goes through the shared async client (`get_async_client`)
+    and its pooled connections, and input moderation runs as a task on the
+    loop. Retrieval and scoring run inline (they are in-memory NumPy work);
+    the store append runs in a worker thread.
+    
+    Args:
+        text (str): The user message
+        
+    Returns:
+        dict: Same as `handle`
+    """
+    reload_config()
+    timings = {}
+    route = None
+    guard = None
+    flagged = None
+    with accounting.track() as usage:
+        over_budget = accounting.budget_exceeded(cfg)
+        if not over_budget and cfg.get("input_moderation", True):
+            guard = AsyncInputModeration(text)
+        intent, q_emb = await match_canned_async(text, timings, exact_only=bool(over_budget))
+        try:
+            if intent:
+                # A canned reply is only as safe as the message it answers
+                if guard is not None:
+                    await guard.wait_async("canned")
+                assistant_msg = canned_index.replies[intent]
+                risk = cfg.get("canned_risk", CANNED_RISK)
+                conf = cfg.get("canned_conf", CANNED_CONF)
+            elif over_budget:
+                assistant_msg, risk, conf = "", 0.0, 0.0
+            else:
+                if q_emb is None:
+                    with stage("embed", timings):
+                        q_emb = await embed_async(text, get_async_client())
+                assistant_msg, risk, conf, route = await generate_reply_async(text, q_emb, timings, guard)
+                if guard is not None:
+                    await guard.wait_async("verdict")
+        except InputFlagged as e:
+            flagged = e.where
+            intent = None
+            assistant_msg, risk, conf = "", guard.risk, 0.0
+    if guard is not None:
+        timings.update(guard.timings)
+    record = _build_record(text, assistant_msg, risk, conf, usage, intent, route, over_budget, flagged, guard)
+    with stage("persist", timings):
+        await asyncio.to_thread(log_archive.append_records, STORE_PATH, [record], cfg)
+    return {**record, "timings": timings}
 
 if __name__ == "__main__":
     while True:
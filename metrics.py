@@ -0,0 +1,324 @@
+"""
+Metrics for Grovio
+
+Process-local counters and latency histograms for the reply pipeline and the
+storage layer, exposed in the Prometheus text format. The Discord bot serves
+them over HTTP (see `start_http_server`) and the admin dashboard scrapes that
+endpoint to render its metrics panel.
+"""
+
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import accounting
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    labels = _label_str(self.labelnames + ("le",), key + (repr(float(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _label_str(self.labelnames + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                base = _label_str(self.labelnames, key)
+                lines.append(f"{self.name}_sum{base} {series['sum']}")
+                lines.append(f"{self.name}_count{base} {series['count']}")
+        return lines
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def counter(name, documentation, labelnames=()):
+    """Get or create a counter in the process-wide registry."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Counter(name, documentation, labelnames)
+        return _registry[name]
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Get or create a histogram in the process-wide registry."""
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, documentation, labelnames, buckets)
+        return _registry[name]
+
+
+STAGE_SECONDS = histogram("grovio_stage_seconds", "Time spent in each reply pipeline stage", ["stage"])
+STORAGE_SECONDS = histogram("grovio_storage_seconds", "Time spent in storage operations", ["op"])
+LLM_CALLS = counter("grovio_llm_calls_total", "LLM API calls by kind", ["kind", "model"])
+LLM_TOKENS = counter("grovio_llm_tokens_total", "LLM tokens by kind", ["kind"])
+LLM_STAGE_CALLS = counter("grovio_llm_stage_calls_total", "LLM API calls by pipeline stage", ["stage"])
+CACHE_HITS = counter("grovio_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = counter("grovio_cache_misses_total", "Cache misses", ["cache"])
+ERRORS = counter("grovio_errors_total", "Errors by location", ["where"])
+BUDGET_DEGRADED = counter("grovio_budget_degraded_total", "Replies degraded because an hourly budget was exhausted", ["budget", "result"])
+INPUT_MODERATION = counter("grovio_input_moderation_total", "Input moderation verdicts", ["result"])
+ROUTES = counter("grovio_route_total", "Model routing decisions", ["route", "reason"])
+ROUTE_SAVED_SECONDS = counter("grovio_route_saved_seconds_total", "Estimated seconds saved by the fast model (negative after escalations)")
+QUEUE_MESSAGES = counter("grovio_queue_messages_total", "Outbox send outcomes (sent, retry, dead)", ["result"])
+PREFILTER = counter("grovio_prefilter_total", "Pre-filter decisions before the reply pipeline", ["decision", "reason"])
+CANNED_REPLIES = counter("grovio_canned_replies_total", "Canned-reply fast path lookups", ["result", "intent"])
+
+
+_current_stage = ContextVar("grovio_stage", default="")
+
+
+@contextmanager
+def stage(name, timings=None):
+    """
+    Time a reply pipeline stage.
+
+    Args:
+        name (str): Stage name (embed, retrieve, generate, ...)
+        timings (dict): Optional dict that receives the elapsed seconds under `name`
+    """
+    start = time.perf_counter()
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if timings is not None:
+            timings[name] = elapsed
+
+
+@contextmanager
+def storage(op):
+    """Time a storage operation such as a JSONL rewrite or queue drain."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STORAGE_SECONDS.observe(time.perf_counter() - start, op=op)
+
+
+def record_llm_call(kind, response, model=""):
+    """
+    Count an LLM API call and the tokens reported in its `usage` field.
+
+    The call is also attributed to the current pipeline stage and passed to
+    `accounting` for per-request usage and hourly budgets.
+
+    Args:
+        kind (str): "chat", "embedding" or "moderation"
+        response: Response object returned by the client
+        model (str): Model name used for the call
+    """
+    LLM_CALLS.inc(kind=kind, model=model or "")
+    current = _current_stage.get()
+    LLM_STAGE_CALLS.inc(stage=current or kind)
+    usage = getattr(response, "usage", None)
+    accounting.note_call(kind, current, usage)
+    if usage is None:
+        return
+    if kind == "embedding":
+        LLM_TOKENS.inc(getattr(usage, "total_tokens", 0) or 0, kind="embedding")
+    else:
+        LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+        LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, kind="completion")
+
+
+def render():
+    """Render every registered metric in the Prometheus text format."""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry.values())
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the bot's console output
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """
+    Serve /metrics from a daemon thread.
+
+    Args:
+        port (int): Port to listen on
+        host (str): Interface to bind (local only by default)
+
+    Returns:
+        ThreadingHTTPServer: The running server
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def parse_exposition(text):
+    """
+    Parse Prometheus text output into (name, labels, value) samples.
+
+    Args:
+        text (str): Output of `render()` or a scrape of the /metrics endpoint
+
+    Returns:
+        list: Tuples of (metric name, label dict, float value)
+    """
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        name, label_text, value = match.groups()
+        labels = dict(_LABEL_RE.findall(label_text or ""))
+        samples.append((name, labels, float(value)))
+    return samples
+
+
+def histogram_quantile(q, buckets):
+    """
+    Estimate a quantile from cumulative histogram buckets, as Prometheus does.
+
+    Args:
+        q (float): Quantile between 0 and 1
+        buckets (list): (upper bound, cumulative count) pairs, including +Inf
+
+    Returns:
+        float: Estimated value, or NaN without observations
+    """
+    buckets = sorted(buckets, key=lambda b: b[0])
+    if not buckets or buckets[-1][1] == 0:
+        return math.nan
+    rank = q * buckets[-1][1]
+    prev_bound, prev_count = 0.0, 0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def summarize_histograms(samples, name, label):
+    """
+    Summarize a histogram family from parsed samples.
+
+    Args:
+        samples (list): Output of `parse_exposition`
+        name (str): Histogram name, e.g. "grovio_stage_seconds"
+        label (str): Label distinguishing the series, e.g. "stage"
+
+    Returns:
+        list: Dicts with count, mean, p50, p95 and p99 (seconds) per series
+    """
+    series = {}
+    for metric, labels, value in samples:
+        key = labels.get(label)
+        if key is None or not metric.startswith(name):
+            continue
+        entry = series.setdefault(key, {"buckets": [], "sum": 0.0, "count": 0})
+        if metric == f"{name}_bucket":
+            entry["buckets"].append((float(labels["le"]), value))
+        elif metric == f"{name}_sum":
+            entry["sum"] = value
+        elif metric == f"{name}_count":
+            entry["count"] = value
+    rows = []
+    for key, entry in sorted(series.items()):
+        count = entry["count"]
+        rows.append({
+            label: key,
+            "count": int(count),
+            "mean": entry["sum"] / count if count else math.nan,
+            "p50": histogram_quantile(0.5, entry["buckets"]),
+            "p95": histogram_quantile(0.95, entry["buckets"]),
+            "p99": histogram_quantile(0.99, entry["buckets"]),
+        })
+    return rows
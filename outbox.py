@@ -0,0 +1,230 @@
+"""
+Durable Outbox for Grovio's outbound Discord replies
+
+Replies approved in the admin dashboard or auto-sent by the bot are recorded
+in an append-only event log (outbox.jsonl) before any send is attempted:
+
+    {"event": "enqueue", "id": ..., "message_id": ..., "response": ..., "source": ..., "ts": ...}
+    {"event": "failed", "id": ..., "error": ..., "permanent": false, "ts": ...}
+    {"event": "ack", "id": ..., "ts": ...}
+    {"event": "requeue", "id": ..., "ts": ...}   (may carry a new "response"/"source")
+
+Replaying the log gives every reply's state:
+- pending: waiting to be sent, with a backoff deadline after failures;
+- sent: Discord confirmed the send (an "ack" was appended);
+- dead: failed `max_attempts` times, or failed permanently (e.g. the
+  original message was deleted).
+
+Dead letters stay in the log until requeued from the dashboard. Nothing is
+removed before it is acknowledged, so a crash mid-batch never drops a reply.
+Because the ack is written after Discord confirms the send, a crash between
+the two re-sends that reply once on restart (at-least-once delivery).
+Enqueueing is idempotent per Discord message, across processes: a message
+with a pending or sent reply is skipped, and a dead letter for the message is
+requeued (with the new reply text) instead of adding a second entry.
+
+The log is compacted once it passes COMPACT_BYTES. Compaction keeps pending
+and dead replies, plus the most recent sent ones for de-duplication.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from storage import IncrementalJsonlReader, append_jsonl, atomic_write_text, file_lock
+
+OUTBOX_PATH = "outbox.jsonl"
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 5
+MAX_BACKOFF_SECONDS = 300
+COMPACT_BYTES = 1024 * 1024
+SENT_KEPT = 1000  # Sent replies kept by compaction so late duplicates are still detected
+
+
+class Outbox:
+    """
+    State of the outbox log, refreshed incrementally from disk before every operation.
+
+    Safe to use from several processes: every change is a locked append, and
+    each process replays the events the others wrote.
+
+    Args:
+        path (str): Event log path
+        max_attempts (int): Failed sends before a reply becomes a dead letter
+        backoff (float): Delay before the first retry; doubled per attempt up to MAX_BACKOFF_SECONDS
+    """
+
+    def __init__(self, path=OUTBOX_PATH, max_attempts=DEFAULT_MAX_ATTEMPTS, backoff=DEFAULT_BACKOFF_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._reader = IncrementalJsonlReader(path)
+        self._entries = {}
+        self._by_message = {}
+        self._lock = threading.Lock()
+
+    # -- replay ---------------------------------------------------------------
+
+    def _apply(self, event):
+        kind = event.get("event")
+        entry_id = event.get("id")
+        if kind == "enqueue":
+            entry = {
+                "id": entry_id,
+                "message_id": event["message_id"],
+                "response": event["response"],
+                "source": event.get("source", ""),
+                "created": event.get("ts", 0),
+                "status": event.get("status", "pending"),
+                "attempts": event.get("attempts", 0),
+                "next_at": event.get("next_at", 0),
+                "last_error": event.get("last_error", ""),
+                "updated": event.get("ts", 0),
+            }
+            self._entries[entry_id] = entry
+            self._by_message[entry["message_id"]] = entry_id
+            return
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return
+        entry["updated"] = event.get("ts", 0)
+        if kind == "ack":
+            entry["status"] = "sent"
+        elif kind == "failed" and entry["status"] == "pending":
+            entry["attempts"] += 1
+            entry["last_error"] = event.get("error", "")
+            if event.get("permanent") or entry["attempts"] >= self.max_attempts:
+                entry["status"] = "dead"
+            else:
+                delay = min(self.backoff * 2 ** (entry["attempts"] - 1), MAX_BACKOFF_SECONDS)
+                entry["next_at"] = event.get("ts", 0) + delay
+        elif kind == "requeue" and entry["status"] == "dead":
+            entry.update(status="pending", attempts=0, next_at=0, last_error="")
+            entry["response"] = event.get("response", entry["response"])
+            entry["source"] = event.get("source", entry["source"])
+
+    def refresh(self):
+        """Apply events appended since the last call (by any process)."""
+        with self._lock:
+            rows, reset = self._reader.read_new()
+            if reset:
+                self._entries, self._by_message = {}, {}
+            for _, event in rows:
+                self._apply(event)
+
+    def _append(self, events):
+        append_jsonl(self.path, events)
+        self.refresh()
+
+    # -- operations -----------------------------------------------------------
+
+    def enqueue(self, replies, source=""):
+        """
+        Add replies to the outbox.
+
+        Args:
+            replies (dict): Maps message_id -> response text
+            source (str): Who queued them ("dashboard", "auto", ...)
+
+        Returns:
+            list: The new or requeued entries (messages that already have a
+            pending or sent reply are skipped; a dead letter is requeued)
+        """
+        # Check and append under the log lock so two processes cannot both enqueue one message
+        with file_lock(self.path):
+            self.refresh()
+            now = time.time()
+            events = []
+            for message_id, response in replies.items():
+                existing = self._entries.get(self._by_message.get(message_id))
+                if existing is None:
+                    events.append({"event": "enqueue", "id": uuid.uuid4().hex, "message_id": message_id,
+                                   "response": response, "source": source, "ts": now})
+                elif existing["status"] == "dead":
+                    events.append({"event": "requeue", "id": existing["id"], "response": response,
+                                   "source": source, "ts": now})
+            if events:
+                # append_jsonl would take the lock again; flock is not re-entrant across file objects
+                with open(self.path, "a") as f:
+                    f.write("".join(json.dumps(event) + "\n" for event in events))
+        self.refresh()
+        return [dict(self._entries[e["id"]]) for e in events]
+
+    def due(self, now=None, exclude=()):
+        """Pending entries whose backoff has elapsed, oldest first."""
+        self.refresh()
+        now = time.time() if now is None else now
+        with self._lock:
+            ready = [dict(e) for e in self._entries.values()
+                     if e["status"] == "pending" and e["next_at"] <= now and e["id"] not in exclude]
+        return sorted(ready, key=lambda e: e["created"])
+
+    def ack(self, entry_ids):
+        """Record that Discord confirmed these sends."""
+        now = time.time()
+        self._append([{"event": "ack", "id": i, "ts": now} for i in entry_ids])
+
+    def fail(self, entry_id, error, permanent=False):
+        """
+        Record a failed send.
+
+        Returns:
+            dict: The updated entry ("dead" once out of attempts or on a permanent error)
+        """
+        self._append([{"event": "failed", "id": entry_id, "error": str(error)[:500],
+                       "permanent": permanent, "ts": time.time()}])
+        return dict(self._entries[entry_id])
+
+    def requeue(self, entry_ids):
+        """Move dead letters back to pending with a fresh attempt budget."""
+        now = time.time()
+        self._append([{"event": "requeue", "id": i, "ts": now} for i in entry_ids])
+
+    def entries(self, status=None):
+        """Entries (optionally of one status), newest first."""
+        self.refresh()
+        with self._lock:
+            rows = [dict(e) for e in self._entries.values() if status is None or e["status"] == status]
+        return sorted(rows, key=lambda e: e["created"], reverse=True)
+
+    def counts(self):
+        """Number of entries per status."""
+        counts = {"pending": 0, "sent": 0, "dead": 0}
+        for entry in self.entries():
+            counts[entry["status"]] += 1
+        return counts
+
+    def compact(self, force=False):
+        """
+        Rewrite the log as one snapshot event per kept entry once it passes COMPACT_BYTES.
+
+        Returns:
+            bool: Whether the log was rewritten
+        """
+        try:
+            if not force and os.path.getsize(self.path) < COMPACT_BYTES:
+                return False
+        except FileNotFoundError:
+            return False
+        with file_lock(self.path):
+            self.refresh()
+            with self._lock:
+                entries = sorted(self._entries.values(), key=lambda e: e["created"])
+            sent = [e for e in entries if e["status"] == "sent"][-SENT_KEPT:]
+            kept = [e for e in entries if e["status"] != "sent"] + sent
+            kept.sort(key=lambda e: e["created"])
+            lines = [json.dumps({"event": "enqueue", "id": e["id"], "message_id": e["message_id"],
+                                 "response": e["response"], "source": e["source"], "ts": e["created"],
+                                 "status": e["status"], "attempts": e["attempts"], "next_at": e["next_at"],
+                                 "last_error": e["last_error"]}) + "\n" for e in kept]
+            atomic_write_text(self.path, "".join(lines))
+        self.refresh()
+        return True
+
+
+def from_config(cfg, path=OUTBOX_PATH):
+    """Build an Outbox with `outbox_max_attempts` / `outbox_backoff_seconds` from the config."""
+    return Outbox(path, max_attempts=cfg.get("outbox_max_attempts", DEFAULT_MAX_ATTEMPTS),
+                  backoff=cfg.get("outbox_backoff_seconds", DEFAULT_BACKOFF_SECONDS))
@@ -0,0 +1,148 @@
+"""
+Policy Document editor for Grovio
+
+Parses a markdown policy file (context/policies.md) once into a tree of
+heading sections, applies edits in memory and serializes it back. Unedited
+sections round-trip byte for byte, and headings are matched as plain text,
+so titles containing characters like "$" or "&" need no escaping.
+"""
+
+import re
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*$")
+
+
+class Section:
+    """A heading and the lines up to the next heading of the same or higher level."""
+
+    def __init__(self, level, title, heading_line):
+        self.level = level
+        self.title = title
+        self.heading_line = heading_line
+        self.body = []       # Lines between this heading and its first child
+        self.children = []
+
+    def render(self, out):
+        out.append(self.heading_line)
+        out.extend(self.body)
+        for child in self.children:
+            child.render(out)
+
+
+def normalize_title(title):
+    """Loose form of a heading for matching: no numbering, parenthetical suffix or case."""
+    title = re.sub(r"^\d+(\.\d+)*\.?\s+", "", title.strip())
+    title = re.sub(r"\s*\([^)]*\)\s*$", "", title)
+    return title.strip().lower()
+
+
+class PolicyDocument:
+    """
+    Heading tree for a markdown document.
+
+    Args:
+        text (str): Markdown source
+    """
+
+    def __init__(self, text):
+        self.trailing_newline = text.endswith("\n")
+        self.root = Section(0, "", None)
+        stack = [self.root]
+        for line in text.split("\n") if text else []:
+            match = HEADING_RE.match(line)
+            if match:
+                level = len(match.group(1))
+                while stack[-1].level >= level:
+                    stack.pop()
+                section = Section(level, match.group(2), line)
+                stack[-1].children.append(section)
+                stack.append(section)
+            else:
+                stack[-1].body.append(line)
+        if self.trailing_newline and self.root.children:
+            # The split above leaves an empty string for the final newline; keep it out of section bodies
+            last = self._last_section()
+            if last.body and last.body[-1] == "":
+                last.body.pop()
+        elif self.trailing_newline and self.root.body and self.root.body[-1] == "":
+            self.root.body.pop()
+
+    def _last_section(self):
+        node = self.root
+        while node.children:
+            node = node.children[-1]
+        return node
+
+    def sections(self):
+        """Yield every section in document order."""
+        stack = list(reversed(self.root.children))
+        while stack:
+            section = stack.pop()
+            yield section
+            stack.extend(reversed(section.children))
+
+    def find_section(self, title, level=2):
+        """
+        Find a section by heading text.
+
+        An exact title match wins; otherwise titles are compared without
+        numbering ("1. "), a trailing parenthetical ("(Key Points)") or case.
+
+        Args:
+            title (str): Heading text to look for
+            level (int): Heading level to search
+
+        Returns:
+            Section: The first matching section, or None
+        """
+        candidates = [s for s in self.sections() if s.level == level]
+        for section in candidates:
+            if section.title == title:
+                return section
+        wanted = normalize_title(title)
+        for section in candidates:
+            if normalize_title(section.title) == wanted:
+                return section
+        return None
+
+    def add_section(self, title, level=2):
+        """Append a new section at the end of the document."""
+        last = self._last_section()
+        while last.body and last.body[-1].strip() == "":
+            last.body.pop()
+        if last is not self.root or last.body:
+            last.body.append("")
+        section = Section(level, title, f"{'#' * level} {title}")
+        parent = self.root
+        while parent.children and parent.children[-1].level < level:
+            parent = parent.children[-1]
+        parent.children.append(section)
+        self.trailing_newline = True
+        return section
+
+    def append_bullets(self, section, bullets):
+        """
+        Add bullet points at the end of a section's own body.
+
+        Bullets are separated by blank lines, matching the policy file's layout,
+        and the blank line before the next heading is preserved.
+        """
+        body = section.body
+        trailing = 0
+        while body and body[-1].strip() == "":
+            body.pop()
+            trailing += 1
+        for bullet in bullets:
+            if not body or body[-1].strip():
+                body.append("")
+            body.append(f"- {bullet}")
+        is_last = section is self._last_section()
+        body.extend([""] * (0 if is_last else max(trailing, 1)))
+
+    def render(self):
+        """Serialize the document back to markdown."""
+        out = list(self.root.body)
+        for section in self.root.children:
+            section.render(out)
+        text = "\n".join(out)
+        return text + "\n" if self.trailing_newline else text
@@ -7,14 +7,26 @@ based on those interactions. These suggestions can then be reviewed by admins
 before being incorporated into the policy files.
 """
 
+import hashlib
+import heapq
 import json
+import os
+import re
 import yaml
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
 import numpy as np
-from openai import OpenAI
-from utils import embed, cosine_sim
+import accounting
+import metrics
+from policy_document import PolicyDocument
+from log_archive import eligible_ts, iter_log_reverse
+from storage import atomic_write_text
+from suggestion_store import SuggestionStore
+from utils import embed, cosine_sim, embed_batch, kmeans, make_client
 
 # Constants
 CONFIG_PATH = "config.yaml"
@@ -22,6 +34,25 @@ STORE_PATH = "store.jsonl"
 DISCORD_MESSAGES_PATH = "discord_messages.jsonl"
 POLICIES_PATH = "context/policies.md"
 SUGGESTED_POLICIES_PATH = "suggested_policies.jsonl"
+CHECKPOINT_PATH = "policy_checkpoint.json"
+EMBEDDING_CACHE_PATH = "policy_embeddings.npz"
+
+# Clustered analysis defaults (overridable in config.yaml)
+DEFAULT_WINDOW_HOURS = 24 * 7
+DEFAULT_CLUSTERS = 8
+SAMPLES_PER_CLUSTER = 5
+MAX_WORKERS = 4
+MAX_ANALYZED_CONVERSATIONS = 5000
+EMBED_BATCH_SIZE = 100
+EMBED_MAX_CHARS = 2000
+
+# Incremental analysis defaults (overridable in config.yaml)
+TOPIC_SIMILARITY_THRESHOLD = 0.75
+MAX_TOPICS = 16
+SCHEDULER_POLL_SECONDS = 60
+
+# Suggestions at least this similar to an existing policy are dropped
+DEDUP_THRESHOLD = 0.9
 
 def load_config():
     """Load configuration from YAML file."""
@@ -32,6 +63,56 @@ def load_config():
         print(f"Error loading config: {e}")
         return {"mode": "passive", "model": "gpt-4o-mini"}
 
+def _iter_store_conversations(since_ts=None):
+    """Yield store.jsonl exchanges newest first (stopping at `since_ts`)."""
+    for entry in iter_log_reverse(STORE_PATH, since_ts):
+        # Store records are finished when written, so the log is in eligibility order
+        if since_ts is not None and entry.get("ts", 0) <= since_ts:
+            return
+        yield {
+            "ts": entry.get("ts", 0),
+            "eligible_ts": entry.get("ts", 0),
+            "user": entry.get("user", ""),
+            "reply": entry.get("reply", ""),
+            "source": "store"
+        }
+
+def _iter_discord_conversations(since_ts=None):
+    """Yield responded Discord messages newest first (by arrival), skipping archive segments older than `since_ts`."""
+    for entry in iter_log_reverse(DISCORD_MESSAGES_PATH, since_ts):
+        # Only include messages that have been responded to
+        if entry.get("responded", False):
+            yield {
+                "ts": entry.get("ts", 0),
+                "eligible_ts": eligible_ts(entry),
+                "user": entry.get("content", ""),
+                "author": entry.get("author", "Unknown"),
+                "reply": entry.get("reply", ""),
+                "source": "discord"
+            }
+
+def iter_conversations(since_ts=None):
+    """
+    Lazily yield conversations from store.jsonl and discord_messages.jsonl, newest first.
+    
+    Both logs (active file, then archived segments) are read backwards from
+    the end and merged by timestamp, so consumers only pay for the records
+    they actually pull.
+    
+    Args:
+        since_ts (float): If set, archived segments with nothing written or
+            responded to after it are skipped, and store.jsonl stops there
+    
+    Yields:
+        dict: Conversation entries
+    """
+    return heapq.merge(
+        _iter_store_conversations(since_ts),
+        _iter_discord_conversations(since_ts),
+        key=lambda x: x.get("ts", 0),
+        reverse=True
+    )
+
 def load_conversations(limit=100):
     """
     Load recent conversations from both store.jsonl and discord_messages.jsonl.
@@ -40,56 +121,13 @@ def load_conversations(limit=100):
         limit (int): Maximum number of conversations to load
         
     Returns:
-        list: List of conversation entries
+        list: List of conversation entries, newest first
     """
-    conversations = []
-    
-    # Load from store.jsonl
-    if Path(STORE_PATH).exists():
-        try:
-            with open(STORE_PATH, "r") as f:
-                lines = f.readlines()
-                for line in reversed(lines[:limit]):  # Process most recent first
-                    try:
-                        entry = json.loads(line)
-                        conversations.append({
-                            "ts": entry.get("ts", 0),
-                            "user": entry.get("user", ""),
-                            "reply": entry.get("reply", ""),
-                            "source": "store"
-                        })
-                    except json.JSONDecodeError:
-                        continue
-        except Exception as e:
-            print(f"Error loading store data: {e}")
-    
-    # Load from discord_messages.jsonl
-    if Path(DISCORD_MESSAGES_PATH).exists():
-        try:
-            with open(DISCORD_MESSAGES_PATH, "r") as f:
-                lines = f.readlines()
-                for line in reversed(lines[:limit]):  # Process most recent first
-                    try:
-                        entry = json.loads(line)
-                        # Only include messages that have been responded to
-                        if entry.get("responded", False):
-                            conversations.append({
-                                "ts": entry.get("ts", 0),
-                                "user": entry.get("content", ""),
-                                "author": entry.get("author", "Unknown"),
-                                "reply": entry.get("reply", ""),
-                                "source": "discord"
-                            })
-                    except json.JSONDecodeError:
-                        continue
-        except Exception as e:
-            print(f"Error loading discord messages: {e}")
-    
-    # Sort by timestamp, newest first
-    conversations.sort(key=lambda x: x.get("ts", 0), reverse=True)
-    
-    # Limit to requested number
-    return conversations[:limit]
+    try:
+        return list(islice(iter_conversations(), limit))
+    except Exception as e:
+        print(f"Error loading conversations: {e}")
+        return []
 
 def load_current_policies():
     """Load the current policies from the policies.md file."""
@@ -101,41 +139,23 @@ def load_current_policies():
         print(f"Error loading policies: {e}")
         return ""
 
-def analyze_conversations(conversations, current_policies, client):
-    """
-    Analyze conversations to identify patterns and generate policy suggestions.
-    
-    Args:
-        conversations (list): List of conversation entries
-        current_policies (str): Current policies text
-        client (OpenAI): OpenAI client
-        
-    Returns:
-        dict: Policy suggestions with categories and confidence scores
-    """
-    if not conversations:
-        return None
-    
-    # Prepare conversation data for analysis
-    conversation_text = []
-    for conv in conversations[:20]:  # Limit to recent 20 for analysis
-        user_msg = conv.get("user", "")
-        reply = conv.get("reply", "")
-        if "author" in conv:
-            conversation_text.append(f"User ({conv['author']}): {user_msg}\nBot: {reply}")
-        else:
-            conversation_text.append(f"User: {user_msg}\nBot: {reply}")
-    
-    conversation_history = "\n\n".join(conversation_text)
-    
-    # Use the LLM to analyze conversations and suggest policy updates
-    prompt = f"""
+def format_conversation(conv):
+    """Render one conversation entry as prompt text."""
+    user_msg = conv.get("user", "")
+    reply = conv.get("reply", "")
+    if "author" in conv:
+        return f"User ({conv['author']}): {user_msg}\nBot: {reply}"
+    return f"User: {user_msg}\nBot: {reply}"
+
+def build_analysis_prompt(conversation_history, current_policies, heading="RECENT CONVERSATIONS"):
+    """Build the policy analysis prompt for a block of conversations."""
+    return f"""
     You are an AI policy analyst for Grovio, an AI-powered community growth platform.
     
     CURRENT POLICIES:
     {current_policies}
     
-    RECENT CONVERSATIONS:
+    {heading}:
     {conversation_history}
     
     Based on the above conversations between users and the Grovio bot, identify:
@@ -160,21 +180,33 @@ def analyze_conversations(conversations, current_policies, client):
     
     Only include high-quality suggestions with clear reasoning. If no significant policy gaps are identified, return an empty suggestions list.
     """
+
+def request_suggestions(prompt, client, model=None):
+    """
+    Run an analysis prompt and parse the JSON suggestions it returns.
     
+    Args:
+        prompt (str): Analysis or merge prompt
+        client (OpenAI): OpenAI client
+        model (str): Model to use (defaults to config)
+        
+    Returns:
+        dict: {"suggestions": [...]}, empty on errors
+    """
     try:
         response = client.chat.completions.create(
-            model=load_config().get("model", "gpt-4o-mini"),
+            model=model or load_config().get("model", "gpt-4o-mini"),
             messages=[{"role": "system", "content": prompt}],
             temperature=0.7,
             max_tokens=2000
         )
+        metrics.record_llm_call("chat", response, model)
         
         response_text = response.choices[0].message.content
         
         # Extract JSON from response
         try:
             # Find JSON part (between { and })
-            import re
             json_match = re.search(r'({.*})', response_text, re.DOTALL)
             if json_match:
                 response_text = json_match.group(1)
@@ -190,6 +222,303 @@ def analyze_conversations(conversations, current_policies, client):
         print(f"Error generating policy suggestions: {e}")
         return {"suggestions": []}
 
+def analyze_conversations(conversations, current_policies, client):
+    """
+    Analyze conversations to identify patterns and generate policy suggestions.
+    
+    Kept for existing callers; uses the clustered map-reduce analysis.
+    
+    Args:
+        conversations (list): List of conversation entries
+        current_policies (str): Current policies text
+        client (OpenAI): OpenAI client
+        
+    Returns:
+        dict: Policy suggestions with categories and confidence scores
+    """
+    return analyze_conversations_clustered(conversations, current_policies, client)
+
+def load_conversations_since(since_ts, limit=MAX_ANALYZED_CONVERSATIONS, oldest_first=False):
+    """
+    Load conversations that became eligible for analysis after a timestamp.
+    
+    A Discord draft becomes eligible when it is responded to (`responded_at`),
+    which can be long after it arrived, so Discord messages are filtered by
+    eligibility rather than read until the first old one.
+    
+    Args:
+        since_ts (float): Only include conversations with eligible_ts > since_ts
+        limit (int): Maximum number of conversations to load
+        oldest_first (bool): Return the oldest `limit` conversations (for
+            checkpointed paging) instead of the newest
+        
+    Returns:
+        list: Conversation entries, ordered by eligible_ts
+    """
+    try:
+        fresh = [c for c in iter_conversations(since_ts) if c["eligible_ts"] > since_ts]
+    except Exception as e:
+        print(f"Error loading conversations: {e}")
+        return []
+    fresh.sort(key=lambda c: c["eligible_ts"], reverse=not oldest_first)
+    if len(fresh) <= limit:
+        return fresh
+    page = fresh[:limit]
+    if oldest_first:
+        # Keep every conversation sharing the boundary timestamp in the next page,
+        # so a checkpoint at the page's last eligible_ts skips none of them
+        boundary = fresh[limit]["eligible_ts"]
+        trimmed = [c for c in page if c["eligible_ts"] < boundary]
+        page = trimmed or page
+    return page
+
+def embed_conversations(conversations, client):
+    """Embed conversations in batches; returns an L2-normalized matrix."""
+    texts = [format_conversation(conv)[:EMBED_MAX_CHARS] for conv in conversations]
+    X = embed_batch(texts, client, batch_size=EMBED_BATCH_SIZE)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms == 0, 1.0, norms)
+
+def cluster_conversations(conversations, client, n_clusters=DEFAULT_CLUSTERS):
+    """
+    Embed conversations in batches and group them with k-means.
+    
+    Args:
+        conversations (list): List of conversation entries
+        client (OpenAI): OpenAI client
+        n_clusters (int): Number of clusters (clipped to the number of conversations)
+        
+    Returns:
+        tuple: (normalized embedding matrix, centroids, labels)
+    """
+    X = embed_conversations(conversations, client)
+    centroids, labels = kmeans(X, n_clusters)
+    return X, centroids, labels
+
+def pick_representatives(X, centroids, labels, cluster, n):
+    """Return indices of the `n` members of `cluster` closest to its centroid."""
+    members = np.flatnonzero(labels == cluster)
+    sims = X[members] @ centroids[cluster]
+    return members[np.argsort(sims)[::-1][:n]]
+
+def merge_suggestions(cluster_results, current_policies, client, model=None):
+    """
+    Reduce step: merge per-cluster suggestions into one deduplicated list.
+    
+    Args:
+        cluster_results (list): {"suggestions": [...]} dicts from the map step
+        current_policies (str): Current policies text
+        client (OpenAI): OpenAI client
+        model (str): Model to use
+        
+    Returns:
+        dict: {"suggestions": [...]}
+    """
+    candidates = [s for result in cluster_results for s in result.get("suggestions", [])]
+    non_empty = [r for r in cluster_results if r.get("suggestions")]
+    if len(non_empty) <= 1:
+        return {"suggestions": candidates}
+    
+    prompt = f"""
+    You are an AI policy analyst for Grovio, an AI-powered community growth platform.
+    
+    CURRENT POLICIES:
+    {current_policies}
+    
+    CANDIDATE SUGGESTIONS (each produced from a different cluster of user conversations;
+    "support" is the number of conversations in that cluster):
+    {json.dumps(candidates, indent=2)}
+    
+    Merge these candidates into a final list: combine suggestions that address the same issue
+    (summing their "support"), drop any already covered by the current policies, and keep
+    the strongest wording. Respond with JSON using the same structure as the candidates:
+    {{"suggestions": [{{"category": ..., "issue": ..., "suggestion": ..., "confidence": 0.0-1.0, "reasoning": ..., "support": 0}}]}}
+    """
+    merged = request_suggestions(prompt, client, model)
+    # Fall back to the unmerged candidates if the reduce call failed
+    return merged if merged.get("suggestions") else {"suggestions": candidates}
+
+def analyze_conversations_clustered(conversations, current_policies, client, n_clusters=DEFAULT_CLUSTERS,
+                                    samples_per_cluster=SAMPLES_PER_CLUSTER, max_workers=MAX_WORKERS,
+                                    progress=None):
+    """
+    Map-reduce analysis over many conversations at a fixed number of LLM calls.
+    
+    Conversations are embedded and clustered; the samples closest to each
+    centroid are analyzed in parallel (one completion per cluster) and the
+    per-cluster suggestions are merged by a final completion.
+    
+    Args:
+        conversations (list): List of conversation entries
+        current_policies (str): Current policies text
+        client (OpenAI): OpenAI client
+        n_clusters (int): Number of topic clusters
+        samples_per_cluster (int): Representative conversations sent per cluster
+        max_workers (int): Maximum concurrent cluster analyses
+        progress (callable): Optional `progress(fraction, message)` callback
+        
+    Returns:
+        dict: Policy suggestions with categories and confidence scores
+    """
+    if not conversations:
+        return None
+    
+    progress = progress or (lambda fraction, message="": None)
+    model = load_config().get("model", "gpt-4o-mini")
+    progress(0.1, f"Clustering {len(conversations)} conversations")
+    X, centroids, labels = cluster_conversations(conversations, client, n_clusters)
+    total = len(conversations)
+    done = []
+    done_lock = threading.Lock()
+    
+    def analyze_cluster(cluster):
+        size = int((labels == cluster).sum())
+        if size == 0:
+            return {"suggestions": []}
+        samples = pick_representatives(X, centroids, labels, cluster, samples_per_cluster)
+        conversation_history = "\n\n".join(format_conversation(conversations[i]) for i in samples)
+        heading = f"REPRESENTATIVE CONVERSATIONS (topic cluster covering {size} of {total} conversations)"
+        result = request_suggestions(build_analysis_prompt(conversation_history, current_policies, heading), client, model)
+        for suggestion in result.get("suggestions", []):
+            suggestion["support"] = size
+        with done_lock:
+            done.append(cluster)
+            progress(0.2 + 0.6 * len(done) / len(centroids), f"Analyzed {len(done)} of {len(centroids)} topic clusters")
+        return result
+    
+    progress(0.2, f"Analyzing {len(centroids)} topic clusters")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        cluster_results = accounting.map_in_context(pool, analyze_cluster, range(len(centroids)))
+    
+    progress(0.85, "Merging suggestions")
+    return merge_suggestions(cluster_results, current_policies, client, model)
+
+def policy_bullets(policies_text):
+    """Extract the bullet points of the policies file."""
+    return [line[2:].strip() for line in policies_text.splitlines() if line.startswith("- ") and line[2:].strip()]
+
+def _text_hash(text):
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+def load_embedding_cache():
+    """Load the content-hash -> vector cache used for policy deduplication."""
+    try:
+        if Path(EMBEDDING_CACHE_PATH).exists():
+            with np.load(EMBEDDING_CACHE_PATH) as data:
+                return dict(zip(data["hashes"].tolist(), data["vectors"]))
+    except Exception as e:
+        print(f"Error loading embedding cache: {e}")
+    return {}
+
+def save_embedding_cache(cache):
+    """Persist the embedding cache atomically."""
+    tmp_path = f"{EMBEDDING_CACHE_PATH}.tmp.npz"
+    try:
+        np.savez(tmp_path, hashes=np.array(list(cache.keys())), vectors=np.array(list(cache.values())))
+        os.replace(tmp_path, EMBEDDING_CACHE_PATH)
+    except Exception as e:
+        print(f"Error saving embedding cache: {e}")
+
+def cached_embeddings(texts, client):
+    """
+    Embed texts, reusing vectors cached by content hash in EMBEDDING_CACHE_PATH.
+    
+    Args:
+        texts (list): Texts to embed
+        client (OpenAI): OpenAI client
+        
+    Returns:
+        np.array: L2-normalized float32 matrix, one row per text
+    """
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    cache = load_embedding_cache()
+    hashes = [_text_hash(t) for t in texts]
+    missing = {h: t for h, t in zip(hashes, texts) if h not in cache}
+    if missing:
+        vectors = embed_batch(list(missing.values()), client, batch_size=EMBED_BATCH_SIZE).astype(np.float32)
+        if cache and len(next(iter(cache.values()))) != vectors.shape[1]:
+            # The embedding model changed; cached vectors are no longer comparable
+            cache = {}
+            missing = {h: t for h, t in zip(hashes, texts)}
+            vectors = embed_batch(list(missing.values()), client, batch_size=EMBED_BATCH_SIZE).astype(np.float32)
+        cache.update(zip(missing.keys(), vectors))
+        save_embedding_cache(cache)
+    metrics.CACHE_HITS.inc(len(texts) - len(missing), cache="policy_embeddings")
+    metrics.CACHE_MISSES.inc(len(missing), cache="policy_embeddings")
+    
+    X = np.array([cache[h] for h in hashes], dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms == 0, 1.0, norms)
+
+def dedupe_suggestions(suggestions, client, threshold=DEDUP_THRESHOLD):
+    """
+    Filter or merge suggestions that restate existing policies or each other.
+    
+    Every suggestion gets a "redundancy" score: its highest cosine similarity
+    to a policy bullet in policies.md or to a pending suggestion. Suggestions
+    at or above `threshold` against those references are dropped; near-duplicates
+    within the batch are merged into the higher-confidence one.
+    
+    Args:
+        suggestions (dict): {"suggestions": [...]}
+        client (OpenAI): OpenAI client
+        threshold (float): Cosine similarity treated as a restatement
+        
+    Returns:
+        dict: {"suggestions": [...]} with redundancy scores
+    """
+    incoming = [s for s in suggestions.get("suggestions", []) if s.get("suggestion")]
+    if not incoming:
+        return {"suggestions": []}
+    
+    references = policy_bullets(load_current_policies())
+    references += [s.get("suggestion", "") for record in load_pending_suggestions()
+                   for s in record.get("suggestions", []) if s.get("suggestion")]
+    
+    try:
+        X = cached_embeddings([s["suggestion"] for s in incoming], client)
+        R = cached_embeddings(references, client) if references else None
+    except Exception as e:
+        print(f"Error embedding suggestions for deduplication: {e}")
+        return {"suggestions": incoming}
+    
+    if R is not None:
+        ref_sims = X @ R.T
+        best_ref = ref_sims.argmax(axis=1)
+        redundancy = ref_sims[np.arange(len(incoming)), best_ref]
+    else:
+        best_ref = np.zeros(len(incoming), dtype=int)
+        redundancy = np.zeros(len(incoming))
+    
+    kept, kept_rows, dropped, merged = [], [], 0, 0
+    for i in np.argsort([-s.get("confidence", 0.0) for s in incoming], kind="stable"):
+        suggestion = dict(incoming[i])
+        suggestion["redundancy"] = round(float(redundancy[i]), 3)
+        if R is not None:
+            suggestion["closest_policy"] = references[best_ref[i]][:200]
+        if redundancy[i] >= threshold:
+            dropped += 1
+            continue
+        if kept_rows:
+            sims = X[kept_rows] @ X[i]
+            j = int(sims.argmax())
+            if sims[j] >= threshold:
+                # Merge into the higher-confidence suggestion already kept
+                kept[j]["support"] = kept[j].get("support", 0) + suggestion.get("support", 0)
+                merged += 1
+                continue
+        kept.append(suggestion)
+        kept_rows.append(i)
+    
+    if dropped or merged:
+        print(f"Deduplicated policy suggestions: {dropped} dropped as restatements, {merged} merged")
+    return {"suggestions": kept}
+
+def suggestion_store():
+    """Return the suggestion store backing suggested_policies.jsonl."""
+    return SuggestionStore(SUGGESTED_POLICIES_PATH)
+
 def save_policy_suggestions(suggestions):
     """
     Save generated policy suggestions to file for later review.
@@ -201,17 +530,7 @@ def save_policy_suggestions(suggestions):
         bool: True if successful, False otherwise
     """
     try:
-        # Create a record with timestamp
-        record = {
-            "ts": time.time(),
-            "suggestions": suggestions.get("suggestions", []),
-            "status": "pending"  # pending, approved, rejected
-        }
-        
-        # Write to file
-        with open(SUGGESTED_POLICIES_PATH, "a") as f:
-            f.write(json.dumps(record) + "\n")
-        
+        suggestion_store().add(suggestions.get("suggestions", []), usage=suggestions.get("usage"))
         return True
     except Exception as e:
         print(f"Error saving policy suggestions: {e}")
@@ -221,73 +540,37 @@ def load_pending_suggestions():
     """
     Load pending policy suggestions for admin review.
     
+    Only pending records are read, via the store's pending index.
+    
     Returns:
-        list: List of pending policy suggestion records
+        list: List of pending policy suggestion records (each with an "id")
     """
-    pending = []
-    
-    if not Path(SUGGESTED_POLICIES_PATH).exists():
-        return pending
-    
     try:
-        with open(SUGGESTED_POLICIES_PATH, "r") as f:
-            for line in f:
-                try:
-                    record = json.loads(line)
-                    if record.get("status") == "pending":
-                        pending.append(record)
-                except json.JSONDecodeError:
-                    continue
+        return suggestion_store().pending()
     except Exception as e:
         print(f"Error loading policy suggestions: {e}")
-    
-    return pending
+        return []
 
-def update_suggestion_status(timestamp, status, approved_suggestions=None):
+def update_suggestion_status(suggestion_id, status, approved_suggestions=None):
     """
     Update the status of a policy suggestion.
     
     Args:
-        timestamp (float): Timestamp of the suggestion to update
+        suggestion_id (str): Id of the suggestion set to update (a float
+            timestamp is also accepted for older callers)
         status (str): New status ('approved' or 'rejected')
         approved_suggestions (list): List of approved suggestions if status is 'approved'
         
     Returns:
         bool: True if successful, False otherwise
     """
-    if not Path(SUGGESTED_POLICIES_PATH).exists():
-        return False
-    
     try:
-        # Read all records
-        records = []
-        with open(SUGGESTED_POLICIES_PATH, "r") as f:
-            for line in f:
-                try:
-                    record = json.loads(line)
-                    records.append(record)
-                except json.JSONDecodeError:
-                    continue
-        
-        # Update the matching record
-        updated = False
-        for record in records:
-            if abs(record.get("ts", 0) - timestamp) < 0.001:  # Small float comparison tolerance
-                record["status"] = status
-                if status == "approved" and approved_suggestions:
-                    record["approved_suggestions"] = approved_suggestions
-                updated = True
-                break
-        
-        if not updated:
-            return False
-        
-        # Write back all records
-        with open(SUGGESTED_POLICIES_PATH, "w") as f:
-            for record in records:
-                f.write(json.dumps(record) + "\n")
-        
-        return True
+        store = suggestion_store()
+        if isinstance(suggestion_id, (int, float)):
+            suggestion_id = store.find_pending_by_ts(suggestion_id)
+            if suggestion_id is None:
+                return False
+        return store.set_status(suggestion_id, status, approved_suggestions)
     except Exception as e:
         print(f"Error updating policy suggestion status: {e}")
         return False
@@ -296,106 +579,366 @@ def apply_approved_suggestions(approved_suggestions):
     """
     Apply approved policy suggestions to the policies.md file.
     
+    The file is parsed once into a heading tree, every suggestion is inserted
+    as a bullet at the end of its category's section (created at the end of
+    the file if no section matches) and the result is written back atomically.
+    Categories match a "## " heading exactly first, then ignoring numbering
+    and a trailing parenthetical, so "Privacy Policy" finds
+    "## 1. Privacy Policy (Key Points)".
+    
     Args:
         approved_suggestions (list): List of approved suggestions to apply
         
     Returns:
-        bool: True if successful, False otherwise
+        set: Titles of the sections that were changed or created (empty if nothing was applied)
     """
     if not approved_suggestions:
-        return False
+        return set()
     
     try:
-        # Load current policies
-        current_policies = load_current_policies()
+        document = PolicyDocument(load_current_policies())
         
-        # Group suggestions by category
+        # Group suggestions by category, keeping first-seen order
         categories = {}
         for suggestion in approved_suggestions:
-            category = suggestion.get("category")
-            if category not in categories:
-                categories[category] = []
-            categories[category].append(suggestion.get("suggestion", ""))
+            category = (suggestion.get("category") or "New Category").strip()
+            categories.setdefault(category, []).append(suggestion.get("suggestion", ""))
         
-        # Apply updates by category
+        changed = set()
         for category, suggestions in categories.items():
-            # Check if this is a new category
-            category_header = f"## {category}"
-            if category_header not in current_policies and "New Category" not in category:
-                # Add new category at the end
-                current_policies += f"\n\n## {category}\n\n"
-                for suggestion in suggestions:
-                    current_policies += f"- {suggestion}\n"
-            else:
-                # For existing categories, add suggestions at the end of the section
-                import re
-                
-                # Clean category name for regex
-                clean_category = category.replace("$", r"\$").replace("&", r"\&")
-                
-                # Find the section
-                pattern = rf"## {clean_category}.*?(?=\n\n## |$)"
-                match = re.search(pattern, current_policies, re.DOTALL)
-                
-                if match:
-                    section = match.group(0)
-                    updated_section = section
-                    
-                    # Add each suggestion as a new bullet point
-                    for suggestion in suggestions:
-                        updated_section += f"\n\n- {suggestion}"
-                    
-                    # Replace the old section with the updated one
-                    current_policies = current_policies.replace(section, updated_section)
-                else:
-                    # If category specified in suggestion doesn't match exactly
-                    # Add as a new category
-                    current_policies += f"\n\n## {category}\n\n"
-                    for suggestion in suggestions:
-                        current_policies += f"- {suggestion}\n"
-        
-        # Write updated policies back to file
-        with open(POLICIES_PATH, "w") as f:
-            f.write(current_policies)
+            section = document.find_section(category) or document.add_section(category)
+            document.append_bullets(section, suggestions)
+            changed.add(section.title)
         
-        return True
+        atomic_write_text(POLICIES_PATH, document.render())
+        return changed
     except Exception as e:
         print(f"Error applying policy suggestions: {e}")
-        return False
+        return set()
 
-def generate_policy_suggestions():
+def generate_policy_suggestions(progress=None):
     """
     Main function to generate policy suggestions based on conversation analysis.
     
+    Every conversation in the configured window (`policy_window_hours`) is
+    clustered and analyzed with `analyze_conversations_clustered`.
+    
+    Args:
+        progress (callable): Optional `progress(fraction, message)` callback,
+            e.g. from a `jobs.JobRunner` job
+    
     Returns:
         dict: Generated suggestions or None if error
     """
+    progress = progress or (lambda fraction, message="": None)
     try:
-        # Load config and initialize OpenAI client
-        cfg = load_config()
-        client = OpenAI(api_key=cfg.get("openai_api_key"))
+        with accounting.track() as usage:
+            # Load config and initialize OpenAI client
+            cfg = load_config()
+            client = make_client(cfg)
         
-        # Load data
-        conversations = load_conversations(limit=50)
-        current_policies = load_current_policies()
+            # Load data
+            progress(0.0, "Loading conversations")
+            window_hours = cfg.get("policy_window_hours", DEFAULT_WINDOW_HOURS)
+            conversations = load_conversations_since(time.time() - window_hours * 3600)
+            current_policies = load_current_policies()
         
-        # Analyze conversations
-        suggestions = analyze_conversations(conversations, current_policies, client)
+            # Analyze conversations
+            suggestions = analyze_conversations_clustered(
+                conversations,
+                current_policies,
+                client,
+                n_clusters=cfg.get("policy_clusters", DEFAULT_CLUSTERS),
+                samples_per_cluster=cfg.get("policy_samples_per_cluster", SAMPLES_PER_CLUSTER),
+                max_workers=cfg.get("policy_max_workers", MAX_WORKERS),
+                progress=progress,
+            )
         
-        # Save suggestions for later review
-        if suggestions and suggestions.get("suggestions"):
-            save_policy_suggestions(suggestions)
-            return suggestions
+            # Drop restatements of existing policies / pending suggestions
+            if suggestions and suggestions.get("suggestions"):
+                progress(0.9, "Removing suggestions already covered by policies")
+                suggestions = dedupe_suggestions(suggestions, client, cfg.get("policy_dedup_threshold", DEDUP_THRESHOLD))
         
-        return None
+            # Save suggestions for later review, with what they cost to generate
+            if suggestions and suggestions.get("suggestions"):
+                suggestions["usage"] = usage.to_dict()
+                save_policy_suggestions(suggestions)
+                return suggestions
+        
+            return None
     except Exception as e:
         print(f"Error generating policy suggestions: {e}")
         return None
 
+def load_checkpoint():
+    """
+    Load the incremental analysis checkpoint.
+    
+    Returns:
+        dict: {"last_ts": float, "topics": [{"centroid", "count", "summary", "updated"}], "runs": int}
+    """
+    try:
+        if Path(CHECKPOINT_PATH).exists():
+            with open(CHECKPOINT_PATH, "r") as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Error loading policy checkpoint: {e}")
+    return {"last_ts": 0.0, "topics": [], "runs": 0}
+
+def save_checkpoint(checkpoint):
+    """Persist the incremental analysis checkpoint atomically."""
+    atomic_write_text(CHECKPOINT_PATH, json.dumps(checkpoint))
+
+def assign_topics(X, centroids, threshold, max_topics, n_new_clusters):
+    """
+    Assign new conversation embeddings to existing topics or to new ones.
+    
+    Conversations whose best cosine similarity to an existing topic centroid is
+    below `threshold` are clustered among themselves into new topics, as long
+    as the total stays under `max_topics`.
+    
+    Args:
+        X (np.array): Normalized embeddings of the new conversations
+        centroids (np.array): Existing topic centroids, shape (t, dim); may be empty
+        threshold (float): Minimum similarity to join an existing topic
+        max_topics (int): Cap on the total number of topics
+        n_new_clusters (int): Upper bound on topics created in this run
+        
+    Returns:
+        tuple: (labels indexing into the returned centroids, centroids of new topics)
+    """
+    n_existing = len(centroids)
+    labels = np.full(len(X), -1)
+    if n_existing:
+        sims = X @ centroids.T
+        best = sims.argmax(axis=1)
+        joined = sims[np.arange(len(X)), best] >= threshold
+        labels[joined] = best[joined]
+    
+    unassigned = np.flatnonzero(labels < 0)
+    room = max_topics - n_existing
+    new_centroids = np.empty((0, X.shape[1]))
+    if len(unassigned) and (room > 0 or not n_existing):
+        new_centroids, new_labels = kmeans(X[unassigned], max(1, min(room, n_new_clusters)))
+        labels[unassigned] = n_existing + new_labels
+    elif len(unassigned):
+        # No room for new topics: fold into the nearest existing one
+        labels[unassigned] = best[unassigned]
+    return labels, new_centroids
+
+def summarize_topic(summary, conversations, count, client, model=None):
+    """
+    Fold new conversations into a running topic summary.
+    
+    Args:
+        summary (str): Current summary ("" for a new topic)
+        conversations (list): Representative new conversations for the topic
+        count (int): Total conversations in the topic after this run
+        client (OpenAI): OpenAI client
+        model (str): Model to use
+        
+    Returns:
+        str: Updated summary (the old one if the call fails)
+    """
+    conversation_history = "\n\n".join(format_conversation(conv) for conv in conversations)
+    prompt = f"""
+    You maintain a running summary of one topic in user conversations with the Grovio bot.
+    
+    CURRENT SUMMARY:
+    {summary or "(new topic)"}
+    
+    NEW CONVERSATIONS:
+    {conversation_history}
+    
+    Update the summary to cover the new conversations as well ({count} conversations in total).
+    Note recurring questions, misunderstandings and inconsistent answers. Reply with the
+    updated summary only, in at most 150 words.
+    """
+    try:
+        response = client.chat.completions.create(
+            model=model or load_config().get("model", "gpt-4o-mini"),
+            messages=[{"role": "system", "content": prompt}],
+            temperature=0.3,
+            max_tokens=300
+        )
+        metrics.record_llm_call("chat", response, model)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error updating topic summary: {e}")
+        return summary
+
+def run_incremental_analysis(client=None):
+    """
+    Analyze only conversations newer than the checkpoint and fold them into topic summaries.
+    
+    New conversations are embedded and assigned to persisted topics (or new
+    ones); each touched topic's summary is updated with one completion and a
+    final completion turns the updated summaries into policy suggestions. The
+    checkpoint is advanced only after the run succeeds.
+    
+    The checkpoint is the latest eligibility time analyzed (when a record was
+    written, or when a Discord draft was responded to). Drafts approved after
+    a run are therefore picked up by the next one. A backlog larger than
+    MAX_ANALYZED_CONVERSATIONS is processed oldest first, one page per run.
+    
+    Args:
+        client (OpenAI): OpenAI client (created from config if omitted)
+        
+    Returns:
+        dict: Generated suggestions, or None if there was nothing new or no suggestions
+    """
+    with accounting.track() as usage:
+        cfg = load_config()
+        client = client or make_client(cfg)
+        model = cfg.get("model", "gpt-4o-mini")
+        checkpoint = load_checkpoint()
+    
+        # Oldest first: a backlog over MAX_ANALYZED_CONVERSATIONS is worked through page by page
+        conversations = load_conversations_since(checkpoint.get("last_ts", 0.0), oldest_first=True)
+        if not conversations:
+            return None
+    
+        X = embed_conversations(conversations, client)
+        topics = checkpoint.get("topics", [])
+        centroids = np.array([t["centroid"] for t in topics]) if topics else np.empty((0, X.shape[1]))
+        labels, new_centroids = assign_topics(
+            X,
+            centroids,
+            cfg.get("policy_topic_threshold", TOPIC_SIMILARITY_THRESHOLD),
+            cfg.get("policy_max_topics", MAX_TOPICS),
+            cfg.get("policy_clusters", DEFAULT_CLUSTERS),
+        )
+        topics = topics + [{"centroid": c.tolist(), "count": 0, "summary": "", "updated": 0} for c in new_centroids]
+        all_centroids = np.vstack([centroids, new_centroids]) if len(new_centroids) else centroids
+    
+        # Update running centroids (count-weighted mean, renormalized)
+        touched = sorted(set(labels.tolist()))
+        for t in touched:
+            members = X[labels == t]
+            topic = topics[t]
+            total = topic["count"] + len(members)
+            centroid = (np.array(topic["centroid"]) * topic["count"] + members.sum(axis=0)) / total
+            norm = np.linalg.norm(centroid)
+            topic["centroid"] = (centroid / norm if norm else centroid).tolist()
+            topic["count"] = total
+    
+        samples_per_topic = cfg.get("policy_samples_per_cluster", SAMPLES_PER_CLUSTER)
+    
+        def update_topic(t):
+            samples = pick_representatives(X, all_centroids, labels, t, samples_per_topic)
+            return summarize_topic(topics[t]["summary"], [conversations[i] for i in samples], topics[t]["count"], client, model)
+    
+        with ThreadPoolExecutor(max_workers=cfg.get("policy_max_workers", MAX_WORKERS)) as pool:
+            summaries = accounting.map_in_context(pool, update_topic, touched)
+        now = time.time()
+        for t, summary in zip(touched, summaries):
+            topics[t]["summary"] = summary
+            topics[t]["updated"] = now
+    
+        # One completion turns the updated topic summaries into suggestions
+        topic_text = "\n\n".join(
+            f"Topic ({topics[t]['count']} conversations, {int((labels == t).sum())} new): {topics[t]['summary']}"
+            for t in touched
+        )
+        suggestions = request_suggestions(
+            build_analysis_prompt(topic_text, load_current_policies(), heading="CONVERSATION TOPIC SUMMARIES"),
+            client,
+            model,
+        )
+        if suggestions.get("suggestions"):
+            suggestions = dedupe_suggestions(suggestions, client, cfg.get("policy_dedup_threshold", DEDUP_THRESHOLD))
+        if suggestions.get("suggestions"):
+            suggestions["usage"] = usage.to_dict()
+            save_policy_suggestions(suggestions)
+    
+        checkpoint.update({
+            "last_ts": max(conv["eligible_ts"] for conv in conversations),
+            "topics": topics,
+            "runs": checkpoint.get("runs", 0) + 1,
+        })
+        save_checkpoint(checkpoint)
+        print(f"Incremental policy analysis: {len(conversations)} new conversation(s), "
+              f"{len(touched)} topic(s) updated, {len(suggestions.get('suggestions', []))} suggestion(s), "
+              f"{usage.total_calls} LLM call(s), {usage.total_tokens} token(s)")
+        return suggestions if suggestions.get("suggestions") else None
+
+def count_new_conversations(cap):
+    """Count conversations newer than the checkpoint, stopping at `cap`."""
+    since = load_checkpoint().get("last_ts", 0.0)
+    return len(load_conversations_since(since, limit=cap))
+
+class PolicyScheduler(threading.Thread):
+    """
+    Background thread that runs `run_incremental_analysis` every `interval_minutes`
+    or as soon as `min_new` conversations have arrived since the last checkpoint.
+    """
+    
+    def __init__(self, interval_minutes=0, min_new=0, poll_seconds=SCHEDULER_POLL_SECONDS):
+        super().__init__(daemon=True, name="policy-scheduler")
+        self.interval = interval_minutes * 60
+        self.min_new = min_new
+        self.poll_seconds = poll_seconds
+        self.last_run = time.time()
+        self._stop_event = threading.Event()
+    
+    def due(self):
+        if self.interval and time.time() - self.last_run >= self.interval:
+            return True
+        return bool(self.min_new) and count_new_conversations(self.min_new) >= self.min_new
+    
+    def run(self):
+        while not self._stop_event.wait(self.poll_seconds):
+            try:
+                if self.due():
+                    self.last_run = time.time()
+                    run_incremental_analysis()
+            except Exception as e:
+                print(f"Error in scheduled policy analysis: {e}")
+    
+    def stop(self):
+        self._stop_event.set()
+
+def start_policy_scheduler(cfg=None):
+    """
+    Start the background policy scheduler if enabled in config.
+    
+    Uses `policy_schedule_minutes` and `policy_schedule_new_conversations`;
+    the scheduler is disabled when both are 0 (the default).
+    
+    Returns:
+        PolicyScheduler: The running scheduler, or None if disabled
+    """
+    cfg = cfg if cfg is not None else load_config()
+    interval = cfg.get("policy_schedule_minutes", 0) or 0
+    min_new = cfg.get("policy_schedule_new_conversations", 0) or 0
+    if not interval and not min_new:
+        return None
+    scheduler = PolicyScheduler(interval, min_new)
+    scheduler.start()
+    print(f"Policy scheduler started (every {interval} min or after {min_new} new conversations)")
+    return scheduler
+
 if __name__ == "__main__":
-    # Test the policy generator
-    suggestions = generate_policy_suggestions()
-    if suggestions:
-        print(f"Generated {len(suggestions.get('suggestions', []))} policy suggestions")
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate policy suggestions from past conversations.")
+    parser.add_argument("--incremental", action="store_true", help="Only analyze conversations newer than the checkpoint")
+    parser.add_argument("--schedule", action="store_true", help="Run incremental analysis on the configured schedule")
+    args = parser.parse_args()
+    
+    if args.schedule:
+        scheduler = start_policy_scheduler()
+        if scheduler is None:
+            print("Set policy_schedule_minutes or policy_schedule_new_conversations in config.yaml to enable the scheduler")
+        else:
+            try:
+                while scheduler.is_alive():
+                    scheduler.join(1)
+            except KeyboardInterrupt:
+                scheduler.stop()
     else:
-        print("No policy suggestions generated")
+        # Test the policy generator
+        suggestions = run_incremental_analysis() if args.incremental else generate_policy_suggestions()
+        if suggestions:
+            print(f"Generated {len(suggestions.get('suggestions', []))} policy suggestions")
+        else:
+            print("No policy suggestions generated")
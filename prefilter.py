@@ -0,0 +1,159 @@
+"""
+Message Pre-filter for Grovio
+
+Decides, before the LLM pipeline runs, whether a Discord message is a
+question or request the bot should answer. Clear cases are settled by local
+rules (mentions, question marks and question words, product keywords,
+emoji-only or link-only messages, short chatter such as "gm" or "lol").
+Greetings and thanks that are canned-reply examples ("hi", "hello",
+"thanks", "bye") are let through, since the canned path answers them
+without a completion. Ambiguous messages fall back to a word-count rule or, when enabled, a small
+embedding classifier that compares the message with example questions and
+example chatter.
+"""
+
+import re
+
+import numpy as np
+
+from canned import INTENT_EXAMPLES, normalize
+from utils import embed, embed_batch
+
+DEFAULT_MIN_WORDS = 4
+DEFAULT_MARGIN = 0.0
+
+CHATTER = {
+    "gm", "gn", "gg", "lol", "lmao", "lmfao", "rofl", "haha", "hahaha", "xd", "ok", "okay", "k", "kk",
+    "nice", "cool", "wow", "yes", "no", "yep", "nope", "ty", "thx", "np", "brb", "afk", "same", "true",
+    "based", "wagmi", "ngmi", "lfg", "fr", "+1", "this", "^", "^^", "f", "rip", "yo", "sup",
+}
+# Messages equal to a canned-reply example are answered by the zero-completion canned path
+CANNED_PHRASES = {normalize(example) for intent in INTENT_EXAMPLES.values() for example in intent["examples"]}
+QUESTION_WORDS = {
+    "what", "how", "why", "when", "where", "who", "which", "can", "could", "does", "do", "is", "are",
+    "will", "would", "should", "any", "anyone", "is there", "pls", "please", "help",
+}
+KEYWORDS = {
+    "grovio", "grov", "$grov", "token", "tokens", "pricing", "price", "integration", "integrate",
+    "support", "bug", "error", "broken", "dashboard", "privacy", "data", "account", "refund",
+    "waitlist", "beta", "demo", "api", "setup", "quest", "quests", "rewards",
+}
+
+URL_RE = re.compile(r"https?://\S+|www\.\S+")
+CUSTOM_EMOJI_RE = re.compile(r"<a?:\w+:\d+>")
+MENTION_RE = re.compile(r"<[@#][!&]?\d+>")
+WORD_RE = re.compile(r"[\w$']+")
+
+QUESTION_EXAMPLES = [
+    "how do I connect grovio to my discord server",
+    "what is the grov token used for",
+    "is there a way to export community analytics",
+    "my quests are not showing up in the dashboard",
+    "can someone help me with the integration setup",
+    "when will the beta open to more projects",
+]
+CHATTER_EXAMPLES = [
+    "gm everyone have a great day",
+    "lol that meme is great",
+    "congrats on the launch team",
+    "see you all tomorrow",
+    "I agree with you on that one",
+    "that was a fun community call",
+]
+
+
+def words(text):
+    """Lowercased word tokens with links, custom emoji and mentions removed."""
+    text = URL_RE.sub(" ", text)
+    text = CUSTOM_EMOJI_RE.sub(" ", text)
+    text = MENTION_RE.sub(" ", text)
+    return WORD_RE.findall(text.lower())
+
+
+def classify(text, mentioned=False, min_words=DEFAULT_MIN_WORDS):
+    """
+    Rule-based first pass.
+
+    Args:
+        text (str): Message content
+        mentioned (bool): Whether the message mentions or replies to the bot
+        min_words (int): Messages with fewer words and no question signal are skipped
+
+    Returns:
+        tuple: (decision, reason) where decision is True (answer), False (skip)
+        or None (ambiguous: long enough, but no question or keyword signal)
+    """
+    if mentioned:
+        return True, "mention"
+    stripped = text.strip()
+    if not stripped:
+        return False, "empty"
+    tokens = words(stripped)
+    if not tokens:
+        return False, "link" if URL_RE.search(stripped) else "emoji"
+    if normalize(stripped) in CANNED_PHRASES:
+        return True, "canned"
+    if " ".join(tokens) in CHATTER or all(t in CHATTER for t in tokens):
+        return False, "chatter"
+    if "?" in stripped or tokens[0] in QUESTION_WORDS or " ".join(tokens[:2]) in QUESTION_WORDS:
+        return True, "question"
+    if KEYWORDS.intersection(tokens):
+        return True, "keyword"
+    if len(tokens) < min_words:
+        return False, "short"
+    return None, "ambiguous"
+
+
+class EmbeddingClassifier:
+    """
+    Nearest-centroid classifier: is a message closer to example questions for
+    the bot than to example member chatter?
+
+    Args:
+        client (OpenAI): Client used for embeddings
+    """
+
+    def __init__(self, client):
+        self.client = client
+        vectors = embed_batch(QUESTION_EXAMPLES + CHATTER_EXAMPLES, client)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+        self.question = vectors[:len(QUESTION_EXAMPLES)].mean(axis=0)
+        self.chatter = vectors[len(QUESTION_EXAMPLES):].mean(axis=0)
+
+    def margin(self, text):
+        """Similarity to the question centroid minus similarity to the chatter centroid."""
+        vector = embed(text, self.client)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        return float(vector @ self.question - vector @ self.chatter)
+
+
+def should_process(text, cfg, mentioned=False, classifier=None):
+    """
+    Decide whether a message should go through the reply pipeline.
+
+    Ambiguous messages are sent to `classifier` when one is given (this makes
+    an embedding call, so callers on an event loop should run it in a thread);
+    without a classifier they are processed.
+
+    Args:
+        text (str): Message content
+        cfg (dict): Configuration (`prefilter_min_words`, `prefilter_margin`)
+        mentioned (bool): Whether the message mentions or replies to the bot
+        classifier (EmbeddingClassifier): Optional classifier for ambiguous messages
+
+    Returns:
+        tuple: (process, reason)
+    """
+    decision, reason = classify(text, mentioned, cfg.get("prefilter_min_words", DEFAULT_MIN_WORDS))
+    if decision is not None:
+        return decision, reason
+    if classifier is None:
+        return True, reason
+    try:
+        margin = classifier.margin(text)
+    except Exception as e:
+        print(f"Error in pre-filter classifier: {e}")
+        return True, reason
+    if margin >= cfg.get("prefilter_margin", DEFAULT_MARGIN):
+        return True, "classifier"
+    return False, "classifier"
@@ -0,0 +1,246 @@
+"""
+Sampled Request Profiling for Grovio
+
+Opt-in profiling of `main.handle` / `main.handle_async` and the Discord bot's
+storage functions. A `profile_sample_rate` fraction of calls runs under
+cProfile (and, unless `profile_tracemalloc` is false, tracemalloc). Each
+sampled call writes to `profile_dir` (default profiles/):
+
+- <id>.prof: cProfile stats, readable with pstats or snakeviz
+- <id>.json: name, timestamp, wall time and the top allocation sites
+  (bytes/blocks allocated during the call, by file:line)
+
+tracemalloc is process-wide, so allocations of concurrent requests show up in
+each other's snapshots; cProfile only sees the calling thread (for the async
+pipeline, that is every task on the event loop while the request runs).
+
+Aggregate the dumps with:
+
+    python profiling.py --top 25
+    python profiling.py --name handle --sort tottime
+"""
+
+import argparse
+import cProfile
+import functools
+import glob
+import inspect
+import itertools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+DEFAULT_DIR = "profiles"
+DEFAULT_KEEP = 500          # Dumps kept per directory; older ones are pruned
+ALLOC_TOP = 25              # Allocation sites saved per request
+TRACEMALLOC_FRAMES = 1
+
+_settings = {"rate": 0.0, "dir": DEFAULT_DIR, "tracemalloc": True, "keep": DEFAULT_KEEP}
+_local = threading.local()
+_seq = itertools.count()
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def configure(cfg):
+    """
+    Apply the profiling config keys.
+
+    Args:
+        cfg (dict): Configuration with optional `profile_sample_rate` (0-1, default 0),
+            `profile_dir`, `profile_tracemalloc` and `profile_keep`
+    """
+    _settings["rate"] = float(cfg.get("profile_sample_rate", 0.0) or 0.0)
+    _settings["dir"] = cfg.get("profile_dir", DEFAULT_DIR)
+    _settings["tracemalloc"] = cfg.get("profile_tracemalloc", True)
+    _settings["keep"] = int(cfg.get("profile_keep", DEFAULT_KEEP))
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc(before):
+    global _tracemalloc_users
+    after = tracemalloc.take_snapshot()
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    stats = after.compare_to(before, "lineno")
+    top = [s for s in stats if s.size_diff > 0][:ALLOC_TOP]
+    return [{
+        "where": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+        "size_diff": s.size_diff,
+        "count_diff": s.count_diff,
+    } for s in top]
+
+
+def _prune(directory, keep):
+    dumps = sorted(glob.glob(os.path.join(directory, "*.json")))
+    for meta in dumps[:max(0, len(dumps) - keep)]:
+        for path in (meta, meta[:-len(".json")] + ".prof"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+@contextmanager
+def profiled(name):
+    """
+    Profile the block for a sampled fraction of calls.
+
+    Calls nested inside an already profiled block in the same thread are not
+    sampled again (one cProfile per thread).
+
+    Args:
+        name (str): Label for the dump (e.g. "handle", "storage.save_message_map")
+    """
+    rate = _settings["rate"]
+    if rate <= 0 or getattr(_local, "active", False) or random.random() >= rate:
+        yield
+        return
+    _local.active = True
+    use_tracemalloc = _settings["tracemalloc"]
+    before = None
+    profiler = None
+    try:
+        if use_tracemalloc:
+            before = _start_tracemalloc()
+        profiler = cProfile.Profile()
+        profiler.enable()
+    except Exception as e:
+        # e.g. "Another profiling tool is already active" (Python 3.12+, profiler
+        # in another thread); the call itself must not fail because of profiling
+        if before is not None:
+            _stop_tracemalloc(before)
+        _local.active = False
+        print(f"Skipping profile for {name}: {e}")
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        _local.active = False
+        allocations = _stop_tracemalloc(before) if use_tracemalloc else []
+        try:
+            _write_dump(name, profiler, elapsed, allocations)
+        except Exception as e:
+            print(f"Error writing profile for {name}: {e}")
+
+
+def _write_dump(name, profiler, elapsed, allocations):
+    directory = _settings["dir"]
+    os.makedirs(directory, exist_ok=True)
+    dump_id = f"{time.time():.3f}-{os.getpid()}-{next(_seq)}-{name}"
+    profiler.dump_stats(os.path.join(directory, f"{dump_id}.prof"))
+    with open(os.path.join(directory, f"{dump_id}.json"), "w") as f:
+        json.dump({"name": name, "ts": time.time(), "elapsed_s": elapsed, "allocations": allocations}, f)
+    _prune(directory, _settings["keep"])
+
+
+def sampled(name):
+    """Decorator form of `profiled` for functions and coroutine functions."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with profiled(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with profiled(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def load_dumps(directory=DEFAULT_DIR, name=None):
+    """
+    List profile dumps, oldest first.
+
+    Returns:
+        list: (metadata dict, .prof path) pairs
+    """
+    dumps = []
+    for meta_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if name and not meta.get("name", "").startswith(name):
+            continue
+        prof_path = meta_path[:-len(".json")] + ".prof"
+        if os.path.exists(prof_path):
+            dumps.append((meta, prof_path))
+    return dumps
+
+
+def aggregate_allocations(metas):
+    """Sum allocation diffs per site across dumps, largest first."""
+    totals = {}
+    for meta in metas:
+        for site in meta.get("allocations", []):
+            entry = totals.setdefault(site["where"], {"where": site["where"], "size_diff": 0, "count_diff": 0, "requests": 0})
+            entry["size_diff"] += site["size_diff"]
+            entry["count_diff"] += site["count_diff"]
+            entry["requests"] += 1
+    return sorted(totals.values(), key=lambda e: e["size_diff"], reverse=True)
+
+
+def report(directory=DEFAULT_DIR, name=None, top=20, sort="cumulative"):
+    """Print per-name wall times, the top functions across dumps and the top allocation sites."""
+    dumps = load_dumps(directory, name)
+    if not dumps:
+        print(f"No profile dumps in {directory}")
+        return 1
+    by_name = {}
+    for meta, _ in dumps:
+        by_name.setdefault(meta["name"], []).append(meta["elapsed_s"])
+    print(f"{len(dumps)} sampled call(s) in {directory}")
+    print(f"{'name':<36}{'calls':>8}{'mean ms':>12}{'max ms':>12}")
+    for label, times in sorted(by_name.items()):
+        print(f"{label:<36}{len(times):>8}{sum(times) / len(times) * 1000:>12.1f}{max(times) * 1000:>12.1f}")
+
+    print(f"\nTop {top} functions by {sort} time:")
+    stats = pstats.Stats(*(path for _, path in dumps))
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+    allocations = aggregate_allocations(meta for meta, _ in dumps)
+    if allocations:
+        print(f"Top {top} allocation sites:")
+        print(f"{'KiB':>12}{'blocks':>10}{'calls':>8}  where")
+        for site in allocations[:top]:
+            print(f"{site['size_diff'] / 1024:>12.1f}{site['count_diff']:>10}{site['requests']:>8}  {site['where']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate sampled request profiles.")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="Profile directory (default: profiles)")
+    parser.add_argument("--name", default=None, help="Only dumps whose name starts with this (e.g. handle, storage)")
+    parser.add_argument("--top", type=int, default=20, help="Rows to show per table")
+    parser.add_argument("--sort", default="cumulative", choices=["cumulative", "tottime", "ncalls"])
+    args = parser.parse_args()
+    return report(args.dir, args.name, args.top, args.sort)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,268 @@
+"""
+Offline Retrieval Evaluation for Grovio
+
+Scores the context retrieval used by `main.handle` against a labeled set of
+queries and their relevant chunks, sweeping `semantic_weight` and
+`top_k_context` across three retrievers:
+
+- exact: hybrid semantic + BM25 scoring over every chunk (what the bot runs)
+- approx: the same hybrid scoring restricted to an IVF (k-means) probe
+- lexical: BM25 only
+
+For every configuration it reports recall@k, MRR, retrieval latency and the
+prompt token cost of the retrieved context, and recommends the cheapest
+configuration that keeps recall above a target.
+
+Labels are JSONL records of the form
+    {"query": "How do I get support?", "relevant": ["### Q9. How do I get support?"]}
+where each "relevant" string identifies a chunk by a substring of its text.
+
+Usage:
+    python retrieval_eval.py --seed-faqs
+    python retrieval_eval.py --backend stub --weights 0.3 0.5 0.7 1.0 --k 1 2 4 6 --min-recall 0.9
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+LABELS_PATH = "eval/retrieval_labels.jsonl"
+FAQS_PATH = "context/faqs.md"
+DEFAULT_WEIGHTS = [0.0, 0.3, 0.5, 0.7, 0.9, 1.0]
+DEFAULT_KS = [1, 2, 3, 4, 6, 8]
+DEFAULT_MMR = [1.0, 0.7]   # 1.0 = no diversification
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Count prompt tokens with tiktoken when available, else estimate ~4 characters per token."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+
+def seed_from_faqs(path=FAQS_PATH):
+    """
+    Build labels from the FAQ file: each question is a query whose relevant chunk is its own entry.
+
+    Args:
+        path (str): Path to the FAQ markdown file
+
+    Returns:
+        list: Label records
+    """
+    labels = []
+    for line in Path(path).read_text().splitlines():
+        match = re.match(r"^###\s+(Q\d+\.)\s+(.*\S)\s*$", line)
+        if match:
+            labels.append({"query": match.group(2), "relevant": [line.strip()]})
+    return labels
+
+
+def load_labels(path=LABELS_PATH):
+    """Load labeled queries from a JSONL file."""
+    labels = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                labels.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return labels
+
+
+def resolve_relevant(label, chunks):
+    """Map a label's relevant substrings to chunk indices."""
+    return {i for i, chunk in enumerate(chunks) for rel in label.get("relevant", []) if rel in chunk}
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: chunks are bucketed by k-means centroid and
+    a query only scores the chunks in its `nprobe` nearest buckets.
+    """
+
+    def __init__(self, matrix, nlist=None, seed=0):
+        from utils import kmeans
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        normalized = matrix / np.where(norms == 0, 1.0, norms)
+        nlist = nlist or max(1, int(np.sqrt(len(matrix))))
+        self.centroids, labels = kmeans(normalized, nlist, seed=seed)
+        self.lists = [np.flatnonzero(labels == c) for c in range(len(self.centroids))]
+
+    def probe(self, q_emb, nprobe):
+        nearest = np.argsort(self.centroids @ q_emb)[::-1][:nprobe]
+        return np.concatenate([self.lists[c] for c in nearest])
+
+
+def evaluate(main, labels, q_embs, weights, ks, nprobe, nlist=None, mmr_lambdas=(1.0,), max_similarity=None):
+    """
+    Sweep retrievers, semantic weights, MMR lambdas and k over the labeled queries.
+
+    The config's diversification settings are never applied implicitly: every
+    hybrid run passes its own `mmr_lambda` (1.0 = plain top-k), and the lexical
+    run is plain BM25.
+
+    Args:
+        main (module): The imported `main` module (provides chunks and `retrieve`)
+        labels (list): Label records with resolved "relevant_idx" sets
+        q_embs (np.array): Query embeddings, one row per label
+        weights (list): Semantic weights to try for the hybrid retrievers
+        ks (list): top_k values to try
+        nprobe (int): Buckets probed by the approximate retriever
+        nlist (int): Buckets in the approximate index (default sqrt(#chunks))
+        mmr_lambdas (list): MMR lambdas to try for the hybrid retrievers
+        max_similarity (float): Near-duplicate threshold for runs with mmr_lambda < 1.0 (None = off)
+
+    Returns:
+        list: One result dict per configuration
+    """
+    ivf = IVFIndex(main.embed_matrix, nlist=nlist)
+    chunk_tokens = [count_tokens(c) for c in main.chunks]
+    max_k = max(ks)
+
+    sweeps = [(r, w, lam) for r in ("exact", "approx") for lam in mmr_lambdas for w in weights] + [("lexical", 0.0, 1.0)]
+    results = []
+    for retriever, weight, lam in sweeps:
+        rankings, latencies = [], []
+        diversity = {"mmr_lambda": lam, "max_similarity": max_similarity if lam < 1.0 else None}
+        for label, q_emb in zip(labels, q_embs):
+            start = time.perf_counter()
+            if retriever == "lexical":
+                top, *_ = main.retrieve(label["query"], None, semantic_weight=0.0, top_k=max_k, **diversity)
+            elif retriever == "approx":
+                candidates = ivf.probe(q_emb, nprobe)
+                top, *_ = main.retrieve(label["query"], q_emb, semantic_weight=weight, top_k=max_k,
+                                        candidates=candidates, **diversity)
+            else:
+                top, *_ = main.retrieve(label["query"], q_emb, semantic_weight=weight, top_k=max_k, **diversity)
+            latencies.append(time.perf_counter() - start)
+            rankings.append(list(top))
+
+        for k in ks:
+            recalls, rrs, tokens = [], [], []
+            for label, ranking in zip(labels, rankings):
+                relevant = label["relevant_idx"]
+                top_k = ranking[:k]
+                recalls.append(len(relevant.intersection(top_k)) / len(relevant))
+                rank = next((r for r, i in enumerate(top_k, 1) if i in relevant), None)
+                rrs.append(1.0 / rank if rank else 0.0)
+                tokens.append(sum(chunk_tokens[i] for i in top_k))
+            results.append({
+                "retriever": retriever,
+                "semantic_weight": weight if retriever != "lexical" else None,
+                "mmr_lambda": lam,
+                "top_k": k,
+                "recall": float(np.mean(recalls)),
+                "mrr": float(np.mean(rrs)),
+                "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+                "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+                "prompt_tokens": float(np.mean(tokens)),
+            })
+    return results
+
+
+def recommend(results, min_recall):
+    """Pick the configuration with the fewest prompt tokens (then lowest latency) meeting `min_recall`."""
+    eligible = [r for r in results if r["recall"] >= min_recall]
+    if not eligible:
+        return None
+    return min(eligible, key=lambda r: (r["prompt_tokens"], r["latency_p50_ms"], -r["mrr"]))
+
+
+def print_results(results):
+    print(f"{'retriever':<10}{'weight':>8}{'mmr':>6}{'k':>4}{'recall':>9}{'MRR':>8}{'p50 ms':>9}{'p95 ms':>9}{'tokens':>9}")
+    for r in results:
+        weight = "-" if r["semantic_weight"] is None else f"{r['semantic_weight']:.2f}"
+        print(f"{r['retriever']:<10}{weight:>8}{r['mmr_lambda']:>6.2f}{r['top_k']:>4}{r['recall']:>9.3f}{r['mrr']:>8.3f}"
+              f"{r['latency_p50_ms']:>9.3f}{r['latency_p95_ms']:>9.3f}{r['prompt_tokens']:>9.1f}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Evaluate context retrieval configurations.")
+    parser.add_argument("--labels", default=LABELS_PATH, help=f"Labeled queries JSONL (default: {LABELS_PATH})")
+    parser.add_argument("--seed-faqs", action="store_true", help=f"Write labels seeded from {FAQS_PATH} and exit")
+    parser.add_argument("--weights", type=float, nargs="+", default=DEFAULT_WEIGHTS)
+    parser.add_argument("--k", type=int, nargs="+", default=DEFAULT_KS)
+    parser.add_argument("--mmr", type=float, nargs="+", default=DEFAULT_MMR, help="MMR lambdas to sweep (1.0 = off)")
+    parser.add_argument("--mmr-max-similarity", type=float, default=None,
+                        help="Near-duplicate threshold for MMR runs (default: off)")
+    parser.add_argument("--nprobe", type=int, default=2, help="Buckets probed by the approximate retriever")
+    parser.add_argument("--nlist", type=int, default=None, help="Buckets in the approximate index")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Recall target for the recommendation")
+    parser.add_argument("--backend", choices=["stub", "openai"], default=None, help="LLM backend for embeddings")
+    parser.add_argument("--output", default=None, help="Write all results to this JSON file")
+    args = parser.parse_args()
+
+    if args.seed_faqs:
+        labels = seed_from_faqs()
+        Path(args.labels).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.labels, "w") as f:
+            for label in labels:
+                f.write(json.dumps(label) + "\n")
+        print(f"Wrote {len(labels)} labeled queries to {args.labels}")
+        return 0
+
+    if args.backend:
+        os.environ["GROVIO_LLM_BACKEND"] = args.backend
+    if args.backend == "stub":
+        # Stub vectors must not replace the bot's shared context index
+        index_dir = tempfile.mkdtemp(prefix="grovio-eval-index-")
+        atexit.register(shutil.rmtree, index_dir, ignore_errors=True)
+        atexit.register(lambda: Path(index_dir + ".lock").unlink(missing_ok=True))
+        os.environ["GROVIO_EMBEDDING_INDEX_PATH"] = index_dir
+    import main
+    from utils import embed_batch
+
+    labels = []
+    for label in load_labels(args.labels):
+        label["relevant_idx"] = resolve_relevant(label, main.chunks)
+        if label["relevant_idx"]:
+            labels.append(label)
+        else:
+            print(f"Skipping query with no matching chunk: {label.get('query')!r}")
+    if not labels:
+        print("No usable labeled queries; run with --seed-faqs first.")
+        return 1
+
+    q_embs = embed_batch([label["query"] for label in labels], main.client)
+    results = evaluate(main, labels, q_embs, args.weights, sorted(set(args.k)), args.nprobe, args.nlist,
+                       args.mmr, args.mmr_max_similarity)
+    print(f"Evaluated {len(labels)} queries over {len(main.chunks)} chunks")
+    print_results(results)
+
+    best = recommend(results, args.min_recall)
+    if best:
+        weight = "n/a (BM25 only)" if best["semantic_weight"] is None else best["semantic_weight"]
+        print(f"\nCheapest configuration with recall >= {args.min_recall}: retriever={best['retriever']}, "
+              f"semantic_weight={weight}, mmr_lambda={best['mmr_lambda']}, top_k_context={best['top_k']} "
+              f"(recall={best['recall']:.3f}, MRR={best['mrr']:.3f}, ~{best['prompt_tokens']:.0f} tokens)")
+    else:
+        print(f"\nNo configuration reached recall >= {args.min_recall}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,222 @@
+"""
+Storage helpers for Grovio's JSONL logs
+
+Utilities shared by the bot, the admin dashboard and the policy generator for
+reading and maintaining the append-only JSONL files (store.jsonl,
+discord_messages.jsonl, ...).
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no cross-process locking
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive advisory lock on `<path>.lock` for the duration of the block.
+
+    Writers that append to or rewrite the same log from different processes
+    (bot and dashboard) take this lock so a rewrite cannot drop a concurrent append.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_text(path, text):
+    """Write `text` to a temp file next to `path` and atomically replace it."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def append_jsonl(path, records):
+    """Append records to a JSONL file in a single locked write."""
+    if not records:
+        return
+    data = "".join(json.dumps(record) + "\n" for record in records)
+    with file_lock(path), open(path, "a") as f:
+        f.write(data)
+
+
+def update_jsonl(path, key, updates):
+    """
+    Apply field updates to many records of a JSONL file in one atomic rewrite.
+
+    Args:
+        path (str): JSONL file to update
+        key (str): Field identifying a record, e.g. "message_id"
+        updates (dict): Maps key value -> dict of fields to set on every matching record
+
+    Returns:
+        set: Key values that matched at least one record
+    """
+    matched = set()
+    if not updates or not os.path.exists(path):
+        return matched
+    with file_lock(path):
+        lines = []
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    lines.append(line if line.endswith("\n") else line + "\n")
+                    continue
+                fields = updates.get(record.get(key))
+                if fields is not None:
+                    record.update(fields)
+                    matched.add(record.get(key))
+                    line = json.dumps(record) + "\n"
+                lines.append(line if line.endswith("\n") else line + "\n")
+        if matched:
+            atomic_write_text(path, "".join(lines))
+    return matched
+
+
+def iter_jsonl_reverse(path, block_size=65536):
+    """
+    Yield parsed records from a JSONL file, last line first.
+
+    The file is read backwards in fixed-size blocks, so producing the newest N
+    records costs time and memory proportional to N rather than to file size.
+
+    Args:
+        path (str): JSONL file to read
+        block_size (int): Bytes read per seek
+
+    Yields:
+        dict: Parsed records, newest (last appended) first
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        remainder = b""
+        while pos > 0:
+            read_size = min(block_size, pos)
+            pos -= read_size
+            f.seek(pos)
+            buffer = f.read(read_size) + remainder
+            lines = buffer.split(b"\n")
+            # The first piece may be the tail of a line that starts in an earlier block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+        remainder = remainder.strip()
+        if remainder:
+            try:
+                yield json.loads(remainder)
+            except json.JSONDecodeError:
+                pass
+
+
+class IncrementalJsonlReader:
+    """
+    Tail-follows a JSONL file, parsing only lines appended since the last call.
+
+    The reader remembers the file identity (device + inode), the byte offset it
+    has consumed and short signatures of the first and last bytes it read. If
+    the file is replaced, truncated or rewritten in place, the next call starts
+    over from the beginning and reports a reset so callers can rebuild state.
+    """
+
+    SIGNATURE_BYTES = 256
+
+    def __init__(self, path):
+        self.path = path
+        self._identity = None
+        self._offset = 0
+        self._head = b""
+        self._tail = b""
+
+    def _signatures(self, f, end):
+        f.seek(0)
+        head = f.read(min(self.SIGNATURE_BYTES, end))
+        start = max(0, end - self.SIGNATURE_BYTES)
+        f.seek(start)
+        tail = f.read(end - start)
+        return head, tail
+
+    def _is_same_file(self, f, st):
+        if self._identity != (st.st_dev, st.st_ino) or st.st_size < self._offset:
+            return False
+        if self._offset == 0:
+            return True
+        return self._signatures(f, self._offset) == (self._head, self._tail)
+
+    def read_new(self):
+        """
+        Parse lines appended since the previous call.
+
+        Returns:
+            tuple: (list of (byte offset, record) pairs, reset flag). When the
+            reset flag is True the list covers the whole file and any state
+            built from earlier calls should be discarded.
+        """
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            reset = self._identity is not None
+            self._identity, self._offset, self._head, self._tail = None, 0, b"", b""
+            return [], reset
+
+        with f:
+            st = os.fstat(f.fileno())
+            reset = False
+            if not self._is_same_file(f, st):
+                reset = self._identity is not None
+                self._identity = (st.st_dev, st.st_ino)
+                self._offset = 0
+
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+            # Leave a partially written last line for the next call
+            complete = data.rfind(b"\n") + 1
+            records = []
+            pos = self._offset
+            for raw in data[:complete].splitlines(keepends=True):
+                line = raw.strip()
+                if line:
+                    try:
+                        records.append((pos, json.loads(line)))
+                    except json.JSONDecodeError as e:
+                        print(f"Error parsing line at offset {pos} of {self.path}: {e}")
+                pos += len(raw)
+
+            self._offset += complete
+            if complete:
+                self._head, self._tail = self._signatures(f, self._offset)
+            return records, reset
@@ -0,0 +1,218 @@
+"""
+Stand-in LLM backend for Grovio
+
+Mimics the subset of the OpenAI client used by the bot (embeddings, chat
+completions and moderations) without any network access. Responses are
+deterministic for a given input and an optional artificial latency can be
+configured, which makes this backend suitable for benchmarks and load tests
+of the reply pipeline. `AsyncStubClient` is the counterpart of the async
+OpenAI client.
+"""
+
+import asyncio
+import hashlib
+import random
+import re
+import time
+from types import SimpleNamespace
+
+EMBEDDING_DIM = 256
+CONFIDENCE_REPLY = "0.9"
+DEFAULT_REPLY = "Thanks for reaching out! Our team is happy to help with anything Grovio related."
+# Inputs containing any of these are flagged by the stub moderation endpoint
+FLAGGED_TERMS = ("idiot", "kill you", "free nitro", "scam")
+
+
+def _tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def _hashed_embedding(text):
+    """Hash a bag of words into a fixed-size, L2-normalized vector."""
+    vec = [0.0] * EMBEDDING_DIM
+    for token in _tokens(text):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+
+def _reply_for(messages):
+    """Prompt text and canned completion for a list of chat messages."""
+    prompt = "\n".join(m.get("content", "") for m in messages or [])
+    if "ONLY a number" in prompt:
+        return prompt, CONFIDENCE_REPLY
+    if "JSON" in prompt:
+        return prompt, '{"suggestions": []}'
+    return prompt, DEFAULT_REPLY
+
+
+def _usage(prompt_text, completion_text=""):
+    prompt_tokens = len(_tokens(prompt_text))
+    completion_tokens = len(_tokens(completion_text))
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+class StubClient:
+    """
+    Drop-in replacement for `openai.OpenAI` used by `main.handle`.
+
+    Args:
+        latency (float): Mean seconds to sleep per chat completion
+        embed_latency (float): Mean seconds to sleep per embedding call
+        moderation_latency (float): Mean seconds to sleep per moderation call
+        jitter (float): Relative jitter applied to every latency (0.25 = ±25%)
+    """
+
+    def __init__(self, latency=0.0, embed_latency=0.0, moderation_latency=0.0, jitter=0.25):
+        self.latency = latency
+        self.embed_latency = embed_latency
+        self.moderation_latency = moderation_latency
+        self.jitter = jitter
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.moderations = SimpleNamespace(create=self._create_moderation)
+
+    def _jittered(self, seconds):
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter) if seconds > 0 else 0.0
+
+    def _sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(self._jittered(seconds))
+
+    def _create_embedding(self, input, model=None, **kwargs):
+        self._sleep(self.embed_latency)
+        return self._embedding_response(input, model)
+
+    def _create_completion(self, model=None, messages=None, stream=False, **kwargs):
+        if stream:
+            return _Stream(self, model, messages, kwargs.get("stream_options") or {})
+        self._sleep(self.latency)
+        return self._completion_response(model, messages)
+
+    def _create_moderation(self, input, **kwargs):
+        self._sleep(self.moderation_latency)
+        return self._moderation_response(input)
+
+    @staticmethod
+    def _embedding_response(input, model):
+        texts = [input] if isinstance(input, str) else list(input)
+        data = [SimpleNamespace(embedding=_hashed_embedding(t), index=i) for i, t in enumerate(texts)]
+        return SimpleNamespace(data=data, model=model, usage=_usage(" ".join(texts)))
+
+    @staticmethod
+    def _completion_response(model, messages):
+        prompt, content = _reply_for(messages)
+        message = SimpleNamespace(role="assistant", content=content)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=_usage(prompt, content),
+        )
+
+    @staticmethod
+    def _moderation_response(input):
+        # Small, input-dependent score so risk values are not all identical
+        digest = hashlib.md5(str(input).encode("utf-8")).digest()
+        score = digest[0] / 255 * 0.001
+        flagged = any(term in str(input).lower() for term in FLAGGED_TERMS)
+        if flagged:
+            score = 0.9
+        category_scores = SimpleNamespace(harassment=score, hate=score / 2, violence=score / 4)
+        categories = SimpleNamespace(harassment=flagged, hate=False, violence=False)
+        result = SimpleNamespace(flagged=flagged, categories=categories, category_scores=category_scores)
+        return SimpleNamespace(results=[result])
+
+
+class _Stream:
+    """
+    Streamed completion: one chunk per word, with the completion latency
+    spread across the chunks so a consumer that stops early saves time.
+    """
+
+    def __init__(self, client, model, messages, stream_options):
+        self.client = client
+        self.model = model
+        self.prompt, self.content = _reply_for(messages)
+        self.include_usage = stream_options.get("include_usage", False)
+        self.closed = False
+
+    def _chunk(self, content=None, finish_reason=None, usage=None):
+        choices = [] if usage else [SimpleNamespace(index=0, delta=SimpleNamespace(content=content),
+                                                    finish_reason=finish_reason)]
+        return SimpleNamespace(model=self.model, choices=choices, usage=usage)
+
+    def _pieces(self):
+        return re.findall(r"\S+\s*", self.content)
+
+    def _tail(self):
+        yield self._chunk(finish_reason="stop")
+        if self.include_usage:
+            yield self._chunk(usage=_usage(self.prompt, self.content))
+
+    def __iter__(self):
+        pieces = self._pieces()
+        for piece in pieces:
+            if self.closed:
+                return
+            self.client._sleep(self.client.latency / max(1, len(pieces)))
+            yield self._chunk(piece)
+        yield from self._tail()
+
+    def close(self):
+        self.closed = True
+
+
+class _AsyncStream(_Stream):
+    """Async iterator counterpart of `_Stream` for `AsyncStubClient`."""
+
+    async def __aiter__(self):
+        pieces = self._pieces()
+        for piece in pieces:
+            if self.closed:
+                return
+            await asyncio.sleep(self.client._jittered(self.client.latency / max(1, len(pieces))))
+            yield self._chunk(piece)
+        for chunk in self._tail():
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class AsyncStubClient(StubClient):
+    """
+    Drop-in replacement for `openai.AsyncOpenAI` used by `main.handle_async`.
+
+    Same responses as `StubClient`; latency is simulated with `asyncio.sleep`
+    so concurrent calls overlap on one event loop.
+    """
+
+    def __init__(self, latency=0.0, embed_latency=0.0, moderation_latency=0.0, jitter=0.25):
+        super().__init__(latency, embed_latency, moderation_latency, jitter)
+        self.embeddings = SimpleNamespace(create=self._acreate_embedding)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._acreate_completion))
+        self.moderations = SimpleNamespace(create=self._acreate_moderation)
+
+    async def _asleep(self, seconds):
+        if seconds > 0:
+            await asyncio.sleep(self._jittered(seconds))
+
+    async def _acreate_embedding(self, input, model=None, **kwargs):
+        await self._asleep(self.embed_latency)
+        return self._embedding_response(input, model)
+
+    async def _acreate_completion(self, model=None, messages=None, stream=False, **kwargs):
+        if stream:
+            return _AsyncStream(self, model, messages, kwargs.get("stream_options") or {})
+        await self._asleep(self.latency)
+        return self._completion_response(model, messages)
+
+    async def _acreate_moderation(self, input, **kwargs):
+        await self._asleep(self.moderation_latency)
+        return self._moderation_response(input)
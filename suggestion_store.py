@@ -0,0 +1,208 @@
+"""
+Suggestion Store for Grovio
+
+Append-only storage for policy suggestion sets with a small pending index.
+
+Every suggestion set is appended to suggested_policies.jsonl with a stable
+`id`. Status changes are appended as small event lines instead of rewriting
+the file, and a sidecar index maps each *pending* id to the byte offset of its
+record. Listing pending suggestions therefore reads only the pending records,
+and approving or rejecting one is an append plus a rewrite of the (small)
+index, however much approved/rejected history has accumulated.
+
+Records written before ids existed get a deterministic id derived from their
+timestamp, so older files keep working.
+"""
+
+import json
+import os
+import time
+import uuid
+
+from storage import atomic_write_text, file_lock
+
+INDEX_SUFFIX = ".index.json"
+
+
+def legacy_id(record):
+    """Deterministic id for records written before ids were introduced."""
+    return f"ts-{record.get('ts', 0):.6f}"
+
+
+class SuggestionStore:
+    """
+    Suggestion sets keyed by id, with a persisted index of pending records.
+
+    Args:
+        path (str): JSONL log of suggestion records and status events
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = f"{path}{INDEX_SUFFIX}"
+
+    # ---------- index ----------------------------------------------------
+
+    def _empty_index(self):
+        return {"identity": None, "size": 0, "pending": {}}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self._empty_index()
+
+    def _apply_line(self, index, offset, record):
+        if record.get("event") == "status":
+            index["pending"].pop(record.get("id"), None)
+            return
+        record_id = record.get("id") or legacy_id(record)
+        if record.get("status", "pending") == "pending":
+            index["pending"][record_id] = offset
+        else:
+            index["pending"].pop(record_id, None)
+
+    def _refresh_index(self):
+        """Bring the index up to date with the log, scanning only bytes it has not seen. Caller holds the lock."""
+        index = self._load_index()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return self._empty_index()
+        identity = [st.st_dev, st.st_ino]
+        if index.get("identity") != identity or st.st_size < index.get("size", 0):
+            index = self._empty_index()
+            index["identity"] = identity
+        if st.st_size == index["size"]:
+            return index
+
+        with open(self.path, "rb") as f:
+            f.seek(index["size"])
+            data = f.read(st.st_size - index["size"])
+        complete = data.rfind(b"\n") + 1
+        pos = index["size"]
+        for raw in data[:complete].splitlines(keepends=True):
+            line = raw.strip()
+            if line:
+                try:
+                    self._apply_line(index, pos, json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+            pos += len(raw)
+        index["size"] += complete
+        atomic_write_text(self.index_path, json.dumps(index))
+        return index
+
+    def _append(self, record):
+        """Append one line and fold it into the index. Caller holds the lock."""
+        index = self._refresh_index()
+        line = json.dumps(record) + "\n"
+        with open(self.path, "a") as f:
+            offset = f.tell()
+            f.write(line)
+        st = os.stat(self.path)
+        index["identity"] = [st.st_dev, st.st_ino]
+        self._apply_line(index, offset, record)
+        index["size"] = offset + len(line.encode("utf-8"))
+        atomic_write_text(self.index_path, json.dumps(index))
+
+    def _read_at(self, offset):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.readline())
+        record.setdefault("id", legacy_id(record))
+        return record
+
+    # ---------- public API -----------------------------------------------
+
+    def add(self, suggestions, usage=None):
+        """
+        Append a new pending suggestion set.
+
+        Args:
+            suggestions (list): Suggestion dicts
+            usage (dict): LLM calls and tokens spent generating them, if tracked
+
+        Returns:
+            dict: The stored record
+        """
+        record = {
+            "id": uuid.uuid4().hex,
+            "ts": time.time(),
+            "suggestions": suggestions,
+            "status": "pending"  # pending, approved, rejected
+        }
+        if usage:
+            record["usage"] = usage
+        with file_lock(self.path):
+            self._append(record)
+        return record
+
+    def pending(self):
+        """Return pending suggestion sets in the order they were added, reading only pending records."""
+        if not os.path.exists(self.path):
+            return []
+        with file_lock(self.path):
+            index = self._refresh_index()
+            return [self._read_at(offset) for offset in sorted(index["pending"].values())]
+
+    def find_pending_by_ts(self, ts, tolerance=0.001):
+        """Return the id of the pending set with timestamp `ts` (for callers that still key on ts)."""
+        for record in self.pending():
+            if abs(record.get("ts", 0) - ts) < tolerance:
+                return record["id"]
+        return None
+
+    def set_status(self, suggestion_id, status, approved_suggestions=None):
+        """
+        Record a status transition for a pending suggestion set.
+
+        Args:
+            suggestion_id (str): Id of the suggestion set
+            status (str): New status ('approved' or 'rejected')
+            approved_suggestions (list): Approved subset if status is 'approved'
+
+        Returns:
+            bool: True if the set was pending and is now updated
+        """
+        if not os.path.exists(self.path):
+            return False
+        with file_lock(self.path):
+            index = self._refresh_index()
+            if suggestion_id not in index["pending"]:
+                return False
+            event = {"event": "status", "id": suggestion_id, "status": status, "ts": time.time()}
+            if status == "approved" and approved_suggestions:
+                event["approved_suggestions"] = approved_suggestions
+            self._append(event)
+        return True
+
+    def iter_records(self):
+        """
+        Yield every suggestion set with its latest status applied (full scan; for history views).
+
+        Yields:
+            dict: Suggestion records
+        """
+        if not os.path.exists(self.path):
+            return
+        records, order = {}, []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("event") == "status":
+                    target = records.get(record.get("id"))
+                    if target is not None:
+                        target["status"] = record.get("status")
+                        if "approved_suggestions" in record:
+                            target["approved_suggestions"] = record["approved_suggestions"]
+                    continue
+                record.setdefault("id", legacy_id(record))
+                records[record["id"]] = record
+                order.append(record["id"])
+        for record_id in order:
+            yield records[record_id]
@@ -1,7 +1,57 @@
 """
 Helper utilities for embedding and similarity comparison.
 """
+import os
 import numpy as np
+import metrics
+
+def llm_backend(cfg):
+    """The configured LLM backend: GROVIO_LLM_BACKEND, else `llm_backend` (default "openai")."""
+    return os.environ.get("GROVIO_LLM_BACKEND") or cfg.get("llm_backend", "openai")
+
+def make_client(cfg):
+    """
+    Create the LLM client used by the pipeline.
+    
+    The backend is taken from the GROVIO_LLM_BACKEND environment variable or
+    the `llm_backend` config key. "stub" selects the offline stand-in backend
+    from stub_llm.py; anything else uses the OpenAI client.
+    
+    Args:
+        cfg (dict): Loaded configuration
+        
+    Returns:
+        OpenAI | StubClient: Client instance
+    """
+    if llm_backend(cfg) == "stub":
+        from stub_llm import StubClient
+        return StubClient()
+    from openai import OpenAI
+    return OpenAI(api_key=cfg.get("openai_api_key"))
+
+def make_async_client(cfg):
+    """
+    Create the async LLM client used by `main.handle_async`.
+    
+    The OpenAI client gets one HTTP client whose connection pool
+    (`async_max_connections`, default 20) is shared by every request.
+    
+    Args:
+        cfg (dict): Loaded configuration
+        
+    Returns:
+        AsyncOpenAI | AsyncStubClient: Client instance
+    """
+    if llm_backend(cfg) == "stub":
+        from stub_llm import AsyncStubClient
+        return AsyncStubClient()
+    import httpx
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+    max_connections = cfg.get("async_max_connections", 20)
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    return AsyncOpenAI(api_key=cfg.get("openai_api_key"), http_client=http_client)
 
 def embed(text, client):
     """
@@ -18,6 +68,25 @@ def embed(text, client):
         input=text,
         model="text-embedding-3-small"  # You can change this to another embedding model if needed
     )
+    metrics.record_llm_call("embedding", response, "text-embedding-3-small")
+    return np.array(response.data[0].embedding)
+
+async def embed_async(text, client):
+    """
+    Async counterpart of `embed` for an async client.
+    
+    Args:
+        text (str): The text to embed
+        client (AsyncOpenAI): Async client instance
+        
+    Returns:
+        np.array: The embedding vector
+    """
+    response = await client.embeddings.create(
+        input=text,
+        model="text-embedding-3-small"
+    )
+    metrics.record_llm_call("embedding", response, "text-embedding-3-small")
     return np.array(response.data[0].embedding)
 
 def cosine_sim(a, b):
@@ -32,3 +101,110 @@ def cosine_sim(a, b):
         float: Cosine similarity score between 0 and 1
     """
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+
+def embed_batch(texts, client, batch_size=100):
+    """
+    Generate embeddings for many texts with one API call per batch.
+    
+    Args:
+        texts (list): Texts to embed
+        client (OpenAI): OpenAI client instance
+        batch_size (int): Maximum number of texts per request
+        
+    Returns:
+        np.array: Matrix of shape (len(texts), dim)
+    """
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        response = client.embeddings.create(
+            input=batch,
+            model="text-embedding-3-small"
+        )
+        metrics.record_llm_call("embedding", response, "text-embedding-3-small")
+        ordered = sorted(response.data, key=lambda d: d.index)
+        vectors.extend(d.embedding for d in ordered)
+    return np.array(vectors)
+
+def kmeans(X, k, iters=25, seed=0):
+    """
+    Cluster rows of X with k-means (k-means++ seeding, cosine-friendly if rows are normalized).
+    
+    Args:
+        X (np.array): Data matrix of shape (n, dim)
+        k (int): Number of clusters (clipped to n)
+        iters (int): Maximum Lloyd iterations
+        seed (int): Random seed
+        
+    Returns:
+        tuple: (centroids of shape (k, dim), labels of shape (n,))
+    """
+    X = np.asarray(X, dtype=float)
+    n = len(X)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    
+    # k-means++ seeding, keeping each point's distance to its nearest chosen centroid
+    centroids = [X[rng.integers(n)]]
+    d2 = ((X - centroids[0]) ** 2).sum(1)
+    for _ in range(1, k):
+        total = d2.sum()
+        probs = d2 / total if total > 0 else np.full(n, 1.0 / n)
+        centroids.append(X[rng.choice(n, p=probs)])
+        d2 = np.minimum(d2, ((X - centroids[-1]) ** 2).sum(1))
+    centroids = np.array(centroids)
+    
+    labels = np.zeros(n, dtype=int)
+    for i in range(iters):
+        # Squared distances via ||x||^2 - 2x.c + ||c||^2 to avoid an (n, k, dim) temporary
+        dists = (X ** 2).sum(1)[:, None] - 2 * X @ centroids.T + (centroids ** 2).sum(1)[None, :]
+        new_labels = dists.argmin(axis=1)
+        if i > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = X[labels == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids, labels
+
+def mmr(vectors, relevance, k, lam=0.7, max_similarity=None):
+    """
+    Pick k diverse, relevant rows with maximal marginal relevance.
+    
+    Each step picks the candidate maximizing
+    lam * relevance - (1 - lam) * (max cosine similarity to the rows already picked).
+    The candidate-to-candidate similarities are computed once as a matrix and
+    the running maximum is updated with one vector operation per pick.
+    
+    Args:
+        vectors (np.array): Candidate embeddings of shape (n, dim)
+        relevance (np.array): Relevance score per candidate, shape (n,)
+        k (int): Number of rows to pick
+        lam (float): Trade-off between relevance (1.0) and diversity (0.0)
+        max_similarity (float): Drop candidates more similar than this to a picked row
+        
+    Returns:
+        list: Picked row positions, in pick order (may be fewer than k)
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    relevance = np.asarray(relevance, dtype=float)
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    sims = unit @ unit.T
+    redundancy = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    picked = []
+    for _ in range(min(k, n)):
+        scores = np.where(available, lam * relevance - (1 - lam) * redundancy, -np.inf)
+        best = int(scores.argmax())
+        if not np.isfinite(scores[best]):
+            break
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, sims[best])
+        if max_similarity is not None:
+            available &= redundancy <= max_similarity
+    return picked